@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+
+################################  N8UR ASHCOMM  ################################
+#
+#	Copyright 2019 by John Ackermann, N8UR jra@febo.com https://febo.com
+#	Version number can be found in the ashglobal.py file
+#
+#	This program is free software; you can redistribute it and/or modify
+#	it under the terms of the GNU General Public License as published by
+#	the Free Software Foundation; either version 2 of the License, or
+#	(at your option) any later version.
+#
+#	This program is distributed in the hope that it will be useful,
+#	but WITHOUT ANY WARRANTY; without even the implied warranty of
+#	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#	GNU General Public License for more details.
+#	Software to communicate with Ashtech GPS receivers via serial port.
+################################################################################
+
+#############################   ashalmanac.py    ###############################
+
+import math
+
+# NumPy is optional; without it the predictor works one satellite and one
+# time at a time, which is fine for "what's up now" but slow for long grids
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+###############################################################################
+# Almanac and visibility prediction.  SAL messages (decoded by SalHandler in
+# ashhandler.py) fill an Almanac: one column per orbital element, indexed by
+# PRN, like an Epoch.  Predict() works out the elevation of every PRN we
+# have an almanac for from a site over a grid of times, all at once with
+# NumPy, using the ICD-GPS-200 orbit equations.
+###############################################################################
+
+MU = 3.986005e14			# WGS-84 earth gravitational constant
+OMEGA_E = 7.2921151467e-5		# WGS-84 earth rotation rate, rad/s
+SECONDS_PER_WEEK = 604800
+MAX_PRN = 32
+
+ALMANAC_COLUMNS = ('e', 'toa', 'i0', 'omegadot', 'roota', 'omega0', 'omega',
+                   'm0', 'af0', 'af1', 'wna', 'health')
+
+# the almanac sends inclination as an offset from 0.3 semicircles; if what
+# we're given is bigger than any offset could be, it's already absolute
+INCLINATION_REF = 0.3
+
+###############################################################################
+###############################################################################
+# Almanac -- almanac elements for all PRNs
+###############################################################################
+###############################################################################
+
+
+class Almanac:
+
+###############################################################################
+###############################################################################
+    def __init__(self):
+        for name in ALMANAC_COLUMNS:
+            if numpy is not None:
+                column = numpy.zeros(MAX_PRN + 1)
+            else:
+                column = [0.0] * (MAX_PRN + 1)
+            setattr(self, name, column)
+        self.present = 0			# bitmask of PRNs we have
+
+    def __len__(self):
+        return bin(self.present).count('1')
+
+###############################################################################
+# Add -- store one almanac record (a dict from SalHandler)
+###############################################################################
+    def Add(self, salm):
+        prn = salm['prn']
+        if not 1 <= prn <= MAX_PRN:
+            return
+        for name in ALMANAC_COLUMNS:
+            getattr(self, name)[prn] = salm[name]
+        if abs(salm['i0']) < 0.1:		# offset, not absolute
+            self.i0[prn] += INCLINATION_REF
+        self.present |= 1 << prn
+
+###############################################################################
+# prns -- PRNs we have a healthy almanac for, ascending
+###############################################################################
+    def prns(self):
+        return [prn for prn in range(1, MAX_PRN + 1)
+                if self.present & (1 << prn) and not self.health[prn]]
+
+###############################################################################
+# Predict -- elevation in degrees of each PRN in prns() as seen from site
+# (a Position), at times starting from week/tow every step seconds for
+# hours hours.  Returns (prns, tows, elevations) with elevations indexed
+# [prn][time]: a NumPy array, or without NumPy a list of lists.
+###############################################################################
+    def Predict(self, site, week, tow, hours=12, step=60):
+        prns = self.prns()
+        count = int(hours * 3600 / step) + 1
+        tows = [tow + i * step for i in range(count)]
+        lat, lon, height = site.ddxxx_float_list()
+        site_xyz = site.xyz_float_list()
+
+        if numpy is None:
+            elevations = [[elevation(self.elements(prn), week, t,
+                                     site_xyz, lat, lon, math)
+                           for t in tows] for prn in prns]
+            return prns, tows, elevations
+
+        index = numpy.array(prns, dtype=int)
+        elements = dict((name, getattr(self, name)[index, None])
+                        for name in ALMANAC_COLUMNS)
+        times = numpy.array(tows, dtype=float)[None, :]
+        return prns, tows, elevation(elements, week, times, site_xyz,
+                                     lat, lon, numpy)
+
+###############################################################################
+# Visible -- PRNs that are above mask degrees at some time in the next
+# hours hours (hours=0: right now)
+###############################################################################
+    def Visible(self, site, week, tow, hours=0, mask=10, step=60):
+        prns, tows, elevations = self.Predict(site, week, tow, hours, step)
+        if numpy is not None:
+            highest = elevations.max(axis=1) if prns else []
+        else:
+            highest = [max(track) for track in elevations]
+        return [prn for prn, top in zip(prns, highest) if top >= mask]
+
+###############################################################################
+# Missing -- PRNs that should be above mask now but aren't in seen
+###############################################################################
+    def Missing(self, site, week, tow, seen, mask=10):
+        seen = set(seen)
+        return [prn for prn in self.Visible(site, week, tow, 0, mask)
+                if prn not in seen]
+
+###############################################################################
+# elements -- the almanac for one PRN as a dict
+###############################################################################
+    def elements(self, prn):
+        return dict((name, getattr(self, name)[prn])
+                    for name in ALMANAC_COLUMNS)
+
+###############################################################################
+# elevation -- satellite elevation in degrees from the almanac elements at
+# week/tow, from a site at site_xyz (ECEF) and lat/lon (degrees).  lib is
+# numpy (elements and tow arrays that broadcast) or math (scalars).
+###############################################################################
+
+
+def elevation(el, week, tow, site_xyz, lat, lon, lib):
+    if lib is math:
+        atan2, asin, clip = math.atan2, math.asin, \
+            lambda x: min(1.0, max(-1.0, x))
+    else:
+        atan2, asin, clip = numpy.arctan2, numpy.arcsin, \
+            lambda x: numpy.clip(x, -1.0, 1.0)
+    sin, cos, sqrt = lib.sin, lib.cos, lib.sqrt
+    pi = math.pi
+
+    # time from almanac reference
+    tk = (week - el['wna']) * SECONDS_PER_WEEK + tow - el['toa']
+
+    a = el['roota'] * el['roota']
+    mean_anomaly = el['m0'] * pi + sqrt(MU / (a * a * a)) * tk
+    e = el['e']
+    ecc_anomaly = mean_anomaly
+    for i in range(8):				# e is small; this converges
+        ecc_anomaly = mean_anomaly + e * sin(ecc_anomaly)
+    true_anomaly = atan2(sqrt(1.0 - e * e) * sin(ecc_anomaly),
+                         cos(ecc_anomaly) - e)
+    u = true_anomaly + el['omega'] * pi
+    r = a * (1.0 - e * cos(ecc_anomaly))
+    incl = el['i0'] * pi
+    node = el['omega0'] * pi + (el['omegadot'] * pi - OMEGA_E) * tk - \
+        OMEGA_E * el['toa']
+
+    xp = r * cos(u)
+    yp = r * sin(u)
+    x = xp * cos(node) - yp * cos(incl) * sin(node)
+    y = xp * sin(node) + yp * cos(incl) * cos(node)
+    z = yp * sin(incl)
+
+    # look angle from the site
+    dx = x - site_xyz[0]
+    dy = y - site_xyz[1]
+    dz = z - site_xyz[2]
+    phi = math.radians(lat)
+    lam = math.radians(lon)
+    up = (math.cos(phi) * math.cos(lam) * dx +
+          math.cos(phi) * math.sin(lam) * dy + math.sin(phi) * dz)
+    rng = sqrt(dx * dx + dy * dy + dz * dz)
+    return asin(clip(up / rng)) * (180.0 / pi)
+
+# end of ashalmanac.py
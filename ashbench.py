@@ -0,0 +1,1387 @@
+#!/usr/bin/env python3
+
+################################  N8UR ASHCOMM  ################################
+#
+#	Copyright 2019 by John Ackermann, N8UR jra@febo.com https://febo.com
+#	Version number can be found in the ashglobal.py file
+#
+#	This program is free software; you can redistribute it and/or modify
+#	it under the terms of the GNU General Public License as published by
+#	the Free Software Foundation; either version 2 of the License, or
+#	(at your option) any later version.
+#
+#	This program is distributed in the hope that it will be useful,
+#	but WITHOUT ANY WARRANTY; without even the implied warranty of
+#	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#	GNU General Public License for more details.
+#	Software to communicate with Ashtech GPS receivers via serial port.
+################################################################################
+
+#############################   ashbench.py    #################################
+
+import os
+import pty
+import sys
+import time
+import tty
+import struct
+import asyncio
+import argparse
+import tempfile
+import threading
+import serial
+
+from ashserial import *
+from ashframe import *
+from ashmbn import *
+from ashepoch import *
+from ashhandler import *
+from ashalmanac import *
+from ashmessage import *
+from ashglobal import *
+from ashsession import *
+from ashopt import *
+from ashwriter import *
+from ashformat import *
+from ashrinex3 import *
+from ashobsfile import *
+from ashindex import *
+from ashcrx import *
+from ashcompress import *
+import ashemu
+
+###############################################################################
+# Benchmarks for the performance-sensitive parts of ashcomm.  Each benchmark
+# is a function named bench_<name>() that prints its own results; run
+# "./ashbench.py <name>" for one or "./ashbench.py all" for everything.
+# Numbers are only meaningful relative to each other on the same machine.
+###############################################################################
+
+###############################################################################
+# open_pty -- make a raw pseudo-terminal pair to stand in for a receiver.
+# Returns (master fd, slave device name).
+###############################################################################
+
+
+def open_pty():
+    master, slave = pty.openpty()
+    tty.setraw(master)
+    tty.setraw(slave)
+    name = os.ttyname(slave)
+    return master, slave, name
+
+###############################################################################
+# fake_mbn -- a syntactically valid "$PASHR,MPC," message with a counter
+# in the seq field; enough for framing benchmarks
+###############################################################################
+
+
+def fake_mbn(count):
+    payload = struct.pack('> H', count & 0xffff) + bytes(92)
+    return b'$PASHR,MPC,' + payload + bytes([xor_checksum(payload)]) + \
+        b'\r\n'
+
+###############################################################################
+# fake_pbn -- a "$PASHR,PBN," message with a valid checksum
+###############################################################################
+
+
+def fake_pbn(tow):
+    payload = struct.pack('> l 4s d d d f f f f f H', tow, b'????',
+                          518000.0, -4660000.0, 4270000.0,
+                          0, 0, 0, 0, 0, 150)
+    chksum = word_checksum(payload)
+    return b'$PASHR,PBN,' + payload + struct.pack('> H', chksum) + b'\r\n'
+
+###############################################################################
+# legacy_read -- the sleep-and-poll read that MsgSwitch used before the
+# reader thread, kept here so the two can be compared
+###############################################################################
+
+
+def legacy_read(port):
+    while True:
+        time.sleep(0.1)
+        if port.in_waiting:
+            return port.read_until(b'$PASHR')
+
+###############################################################################
+# bench_reader -- frame latency and idle CPU of the serial read path, polled
+# versus reader thread, against a pty stand-in receiver
+###############################################################################
+
+
+def bench_reader(frames=50, interval=0.11, idle=5.0):
+    for method in ("polled", "thread"):
+        master, slave, name = open_pty()
+        Serial = AshtechSerial(name, 115200, 'A', False)
+        Serial.serial = serial.Serial(name, 115200)
+        sent = {}
+
+        def writer():
+            for i in range(frames + 1):
+                time.sleep(interval)
+                sent[i] = time.monotonic()
+                os.write(master, fake_mbn(i))
+
+        if method == "thread":
+            Serial.StartReader()
+        latency = []
+        t = threading.Thread(target=writer, daemon=True)
+        t.start()
+        for i in range(frames):
+            if method == "thread":
+                msg_type, payload = Serial.get_frame(5)
+            else:
+                # the old framing can't see the end of a message until
+                # the next one starts
+                message = b''
+                while len(message) <= 9:	# skip leading b'$PASHR'
+                    message = legacy_read(Serial.serial)
+                payload = message[5:-8]
+            now = time.monotonic()
+            seq, = struct.unpack('> H', payload[0:2])
+            latency.append(now - sent[seq])
+        t.join()
+
+        # now let the line go quiet and see what waiting costs
+        cpu = time.process_time()
+        if method == "thread":
+            time.sleep(idle)
+            Serial.StopReader()
+        else:
+            deadline = time.monotonic() + idle
+            while time.monotonic() < deadline:
+                time.sleep(0.1)
+                Serial.serial.in_waiting
+        cpu = time.process_time() - cpu
+
+        Serial.Close()
+        os.close(master)
+        os.close(slave)
+
+        latency.sort()
+        print("{:8s} latency mean {:7.2f} ms  p50 {:7.2f} ms  "
+              "max {:7.2f} ms   idle CPU {:7.1f} us/s".format(
+                  method, 1000 * sum(latency) / len(latency),
+                  1000 * latency[len(latency) // 2], 1000 * latency[-1],
+                  1e6 * cpu / idle))
+
+###############################################################################
+# bench_decoder -- pure replay of a mixed binary/ASCII stream through the
+# frame decoder, compared with the 115200 baud line rate
+###############################################################################
+
+
+def bench_decoder(epochs=2000, sats=12, chunk=4096):
+    stream = bytearray()
+    for epoch in range(epochs):
+        for sat in range(sats):
+            stream += fake_mbn(epoch * sats + sat)
+        stream += fake_pbn(epoch * 1000)
+        if epoch % 100 == 0:
+            stream += b'$PASHR,RID,UZ,12,UC00,-AEXMPRTUY-M-,1C59*4A\r\n'
+    stream = bytes(stream)
+
+    decoder = FrameDecoder()
+    frames = 0
+    start = time.perf_counter()
+    for i in range(0, len(stream), chunk):
+        decoder.feed(stream[i:i + chunk])
+        for msg_type, payload in decoder:
+            frames += 1
+    elapsed = time.perf_counter() - start
+
+    line_rate = 115200 / 10			# bytes/s, 8N1
+    print("{} frames, {} bytes in {:.3f} s: {:.0f} frames/s, {:.2f} MB/s "
+          "({:.0f}x 115200 baud); resyncs {}".format(
+              frames, len(stream), elapsed, frames / elapsed,
+              len(stream) / elapsed / 1e6,
+              len(stream) / elapsed / line_rate, decoder.resyncs))
+
+###############################################################################
+# bench_fleet -- several pty stand-in receivers streaming at once into
+# sessions sharing one asyncio event loop
+###############################################################################
+
+
+def bench_fleet(receivers=8, epochs=100, sats=12, interval=0.01):
+    ptys = [open_pty() for i in range(receivers)]
+    sessions = []
+    for master, slave, name in ptys:
+        g = AshtechGlobals()
+        g.opts['serport'] = name
+        g.opts['baud'] = 115200
+        g.opts['hwport'] = 'A'
+        session = AshtechSession(g)
+        session.Serial.serial = serial.Serial(name, 115200)
+        session.frames = 0
+        sessions.append(session)
+
+    def writer(master):
+        for epoch in range(epochs):
+            burst = b''.join(fake_mbn(epoch * sats + sat)
+                             for sat in range(sats))
+            os.write(master, burst + fake_pbn(epoch * 1000))
+            time.sleep(interval)
+
+    async def run():
+        loop = asyncio.get_running_loop()
+        for session in sessions:
+            def on_frame(msg_type, payload, session=session):
+                session.frames += 1
+                session.Messages.HandleFrame(msg_type, payload)
+            session.Serial.StartAsyncReader(loop, on_frame)
+        threads = [threading.Thread(target=writer, args=(master,))
+                   for master, slave, name in ptys]
+        for t in threads:
+            t.start()
+        expected = epochs * (sats + 1)
+        while any(s.frames < expected for s in sessions):
+            await asyncio.sleep(0.05)
+        for session in sessions:
+            session.Serial.StopAsyncReader()
+
+    cpu = time.process_time()
+    start = time.perf_counter()
+    asyncio.run(run())
+    elapsed = time.perf_counter() - start
+    cpu = time.process_time() - cpu
+
+    for session in sessions:
+        session.Serial.Close()
+    for master, slave, name in ptys:
+        os.close(master)
+        os.close(slave)
+
+    total = sum(s.frames for s in sessions)
+    print("{} receivers, frames each: {}; {} frames in {:.2f} s "
+          "({:.0f} frames/s, CPU {:.2f} s)".format(
+              receivers, sorted(set(s.frames for s in sessions)), total,
+              elapsed, total / elapsed, cpu))
+
+###############################################################################
+# bench_emulator -- end to end (startup, parse, RINEX) against the receiver
+# emulator at 10 Hz with 12 satellites
+###############################################################################
+
+
+def bench_emulator(rate=0.1, sats=12, duration=30):
+    opts = ashemu.getargs(['--rate', str(rate), '--sats', str(sats),
+                           '--stats', '100000'])
+    emulator = ashemu.AshtechEmulator(opts)
+    t = threading.Thread(target=emulator.run, daemon=True)
+    t.start()
+
+    workdir = tempfile.mkdtemp()
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    g = AshtechGlobals()
+    option = AshtechOpts(g)
+    option.getargs(['--serport', emulator.name, '--msg_rate', '1',
+                    '--site_name', 'BNCH', '--state_dir', workdir])
+    session = AshtechSession(g)
+    session.Start()
+    session.Commands.SetCommand("RCI," + str(rate))
+    time.sleep(1)
+
+    session.Serial.StartReader()
+    sent = dict(emulator.stats)
+    written = g.obs_epoch_count
+    cpu = time.process_time()
+    start = time.monotonic()
+    while time.monotonic() - start < duration:
+        frame = session.Serial.get_frame(1)
+        if frame:
+            session.Messages.HandleFrame(*frame)
+    elapsed = time.monotonic() - start
+    cpu = time.process_time() - cpu
+    sent = dict((k, emulator.stats[k] - sent[k]) for k in sent)
+    written = g.obs_epoch_count - written
+
+    emulator.stop()
+    t.join()
+    session.Serial.StopReader()
+    session.Serial.Close()
+    emulator.close()
+    os.chdir(cwd)
+
+    print()
+    print("{:.0f} Hz x {} SVs for {:.0f} s: emulator sent {} epochs "
+          "({} overruns, {:.0f}% of 115200 baud); wrote {} epochs "
+          "({:.1f}/s), client CPU {:.1f}% (includes emulator)".format(
+              1 / rate, sats, elapsed, sent['epochs'], sent['overruns'],
+              100 * sent['bytes'] * 10 / 115200 / elapsed, written,
+              written / elapsed, 100 * cpu / elapsed))
+
+###############################################################################
+# bench_query -- status queries (RID, PRT, PPS, WKN) sent from another
+# thread while observations stream from the emulator; checks that no epochs
+# are lost to the queries and reports the query round trip time
+###############################################################################
+
+
+def bench_query(rate=0.1, sats=8, duration=20, poll=1.0):
+    opts = ashemu.getargs(['--rate', str(rate), '--sats', str(sats),
+                           '--stats', '100000'])
+    emulator = ashemu.AshtechEmulator(opts)
+    t = threading.Thread(target=emulator.run, daemon=True)
+    t.start()
+
+    workdir = tempfile.mkdtemp()
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    g = AshtechGlobals()
+    option = AshtechOpts(g)
+    option.getargs(['--serport', emulator.name, '--msg_rate', '1',
+                    '--site_name', 'BNCH', '--state_dir', workdir])
+    session = AshtechSession(g)
+    session.Start()
+    session.Commands.SetCommand("RCI," + str(rate))
+    time.sleep(1)
+    session.Serial.StartReader()
+
+    for polling in (False, True):
+        latency = []
+        failed = 0
+        running = True
+
+        def poller():
+            nonlocal failed
+            while running:
+                start = time.monotonic()
+                status = session.Commands.QueryStatus()
+                latency.append((time.monotonic() - start) / len(status))
+                failed += sum(1 for v in status.values() if v is None)
+                time.sleep(poll)
+
+        sent = dict(emulator.stats)
+        written = g.obs_epoch_count
+        if polling:
+            p = threading.Thread(target=poller, daemon=True)
+            p.start()
+        start = time.monotonic()
+        while time.monotonic() - start < duration:
+            frame = session.Serial.get_frame(1)
+            if frame:
+                session.Messages.HandleFrame(*frame)
+        running = False
+        if polling:
+            p.join()
+        sent = dict((k, emulator.stats[k] - sent[k]) for k in sent)
+        written = g.obs_epoch_count - written
+
+        line = "{:14s} emulator sent {} epochs ({} overruns), wrote {}".format(
+            "with queries" if polling else "no queries",
+            sent['epochs'], sent['overruns'], written)
+        if latency:
+            latency.sort()
+            line += "; {} queries, {} unanswered, round trip mean " \
+                "{:.1f} ms max {:.1f} ms".format(
+                    4 * len(latency), failed,
+                    1000 * sum(latency) / len(latency), 1000 * latency[-1])
+        print(line)
+
+    emulator.stop()
+    t.join()
+    session.Serial.StopReader()
+    session.Serial.Close()
+    emulator.close()
+    os.chdir(cwd)
+
+###############################################################################
+# bench_mbn -- MBN decoding for archive reprocessing: the per-message
+# decode of the original parse_mben() (legacy_mben()) and today's
+# parse_mben() one message at a time, versus AshtechMbn.DecodeBatch() on
+# the whole lot
+###############################################################################
+
+
+def bench_mbn(records=100000, sats=12):
+    emulator = ashemu.AshtechEmulator.__new__(ashemu.AshtechEmulator)
+    payloads = [emulator.mbn(i // sats, 1 + i % sats, sats - 1 - i % sats,
+                             i % sats)[11:-2] for i in range(records)]
+    data = b''.join(payloads)
+
+    g = AshtechGlobals()
+    g.gps_week = 2000
+    g.current_pben_epoch = GpsTime(2000, 0)
+    Messages = AshtechMessages(None, None, g, None, False)
+    start = time.perf_counter()
+    for payload in payloads:
+        legacy_mben(g, payload)
+    legacy = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for payload in payloads:
+        Messages.parse_mben(payload)
+        for epoch in Messages.Assembler.Ready():
+            g.epoch_pool.Release(epoch)
+    single = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for payload in payloads:
+        Messages.Mbn.Decode(payload[:-1])
+    decode = time.perf_counter() - start
+
+    start = time.perf_counter()
+    batch = Messages.Mbn.DecodeBatch(data)
+    elapsed = time.perf_counter() - start
+
+    print("{} records: legacy {:.0f}/s, parse_mben {:.0f}/s, Decode {:.0f}/s, "
+          "DecodeBatch ({}) {:.0f}/s".format(
+              records, records / legacy, records / single, records / decode,
+              "NumPy" if numpy else "no NumPy", len(batch['prn']) / elapsed))
+    print("DecodeBatch: {:.1f}x legacy, {:.1f}x parse_mben".format(
+        legacy / elapsed, single / elapsed))
+
+###############################################################################
+# legacy_mben -- the per-message decode of parse_mben() from before
+# AshtechMbn: unpack to a dict with zip(), scale field by field, and call
+# make_lli(), fixphase() and make_sbyte() for each band.  Kept here as the
+# baseline bench_mbn measures against; its seq to epoch time conversion is
+# left out, so if anything it flatters the old code.  Returns (mben_dict,
+# mben_flag_dict).
+###############################################################################
+
+
+def legacy_mben(g, message):
+    chksum = message[-1:]
+    message = message[:-1]
+    if not verify_chksum(message, chksum):
+        print("Checksum error!")
+        return
+
+    mben_list = struct.unpack(g.mben_struct, message)
+    mben_dict = dict(zip(g.mben_keys, mben_list))
+    mben_flag_dict = dict(zip(g.mben_flag_keys, [None] * 33))
+
+    mben_dict['az'] = mben_dict['az'] * 2
+    for band in ('ca', 'l1', 'l2'):
+        mben_dict[band + '_snr'] /= g.Z12_SNR_SCALE
+        mben_dict[band + '_range'] *= (g.LIGHTSPEED * 1000.0)
+        mben_dict[band + '_dopp'] /= 10000.0
+
+        flag_tmp = make_lli(mben_dict[band + '_warn'],
+                            mben_dict[band + '_goodbad'])
+        mben_flag_dict[band + '_phase_lli'] = \
+            mben_flag_dict[band + '_range_lli'] = \
+            mben_flag_dict[band + '_dopp_lli'] = \
+            flag_tmp
+
+        mben_dict[band + '_phase'], mben_flag_dict[band + '_phase_lli'] = \
+            fixphase(mben_dict[band + '_phase'],
+                     mben_flag_dict[band + '_phase_lli'])
+
+        sbyte_tmp = make_sbyte(mben_dict[band + '_snr'])
+        mben_flag_dict[band + '_phase_sbyte'] = \
+            mben_flag_dict[band + '_range_sbyte'] = \
+            mben_flag_dict[band + '_dopp_sbyte'] = \
+            sbyte_tmp
+
+    return mben_dict, mben_flag_dict
+
+###############################################################################
+# legacy_epoch -- the per-satellite dict layout used before Epoch, kept here
+# so the two can be compared.  Returns (mben_list, mben_flag_list).
+###############################################################################
+
+
+def legacy_epoch(Mbn, payloads):
+    mben_list = [None] * 33
+    mben_flag_list = [None] * 33
+    for payload in payloads:
+        mben_dict, mben_flag_dict = Mbn.Decode(payload[:-1])
+        mben_list[mben_dict['prn']] = mben_dict
+        mben_flag_list[mben_dict['prn']] = mben_flag_dict
+    return mben_list, mben_flag_list
+
+###############################################################################
+# bench_epoch -- memory, allocations and time per epoch: per-satellite
+# dicts (walked with mben_list.index() as the RINEX writer did) versus a
+# pooled Epoch
+###############################################################################
+
+
+def bench_epoch(epochs=5000, sats=12, keep=1000):
+    import gc
+    import tracemalloc
+
+    emulator = ashemu.AshtechEmulator.__new__(ashemu.AshtechEmulator)
+    bursts = [[emulator.mbn(epoch, prn, sats - prn, prn)[11:-2]
+               for prn in range(1, sats + 1)] for epoch in range(epochs)]
+    Mbn = AshtechMbn(AshtechGlobals())
+
+    def blocks():
+        return sum(stat.count for stat in
+                   tracemalloc.take_snapshot().statistics('filename'))
+
+    # what one epoch holds on to until it has been written
+    gc.collect()
+    tracemalloc.start()
+    before, count = tracemalloc.get_traced_memory()[0], blocks()
+    kept = [legacy_epoch(Mbn, burst) for burst in bursts[:keep]]
+    legacy_bytes = (tracemalloc.get_traced_memory()[0] - before) / keep
+    legacy_blocks = (blocks() - count) / keep
+    del kept
+    gc.collect()
+    before, count = tracemalloc.get_traced_memory()[0], blocks()
+    kept = []
+    for burst in bursts[:keep]:
+        epoch = Epoch()
+        for payload in burst:
+            Mbn.Store(Mbn.Unpack(payload[:-1]), epoch)
+        kept.append(epoch)
+    epoch_bytes = (tracemalloc.get_traced_memory()[0] - before) / keep
+    epoch_blocks = (blocks() - count) / keep
+    del kept
+    tracemalloc.stop()
+
+    # and the time to build and walk each epoch
+    start = time.perf_counter()
+    for burst in bursts:
+        mben_list, mben_flag_list = legacy_epoch(Mbn, burst)
+        for i in mben_list:
+            if i:
+                counter = mben_list.index(i)
+                j = mben_flag_list[counter]
+                i['l1_range'], j['l1_range_lli']
+    legacy_time = (time.perf_counter() - start) / epochs
+
+    pool = EpochPool()
+    start = time.perf_counter()
+    for burst in bursts:
+        epoch = pool.Get()
+        for payload in burst:
+            Mbn.Store(Mbn.Unpack(payload[:-1]), epoch)
+        for prn in epoch.prns():
+            epoch.l1_range[prn], epoch.l1_lli[prn]
+        pool.Release(epoch)
+    epoch_time = (time.perf_counter() - start) / epochs
+
+    print("{} SVs per epoch:".format(sats))
+    print("  dicts   {:7.0f} bytes, {:5.0f} blocks, {:6.1f} us per epoch".format(
+        legacy_bytes, legacy_blocks, 1e6 * legacy_time))
+    print("  Epoch   {:7.0f} bytes, {:5.0f} blocks, {:6.1f} us per epoch".format(
+        epoch_bytes, epoch_blocks, 1e6 * epoch_time))
+    print("  at 10 Hz the dicts allocate {:.0f} blocks/s; the pool made {} "
+          "Epochs in all for {} epochs".format(
+              10 * legacy_blocks, pool.created, epochs))
+
+###############################################################################
+# legacy_switch -- the if/elif chain HandleFrame used before the registry,
+# minus the parsers, kept here so the two can be compared
+###############################################################################
+
+
+def legacy_switch(msg_type, payload):
+    if msg_type == 'MPC':
+        pass
+    elif msg_type == 'PBN':
+        pass
+    elif msg_type == 'SNV':
+        pass
+    elif msg_type == 'SAL':
+        pass
+    elif msg_type == 'EPB':
+        pass
+    elif msg_type == 'RPC':
+        pass
+    elif msg_type in ('DAL', 'ACK', 'NAK'):
+        pass
+
+###############################################################################
+# bench_dispatch -- cost of getting a frame to its handler, by message type:
+# if/elif chain versus registry lookup, and the cost of decoding a message
+# type that nobody has subscribed to versus skipping it
+###############################################################################
+
+
+def bench_dispatch(count=200000):
+    types = ('MPC', 'PBN', 'SNV', 'SAL', 'EPB', 'RPC', 'DAL', 'NAK')
+    registry = MessageRegistry()
+    for msg_type in types:
+        registry.Register(msg_type, MessageHandler())
+    payload = b''
+
+    # best of 5 runs, taking turns so that both see the same machine;
+    # at ~100 ns a frame, one run is mostly noise
+    switches = (("if/elif", legacy_switch), ("registry", registry.Dispatch))
+    times = dict((name, []) for name, dispatch in switches)
+    runs = 5
+    for msg_type in types:
+        best = {}
+        for run in range(runs):
+            for name, dispatch in switches:
+                start = time.perf_counter()
+                for i in range(count // runs):
+                    dispatch(msg_type, payload)
+                elapsed = time.perf_counter() - start
+                best[name] = min(best.get(name, elapsed), elapsed)
+        for name, dispatch in switches:
+            times[name].append(best[name] / (count // runs))
+
+    print("ns per frame   " + "".join("{:>7s}".format(t) for t in types))
+    for name, dispatch in switches:
+        print("{:14s} ".format(name) +
+              "".join("{:7.0f}".format(1e9 * t) for t in times[name]))
+
+    snv = SnvHandler.record.pack(*([1] * 30))
+    snv += struct.pack('> H', word_checksum(snv))
+    handler = SnvHandler()
+    for state in ("no sink", "subscribed"):
+        start = time.perf_counter()
+        for i in range(count):
+            handler.Handle(snv)
+        elapsed = (time.perf_counter() - start) / count
+        print("SNV {:10s} {:7.0f} ns".format(state, 1e9 * elapsed))
+        handler.Subscribe(lambda message: None)
+
+###############################################################################
+# bench_almanac -- visibility prediction for all 32 PRNs over a time grid,
+# with and without NumPy
+###############################################################################
+
+
+def bench_almanac(hours=24, step=30):
+    import ashalmanac
+
+    emulator = ashemu.AshtechEmulator.__new__(ashemu.AshtechEmulator)
+    handler = SalHandler()
+    site = Position(518038.16, -4660158.70, 4273406.88)
+    week, tow = 2100, 100000
+
+    have_numpy = ashalmanac.numpy
+    for lib in ("NumPy", "no NumPy"):
+        if lib == "no NumPy":
+            ashalmanac.numpy = None
+        elif have_numpy is None:
+            continue
+        almanac = Almanac()
+        for prn in range(1, 33):
+            almanac.Add(handler.Decode(emulator.sal(week, tow, prn)[11:-2]))
+        start = time.perf_counter()
+        visible = almanac.Visible(site, week, tow, hours, 10, step)
+        elapsed = time.perf_counter() - start
+        print("{:9s} 32 PRNs x {} times ({} h every {} s): {:8.1f} ms, "
+              "{} PRNs above 10 degrees".format(
+                  lib, int(hours * 3600 / step) + 1, hours, step,
+                  1000 * elapsed, len(visible)))
+    ashalmanac.numpy = have_numpy
+
+###############################################################################
+# bench_gpstime -- GPS_Time against GpsTime: making one per message and
+# comparing, formatting an epoch line, and whole arrays at once
+###############################################################################
+
+
+def bench_gpstime(count=20000):
+    import ashtime
+
+    times = [(2000 + i // 86400, (i % 86400) * 7000) for i in range(count)]
+
+    def rate(function):
+        start = time.perf_counter()
+        function()
+        return count / (time.perf_counter() - start)
+
+    def old_key():
+        last = None
+        for week, ms in times:
+            string = GPS_Time(week, ms // 1000).timestring()
+            if string != last:
+                last = string
+
+    def new_key():
+        last = None
+        for week, ms in times:
+            key = GpsTime(week, ms)
+            if key != last:
+                last = key
+
+    def old_format():
+        for week, ms in times:
+            GPS_Time(week, ms // 1000).RINEX_fmt_obs()
+
+    def new_format():
+        for week, ms in times:
+            GpsTime(week, ms).RINEX_fmt_obs()
+
+    print("make and compare: GPS_Time {:8.0f}/s  GpsTime {:9.0f}/s".format(
+        rate(old_key), rate(new_key)))
+    print("epoch line:       GPS_Time {:8.0f}/s  GpsTime {:9.0f}/s".format(
+        rate(old_format), rate(new_format)))
+
+    weeks = [week for week, ms in times]
+    ms = [m for week, m in times]
+    have_numpy = ashtime.numpy
+    for lib in ("NumPy", "no NumPy"):
+        if lib == "no NumPy":
+            ashtime.numpy = None
+        elif have_numpy is None:
+            continue
+        print("gps_calendar ({}): {:.0f}/s".format(
+            lib, rate(lambda: gps_calendar(weeks, ms))))
+    ashtime.numpy = have_numpy
+
+###############################################################################
+# bench_writer -- system calls and time per epoch writing the obs file:
+# the original open-per-satellite writes, the open-per-epoch writes this
+# replaced, and RinexWriter with a few flush policies, with and without
+# the epoch index
+###############################################################################
+
+
+def bench_writer(epochs=2000, sats=12):
+    header = " 26 10 18 18 23 58.0000000  0 12G01G04G06G09G11G14G16G19" \
+        "G21G24G26G31\n"
+    sat = ["  20167026.33403  20167026.33403  20167026.33402 "
+           "105978438.68303  82580601.57102\n",
+           "      749.19203       583.78602       115.000       105.000\n"]
+
+    def legacy(filename, per_sat):
+        # each open/write/close is counted as 3 calls
+        calls = 0
+        for i in range(epochs):
+            with open(filename, 'a') as writer:
+                writer.write(header)
+            calls += 3
+            if per_sat:
+                for j in range(sats):
+                    with open(filename, 'a') as writer:
+                        writer.writelines(sat)
+                    calls += 3
+            else:
+                with open(filename, 'a') as writer:
+                    writer.writelines(sat * sats)
+                calls += 3
+        return calls
+
+    def buffered(filename, **policy):
+        writer = RinexWriter(filename, **policy)
+        for i in range(epochs):
+            writer.Write([header] + sat * sats, GpsTime(2441, i * 1000))
+            writer.EndEpoch()
+        writer.Close()
+        return writer.Syscalls()
+
+    tests = [("open per satellite", lambda f: legacy(f, True)),
+             ("open per epoch", lambda f: legacy(f, False)),
+             ("writer, flush every epoch", lambda f: buffered(f)),
+             ("writer, fsync every 60 epochs",
+              lambda f: buffered(f, fsync_epochs=60)),
+             ("writer, flush every 60 s",
+              lambda f: buffered(f, flush_secs=60)),
+             ("writer + index, every epoch",
+              lambda f: buffered(f, index=True)),
+             ("writer + index, every 60 s",
+              lambda f: buffered(f, flush_secs=60, index=True))]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, test in tests:
+            filename = os.path.join(tmp, "bench.26o")
+            start = time.perf_counter()
+            calls = test(filename)
+            elapsed = time.perf_counter() - start
+            os.remove(filename)
+            if os.path.exists(index_name(filename)):
+                os.remove(index_name(filename))
+            print("{:30s} {:6.2f} syscalls/epoch {:8.0f} epochs/s".format(
+                name, calls / epochs, epochs / elapsed))
+
+###############################################################################
+# legacy_obs_2, legacy_obs_3 -- the per-field obs_epoch() of Rinex and
+# Rinex3 from before EpochFormatter, kept here as the reference it must
+# match byte for byte
+###############################################################################
+
+
+def legacy_obs_2(epoch):
+    (ca_snr, ca_phase, ca_range, ca_dopp, ca_lli, ca_phase_lli,
+     ca_sbyte) = epoch.bands[0]
+    (l1_snr, l1_phase, l1_range, l1_dopp, l1_lli, l1_phase_lli,
+     l1_sbyte) = epoch.bands[1]
+    (l2_snr, l2_phase, l2_range, l2_dopp, l2_lli, l2_phase_lli,
+     l2_sbyte) = epoch.bands[2]
+
+    lines = []
+    for prn in epoch.prns():
+        # line 1
+        l1p1 = "{:14.3f}{:1d}{:1d}".format(
+            ca_range[prn], ca_lli[prn], ca_sbyte[prn])
+
+        l1p2 = "{:14.3f}{:1d}{:1d}".format(
+            l1_range[prn], l1_lli[prn], l1_sbyte[prn])
+
+        l1p3 = "{:14.3f}{:1d}{:1d}".format(
+            l2_range[prn], l2_lli[prn], l2_sbyte[prn])
+
+        l1p4 = "{:14.3f}{:1d}{:1d}".format(
+            l1_phase[prn], l1_phase_lli[prn], l1_sbyte[prn])
+
+        l1p5 = "{:14.3f}{:1d}{:1d}".format(
+            l2_phase[prn], l2_phase_lli[prn], l2_sbyte[prn])
+
+        # line 2
+        l2p1 = "{:14.3f}{:1d}{:1d}".format(
+            l1_dopp[prn], l1_lli[prn], l1_sbyte[prn])
+
+        l2p2 = "{:14.3f}{:1d}{:1d}".format(
+            l2_dopp[prn], l2_lli[prn], l2_sbyte[prn])
+
+        l2p3 = "{:14.3f}".format(l1_snr[prn])
+        l2p4 = "{:14.3f}".format(l2_snr[prn])
+
+        lines.append(l1p1 + l1p2 + l1p3 + l1p4 + l1p5 + "\n")
+        lines.append(l2p1 + l2p2 + l2p3 + l2p4 + "\n")
+
+    return lines
+
+
+def legacy_obs_3(epoch):
+    (ca_snr, ca_phase, ca_range, ca_dopp, ca_lli, ca_phase_lli,
+     ca_sbyte) = epoch.bands[0]
+    (l1_snr, l1_phase, l1_range, l1_dopp, l1_lli, l1_phase_lli,
+     l1_sbyte) = epoch.bands[1]
+    (l2_snr, l2_phase, l2_range, l2_dopp, l2_lli, l2_phase_lli,
+     l2_sbyte) = epoch.bands[2]
+
+    lines = []
+    for prn in epoch.prns():
+        lines.append(
+            "G{:02d}".format(prn) +
+            "{:14.3f}{:1d}{:1d}".format(
+                ca_range[prn], ca_lli[prn], ca_sbyte[prn]) +
+            "{:14.3f}{:1d}{:1d}".format(
+                l1_range[prn], l1_lli[prn], l1_sbyte[prn]) +
+            "{:14.3f}{:1d}{:1d}".format(
+                l2_range[prn], l2_lli[prn], l2_sbyte[prn]) +
+            "{:14.3f}{:1d}{:1d}".format(
+                ca_phase[prn], ca_phase_lli[prn], ca_sbyte[prn]) +
+            "{:14.3f}{:1d}{:1d}".format(
+                l2_phase[prn], l2_phase_lli[prn], l2_sbyte[prn]) +
+            "{:14.3f}{:1d}{:1d}".format(
+                ca_dopp[prn], ca_lli[prn], ca_sbyte[prn]) +
+            "{:14.3f}{:1d}{:1d}".format(
+                l2_dopp[prn], l2_lli[prn], l2_sbyte[prn]) +
+            "{:14.3f}  {:14.3f}\n".format(ca_snr[prn], l2_snr[prn]))
+
+    return lines
+
+###############################################################################
+# bench_format -- epochs/s turning an Epoch into observation lines, the old
+# per-field way against EpochFormatter, for both RINEX versions.  Random
+# epochs, some with zero observations, are first checked to come out
+# byte-identical.
+###############################################################################
+
+
+def bench_format(epochs=5000, sats=12, check=2000):
+    import random
+
+    random.seed(1)
+    pool = EpochPool(epochs)
+    samples = []
+    for i in range(epochs):
+        epoch = pool.Get()
+        for prn in random.sample(range(1, 33), random.randint(1, sats)):
+            epoch.Mark(prn)
+            for band in epoch.bands:
+                snr, phase, range_, dopp, lli, phase_lli, sbyte = band
+                snr[prn] = random.uniform(30, 55)
+                phase[prn] = random.uniform(-3e8, 3e8)
+                range_[prn] = random.uniform(2e7, 2.6e7)
+                dopp[prn] = random.uniform(-5000, 5000)
+                lli[prn] = random.randint(0, 1)
+                phase_lli[prn] = random.randint(0, 1)
+                sbyte[prn] = random.randint(1, 9)
+                if random.random() < 0.05:
+                    range_[prn] = phase[prn] = 0.0
+        samples.append(epoch)
+    full = [epoch for epoch in samples if epoch.count == sats] or samples
+
+    versions = (("2.11", legacy_obs_2, Rinex.OBS_LAYOUT),
+                ("3.04", legacy_obs_3, Rinex3.OBS_LAYOUT))
+    for version, legacy, layout in versions:
+        formatter = EpochFormatter(layout)
+        bad = sum("".join(legacy(epoch)) != formatter.Format(epoch)
+                  for epoch in samples[:check])
+        print("RINEX {} golden check: {} of {} epochs differ".format(
+            version, bad, min(check, epochs)))
+
+        blank = EpochFormatter(layout, True)
+        for name, function in (("per field", lambda e: legacy(e)),
+                               ("formatter", formatter.Format),
+                               ("formatter, blank", blank.Format)):
+            start = time.perf_counter()
+            for epoch in full:
+                function(epoch)
+            elapsed = time.perf_counter() - start
+            print("RINEX {} {:18s} {:8.0f} epochs/s ({} sats)".format(
+                version, name, len(full) / elapsed, full[0].count))
+
+###############################################################################
+# legacy_obs_read -- a line-by-line obs file parser of the kind the QC
+# scripts carried, one float() per field, for comparison with ObsFile
+###############################################################################
+
+
+def legacy_obs_read(filename):
+    epochs = []
+    with open(filename) as file:
+        for line in file:
+            if line[60:].startswith("# / TYPES OF OBSERV"):
+                count = int(line[:6])
+            if line[60:].startswith("END OF HEADER"):
+                break
+        per_sat = -(-count // 5)
+        for line in file:
+            sats = [line[i:i + 3] for i in range(32, 32 + int(line[29:32]) * 3,
+                                                 3)]
+            rows = []
+            for sat in sats:
+                text = "".join(next(file).rstrip("\n").ljust(80)
+                               for i in range(per_sat))
+                rows.append([float(text[i:i + 14]) if text[i:i + 14].strip()
+                             else float('nan')
+                             for i in range(0, count * 16, 16)])
+            epochs.append((line[:26], sats, rows))
+    return epochs
+
+###############################################################################
+# write_obs_file -- a RINEX 2.11 obs file of epochs at 1 s with random
+# observations, for the reader benchmarks
+###############################################################################
+
+
+OBS_HEADER = "".join(line.ljust(60) + label + "\n" for line, label in (
+    ("     2.11           OBSERVATION         GPS", "RINEX VERSION / TYPE"),
+    ("BENCH", "MARKER NAME"),
+    ("     9    C1    P1    P2    L1    L2    D1    D2    S1    S2",
+     "# / TYPES OF OBSERV"),
+    ("     1.000", "INTERVAL"),
+    ("", "END OF HEADER")))
+
+
+def write_obs_file(filename, epochs, sats):
+    import random
+
+    random.seed(1)
+    formatter = EpochFormatter(Rinex.OBS_LAYOUT)
+    pool = EpochPool(60)
+    samples = []
+    for i in range(60):
+        epoch = pool.Get()
+        for prn in random.sample(range(1, 33), sats):
+            epoch.Mark(prn)
+            for band in epoch.bands:
+                for column in band[:4]:
+                    column[prn] = random.uniform(-3e8, 3e8)
+                band[4][prn] = random.randint(0, 1)
+                band[6][prn] = random.randint(1, 9)
+        samples.append(epoch)
+    with open(filename, 'w') as file:
+        file.write(OBS_HEADER)
+        for i in range(epochs):
+            epoch = samples[i % len(samples)]
+            when = GpsTime(2441, i * 1000)
+            file.write("{}  0{:3d}{}\n".format(
+                when.RINEX_fmt_obs(), epoch.count, "".join(
+                    "G{:02d}".format(prn) for prn in epoch.prns())))
+            file.write(formatter.Format(epoch))
+    print("{} epochs, {} sats, {:.1f} MB".format(
+        epochs, sats, os.path.getsize(filename) / 1e6))
+
+###############################################################################
+# write_sky_file -- like write_obs_file(), but with observations that look
+# like a receiver's: up to 12 satellites rising and setting on the smooth
+# ranges ashemu.py makes up, with noise on every observable.  Compression
+# needs that; random values don't compress and noiseless ones too well.
+###############################################################################
+
+
+def write_sky_file(filename, epochs):
+    import math
+    import random
+
+    random.seed(1)
+    formatter = EpochFormatter(Rinex.OBS_LAYOUT)
+    epoch = EpochPool(1).Get()
+    ambiguity = [random.randint(-10 ** 6, 10 ** 6) for prn in range(33)]
+    bands = ((0, ashemu.L1_WAVELENGTH, 0.0, 0.3),
+             (1, ashemu.L1_WAVELENGTH, 0.0, 0.1),
+             (2, ashemu.L2_WAVELENGTH, 3.0, 0.1))	# iono delay, noise
+    with open(filename, 'w') as file:
+        file.write(OBS_HEADER)
+        for i in range(epochs):
+            epoch.Clear()
+            sky = sorted((math.sin(2 * math.pi * i / 43082.0 + prn), prn)
+                         for prn in range(1, 33))
+            for height, prn in sky[:12]:
+                if height > -0.3:
+                    break
+                epoch.Mark(prn)
+                angle = 2 * math.pi * i / 43082.0 + prn
+                distance = 2.3e7 + 3.0e6 * height
+                rate = 3.0e6 * math.cos(angle) * 2 * math.pi / 43082.0
+                snr = 5 * int(24 - 6 * height + random.random())
+                for band, wavelength, delay, noise in bands:
+                    (snrs, phase, ranges, dopp, lli, phase_lli,
+                     sbyte) = epoch.bands[band]
+                    ranges[prn] = distance + delay + random.gauss(0, noise)
+                    phase[prn] = (distance - delay) / wavelength + \
+                        ambiguity[prn] + random.gauss(0, 0.01)
+                    dopp[prn] = -rate / wavelength + random.gauss(0, 0.05)
+                    snrs[prn] = snr - 10 * band
+                    sbyte[prn] = (snr - 10 * band) // 20
+            file.write("{}  0{:3d}{}\n".format(
+                GpsTime(2441, i * 1000).RINEX_fmt_obs(), epoch.count,
+                "".join("G{:02d}".format(prn) for prn in epoch.prns())))
+            file.write(formatter.Format(epoch))
+    print("{} epochs, {:.1f} MB".format(epochs,
+                                        os.path.getsize(filename) / 1e6))
+
+###############################################################################
+# timed -- run function, print how long it took, and return its result
+###############################################################################
+
+
+def timed(name, function):
+    start = time.perf_counter()
+    result = function()
+    print("{:28s} {:8.3f} s".format(name, time.perf_counter() - start))
+    return result
+
+###############################################################################
+# bench_obsread -- write a 24 hour, 1 s observation file and read it back:
+# the line-by-line parser, ObsFile with and without converting the
+# observations, and ObsFile.Arrays()
+###############################################################################
+
+
+def bench_obsread(epochs=86400, sats=10):
+    with tempfile.TemporaryDirectory() as tmp:
+        filename = os.path.join(tmp, "bench.26o")
+        write_obs_file(filename, epochs, sats)
+
+        legacy = timed("line by line", lambda: legacy_obs_read(filename))
+        obs = ObsFile(filename)
+        timed("ObsFile, times only", lambda: [epoch.time for epoch in obs])
+        rows = timed("ObsFile, all observations",
+                     lambda: [row for epoch in obs for row in epoch.obs])
+        same = rows == [row for time, sats, rows in legacy for row in rows]
+        if numpy is not None:
+            arrays = timed("ObsFile.Arrays()", obs.Arrays)
+            same = same and numpy.array_equal(arrays['obs'], numpy.array(rows))
+        print("results agree:", same)
+        obs.Close()
+
+###############################################################################
+# bench_index -- a 24 hour, 1 s file: building its index, loading it, and
+# reading the 14:00-14:15 window through it against scanning for it
+###############################################################################
+
+
+def bench_index(epochs=86400, sats=10):
+    with tempfile.TemporaryDirectory() as tmp:
+        filename = os.path.join(tmp, "bench.26o")
+        write_obs_file(filename, epochs, sats)
+        start, end = GpsTime(2441, 50400000), GpsTime(2441, 51300000)
+
+        timed("build index", lambda: build_index(filename))
+        print("index size {:.2f} MB".format(
+            os.path.getsize(index_name(filename)) / 1e6))
+        obs = ObsFile(filename)
+        index = timed("load index", lambda: ObsIndex(obs))
+        scanned = timed("window by scanning", lambda: [
+            epoch.time for epoch in obs if start <= epoch.time < end])
+        found = timed("window through index", lambda: [
+            epoch.time for epoch in index.Window(start, end)])
+        print("{} epochs, same: {}".format(len(found), found == scanned))
+        obs.Close()
+
+###############################################################################
+# bench_merge -- cut a 24 hour, 1 s file into four overlapping windows and
+# merge them back: time, Python memory at the peak, and whether the epochs
+# come back byte for byte
+###############################################################################
+
+
+def bench_merge(epochs=86400, sats=10):
+    import tracemalloc
+    import ashmerge
+
+    with tempfile.TemporaryDirectory() as tmp:
+        filename = os.path.join(tmp, "bench.26o")
+        write_obs_file(filename, epochs, sats)
+        build_index(filename)
+
+        parts = []
+        for i in range(4):
+            part = os.path.join(tmp, "part{}.26o".format(i))
+            start = GpsTime(2441, i * 6 * 3600000)
+            end = GpsTime(2441, (i + 1) * 6 * 3600000 + 60000)
+            timed("window {}".format(i), lambda: ashmerge.merge(
+                [filename], part, start, end))
+            parts.append(part)
+
+        merged = os.path.join(tmp, "merged.26o")
+        counts = timed("merge 4 parts", lambda: ashmerge.merge(
+            parts[::-1], merged))
+        # again, for the memory; tracemalloc slows it down a lot
+        tracemalloc.start()
+        ashmerge.merge(parts, merged, force=True)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+        def body(name):
+            with open(name, 'rb') as reader:
+                data = reader.read()
+            return data[data.index(b'END OF HEADER'):]
+        print("{} epochs, {} duplicates dropped, peak {:.2f} MB, same: "
+              "{}".format(counts['epochs'], counts['duplicates'], peak / 1e6,
+                          body(filename) == body(merged)))
+
+###############################################################################
+# bench_fanout -- epochs/s writing a 1 s file alone, and with 30 s and
+# 300 s ObsOutputs, formatting each epoch once for all of them or once per
+# file as a second decimating pass would
+###############################################################################
+
+
+def bench_fanout(epochs=20000, sats=12):
+    import io
+    import random
+    import contextlib
+
+    random.seed(1)
+    formatter = EpochFormatter(Rinex.OBS_LAYOUT)
+    epoch = EpochPool(1).Get()
+    for prn in random.sample(range(1, 33), sats):
+        epoch.Mark(prn)
+        for band in epoch.bands:
+            for column in band[:4]:
+                column[prn] = random.uniform(-3e8, 3e8)
+    times = [GpsTime(2441, i * 1000) for i in range(epochs)]
+    header = ["{:<60}{:<20}".format("", "END OF HEADER")]
+    opts = {'flush_secs': 60, 'fsync_epochs': 0, 'index': True}
+
+    def encode(time):
+        return (time.RINEX_fmt_obs() + "  0{:3d}\n".format(epoch.count) +
+                formatter.Format(epoch)).encode('ascii')
+
+    def run(tmp, intervals, shared):
+        name = os.path.join(tmp, "bench.26o")
+        writer = RinexWriter(name, 'w', flush_secs=60, index=True)
+        outputs = [ObsOutput(seconds * 1000, opts) for seconds in intervals]
+        for output in outputs:
+            output.Open(name)
+        for time in times:
+            data = encode(time)
+            writer.WriteBytes(data, time)
+            writer.EndEpoch()
+            for output in outputs:
+                if output.Takes(time):
+                    output.Write(data if shared else encode(time), time,
+                                 header)
+        writer.Close()
+        for output in outputs:
+            output.Close()
+        return sum(output.epochs for output in outputs)
+
+    tests = [("1 s only", (), True),
+             ("1 s + 30 s + 300 s, shared", (30, 300), True),
+             ("1 s + 30 s + 300 s, per file", (30, 300), False),
+             ("1 s + 1 s + 2 s, shared", (1, 2), True),
+             ("1 s + 1 s + 2 s, per file", (1, 2), False)]
+    for name, intervals, shared in tests:
+        with tempfile.TemporaryDirectory() as tmp, \
+                contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            extra = run(tmp, intervals, shared)
+            elapsed = time.perf_counter() - start
+        print("{:30s} {:8.0f} epochs/s, {} decimated epochs".format(
+            name, epochs / elapsed, extra))
+
+###############################################################################
+# bench_crx -- six hours of 1 s observations from write_sky_file(): CPU
+# time per day and per epoch for CrxWriter's Compact RINEX encoding on the
+# epoch path, the sizes and CPU cost of RINEX and CRX each gzipped and
+# xz'd, how long Compressor.Submit() holds the caller up, and CRX back to
+# RINEX with the observations compared
+###############################################################################
+
+
+def bench_crx(epochs=21600):
+    import shutil
+
+    day = 86400 / epochs
+    with tempfile.TemporaryDirectory() as tmp:
+        rinex = os.path.join(tmp, "bench.26o")
+        write_sky_file(rinex, epochs)
+
+        obs = ObsFile(rinex)
+        crx = crx_name(rinex)
+        writer = CrxWriter(crx, 'w', flush_secs=60)
+        writer.Write([obs.header.Text()])
+        worst = 0
+        for epoch in obs:
+            data = obs.map[epoch.offset:epoch.end]
+            start = time.perf_counter()
+            writer.WriteBytes(data, epoch.time)
+            writer.EndEpoch()
+            worst = max(worst, time.perf_counter() - start)
+        writer.Close()
+        obs.Close()
+        print("CRX encoding: {:.0f} us per epoch, worst {:.1f} ms".format(
+            writer.cpu / epochs * 1e6, worst * 1e3))
+
+        size = os.path.getsize(rinex)
+        print("{:12s} {:>8s} {:>7s} {:>10s}".format(
+            "", "MB/day", "ratio", "CPU s/day"))
+        rows = [("RINEX", size, 0.0),
+                ("CRX", os.path.getsize(crx), writer.cpu)]
+        copy = os.path.join(tmp, "copy")
+        for method in ('gz', 'xz'):
+            for name, filename, cpu in (("RINEX", rinex, 0.0),
+                                        ("CRX", crx, writer.cpu)):
+                shutil.copyfile(filename, copy)
+                bytes_in, bytes_out, seconds = compress_file(copy, method)
+                os.remove(copy + SUFFIXES[method])
+                rows.append((name + "." + method, bytes_out, cpu + seconds))
+        for name, bytes_out, cpu in rows:
+            print("{:12s} {:8.1f} {:6.1f}:1 {:10.1f}".format(
+                name, bytes_out * day / 1e6, size / bytes_out, cpu * day))
+
+        # the first Submit() starts the worker
+        compressor = Compressor('gz')
+        submits = []
+        for i in range(2):
+            shutil.copyfile(crx, copy + str(i))
+            start = time.perf_counter()
+            compressor.Submit(copy + str(i))
+            submits.append(time.perf_counter() - start)
+        compressor.Finish(2 * epochs)		# two copies of 1 s epochs
+        print("Compressor.Submit() took {:.1f} ms, then {:.2f} ms; the "
+              "worker {:.1f} s".format(submits[0] * 1e3, submits[1] * 1e3,
+                                       compressor.cpu))
+
+        back = os.path.join(tmp, "back.26o")
+        timed("CRX to RINEX", lambda: expand_crx(crx, back))
+        if numpy is not None:
+            before = ObsFile(rinex)
+            after = ObsFile(back)
+            a, b = before.Arrays(), after.Arrays()
+            print("same observations:", all(
+                numpy.array_equal(a[key], b[key], equal_nan=(key == 'obs'))
+                for key in a))
+            before.Close()
+            after.Close()
+
+###############################################################################
+# legacy_xor, legacy_sum -- the checksum loops verify_chksum() used before
+# xor_checksum() and word_checksum(), kept here so they can be compared
+###############################################################################
+
+
+def legacy_xor(payload):
+    chksum = 0
+    for c in payload:
+        chksum = chksum ^ c
+    return chksum
+
+
+def legacy_sum(payload):
+    words = len(payload) // 2
+    shorts = struct.unpack('> ' + str(words) + 'H', payload)
+    chksum = 0
+    for i in range(0, words):
+        chksum = chksum + shorts[i]
+    while chksum > 65535:
+        chksum = chksum - 65536
+    return chksum
+
+###############################################################################
+# bench_checksum -- frames/s for each checksum flavour, one at a time and
+# batched as for a replay file
+###############################################################################
+
+
+def bench_checksum(frames=100000):
+    import ashutil
+
+    emulator = ashemu.AshtechEmulator.__new__(ashemu.AshtechEmulator)
+    mbn = [emulator.mbn(i, 1 + i % 12, 0, 1)[11:-2] for i in range(frames)]
+    pbn = [emulator.pbn(i)[11:-2] for i in range(frames)]
+
+    def rate(function, payloads, length):
+        start = time.perf_counter()
+        for payload in payloads:
+            function(payload[:-length])
+        return frames / (time.perf_counter() - start)
+
+    print("MBN XOR   loop {:9.0f}/s  xor_checksum {:9.0f}/s".format(
+        rate(legacy_xor, mbn, 1), rate(xor_checksum, mbn, 1)))
+    print("PBN sum   loop {:9.0f}/s  word_checksum {:8.0f}/s".format(
+        rate(legacy_sum, pbn, 2), rate(word_checksum, pbn, 2)))
+
+    have_numpy = ashutil.numpy
+    for lib in ("NumPy", "no NumPy"):
+        if lib == "no NumPy":
+            ashutil.numpy = None
+        elif have_numpy is None:
+            continue
+        for name, payloads, size, length in (("MBN", mbn, 95, 1),
+                                             ("PBN", pbn, 56, 2)):
+            data = b''.join(payloads)
+            start = time.perf_counter()
+            good = verify_chksums(data, size, length)
+            elapsed = time.perf_counter() - start
+            print("{} batch ({}) {:10.0f}/s, {} bad".format(
+                name, lib, frames / elapsed, frames - sum(good)))
+    ashutil.numpy = have_numpy
+
+###############################################################################
+# MAIN PROGRAM
+###############################################################################
+
+
+BENCHMARKS = {
+    'reader': bench_reader,
+    'decoder': bench_decoder,
+    'fleet': bench_fleet,
+    'emulator': bench_emulator,
+    'query': bench_query,
+    'mbn': bench_mbn,
+    'epoch': bench_epoch,
+    'dispatch': bench_dispatch,
+    'almanac': bench_almanac,
+    'checksum': bench_checksum,
+    'gpstime': bench_gpstime,
+    'writer': bench_writer,
+    'format': bench_format,
+    'obsread': bench_obsread,
+    'index': bench_index,
+    'merge': bench_merge,
+    'fanout': bench_fanout,
+    'crx': bench_crx,
+}
+
+
+def main():
+    args = argparse.ArgumentParser()
+    args.add_argument('bench', nargs='?', default='all',
+                      choices=['all'] + list(BENCHMARKS),
+                      help='benchmark to run')
+    opts = args.parse_args()
+
+    for name, bench in BENCHMARKS.items():
+        if opts.bench in ('all', name):
+            print("===", name)
+            bench()
+
+
+if __name__ == '__main__':
+    main()
+
+# end of ashbench.py
@@ -0,0 +1,294 @@
+#!/usr/bin/env python3
+
+################################  N8UR ASHCOMM  ################################
+#
+#	Copyright 2019 by John Ackermann, N8UR jra@febo.com https://febo.com
+#	Version number can be found in the ashglobal.py file
+#
+#	This program is free software; you can redistribute it and/or modify
+#	it under the terms of the GNU General Public License as published by
+#	the Free Software Foundation; either version 2 of the License, or
+#	(at your option) any later version.
+#
+#	This program is distributed in the hope that it will be useful,
+#	but WITHOUT ANY WARRANTY; without even the implied warranty of
+#	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#	GNU General Public License for more details.
+#	Software to communicate with Ashtech GPS receivers via serial port.
+################################################################################
+
+#############################   ashcapture.py    ###############################
+
+import os
+import re
+import time
+import json
+import datetime
+import struct
+import threading
+
+from ashframe import *
+from ashutil import *
+from ashtime import *
+
+###############################################################################
+# Raw capture files.  A capture is everything read from the receiver, in
+# the order it arrived, so it can be run through the parser and RINEX
+# writer again later (after a parser fix, say) without re-observing.
+#
+# File layout: the 8-byte magic below, then one record per read:
+#	double	host time.monotonic() when the read returned
+#	ulong	number of data bytes
+#	data
+# all big-endian.  Only differences between timestamps mean anything.
+#
+# A record with the CAPTURE_NOTE bit set in its length is a note rather
+# than data: a JSON object of what the session learned at startup (RID,
+# serial number, GPS week), which it may not have asked the receiver for.
+# Files from before notes ("ASHCAP1") are still read.
+###############################################################################
+
+CAPTURE_MAGIC = b'ASHCAP2\n'
+CAPTURE_MAGICS = (CAPTURE_MAGIC, b'ASHCAP1\n')
+CAPTURE_RECORD = struct.Struct('> d L')
+CAPTURE_NOTE = 0x80000000	# length flag: a note, not receiver data
+CAPTURE_FLUSH = 1.0		# seconds between flushes to disk
+
+# a uZ's SID reply, for captures without notes
+DATE_LINE = re.compile(r'\d\d/\d\d/\d{4}$')
+SERIAL_LINE = re.compile(r'[A-Za-z0-9]+$')
+
+
+class CaptureWriter:
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.file = open(filename, 'wb')
+        self.file.write(CAPTURE_MAGIC)
+        self.lock = threading.Lock()	# reads can come from two threads
+        self.last_flush = time.monotonic()
+        self.bytes = 0
+
+###############################################################################
+# write -- record one read's worth of data
+###############################################################################
+    def write(self, data):
+        self.record(data, len(data))
+        self.bytes += len(data)
+
+###############################################################################
+# note -- record what the session knows that the data may not show, as
+# keyword arguments; see read_capture()
+###############################################################################
+    def note(self, **info):
+        data = json.dumps(info).encode('ascii')
+        self.record(data, len(data) | CAPTURE_NOTE)
+
+###############################################################################
+# record -- append one record, flushing now and then
+###############################################################################
+    def record(self, data, length):
+        now = time.monotonic()
+        with self.lock:
+            if self.file.closed:		# stopped under another thread
+                return
+            self.file.write(CAPTURE_RECORD.pack(now, length))
+            self.file.write(data)
+            if now - self.last_flush > CAPTURE_FLUSH:
+                self.file.flush()
+                self.last_flush = now
+
+###############################################################################
+# close -- flush and close the file; safe to call more than once.  The exit
+# handler may have interrupted a write() on this same thread, so we don't
+# wait long for the lock.
+###############################################################################
+    def close(self):
+        locked = self.lock.acquire(timeout=1.0)
+        try:
+            self.file.close()
+        finally:
+            if locked:
+                self.lock.release()
+
+
+###############################################################################
+# ascii_line -- payload as text if it's a printable ASCII line, else ''
+###############################################################################
+
+
+def ascii_line(payload):
+    text = bytes(payload)
+    if not all(32 <= byte < 127 for byte in text):
+        return ''
+    return text.decode('ascii').rstrip()
+
+###############################################################################
+# read_capture -- generator yielding (timestamp, data) for each data
+# record.  Notes are merged into notes, if given, as they're passed.
+###############################################################################
+
+
+def read_capture(filename, notes=None):
+    with open(filename, 'rb') as reader:
+        if reader.read(len(CAPTURE_MAGIC)) not in CAPTURE_MAGICS:
+            print(filename, "is not an ashcomm capture file!")
+            return
+        while True:
+            record = reader.read(CAPTURE_RECORD.size)
+            if len(record) < CAPTURE_RECORD.size:
+                return
+            timestamp, length = CAPTURE_RECORD.unpack(record)
+            data = reader.read(length & ~CAPTURE_NOTE)
+            if len(data) < length & ~CAPTURE_NOTE:	# truncated by a crash
+                return
+            if not length & CAPTURE_NOTE:
+                yield timestamp, data
+            elif notes is not None:
+                try:
+                    notes.update(json.loads(data.decode('ascii')))
+                except ValueError:
+                    pass
+
+###############################################################################
+###############################################################################
+# AshtechReplay -- stands in for AshtechSerial, feeding a capture file to
+# AshtechMessages.MsgSwitch().  With realtime set, records are released at
+# the pace they were captured; otherwise as fast as the parser will take
+# them.  get_frame() returns None at end of file.
+###############################################################################
+###############################################################################
+
+
+class AshtechReplay:
+
+    def __init__(self, filename, realtime=False, verbose=False):
+        self.filename = filename
+        self.realtime = realtime
+        self.verbose = verbose
+        self.decoder = FrameDecoder()
+        self.records = None
+        self.reader_running = False
+        self.bytes = 0
+
+###############################################################################
+# Prescan -- pick up what the live program learns during startup (receiver
+# ID and serial number, GPS week).  The session notes these in the capture
+# (see CaptureWriter.note()); without notes we have only the receiver's
+# replies to go on.  A uZ's serial number then comes from its SID reply,
+# two bare lines right after the RID reply: a date and then the number.
+# Without one (a run that knew the receiver from ashstate.py doesn't ask)
+# it's left blank.  Such a run doesn't ask for the week either; then it's
+# the week that puts the first PBN's time nearest the capture's date.
+###############################################################################
+    def Prescan(self, g):
+        decoder = FrameDecoder()
+        notes = {}
+        rid = None
+        ser_num = None
+        sid_date = False		# the frame before was the SID date
+        started = False			# binary data has begun
+        pbn_tow = None			# seconds, from the first good PBN
+        for timestamp, data in read_capture(self.filename, notes):
+            decoder.feed(data)
+            for msg_type, payload in decoder:
+                if msg_type in BINARY_LENGTHS:
+                    started = True
+                    sid_date = False
+                    if ser_num is None and rid:
+                        ser_num = ''
+                    if msg_type == 'PBN' and pbn_tow is None and \
+                            verify_chksum(payload[:-2], payload[-2:]):
+                        pbn_tow = struct.unpack_from('> l', payload)[0] / 1000
+                elif msg_type == 'RID':
+                    # the last RID reply is the one QueryRID() made
+                    response = bytes(payload).decode('ascii', 'replace')
+                    response = response.split(',')[1:]
+                    if len(response) >= 5:
+                        response[4] = response[4].split('*', 1)[0]
+                        rid = response
+                        ser_num = None if rid[0] == "UZ" else 0
+                        sid_date = False
+                elif rid and ser_num is None:
+                    text = ascii_line(payload)
+                    if sid_date:
+                        ser_num = text if SERIAL_LINE.match(text) else ''
+                    elif DATE_LINE.match(text):
+                        sid_date = True
+                    else:
+                        ser_num = ''		# no SID query
+                if msg_type in ('WKN', 'DAL') and not g.gps_week:
+                    fields = bytes(payload).split(b',')
+                    index = 1 if msg_type == 'WKN' else 13
+                    if len(fields) > index:
+                        week = fields[index].split(b'*', 1)[0]
+                        if week.isdigit():
+                            g.gps_week = fix_rollover(week)
+            if 'rid' in notes and 'gps_week' in notes:
+                break
+            if started and (g.gps_week or pbn_tow is not None):
+                break
+
+        if 'rid' in notes:
+            rid, ser_num = notes['rid'][:5], notes.get('ser_num', '')
+        if notes.get('gps_week'):
+            g.gps_week = notes['gps_week']
+        elif not g.gps_week and pbn_tow is not None:
+            captured = datetime.datetime.utcfromtimestamp(
+                os.path.getmtime(self.filename))
+            g.gps_week = gps_week_near(pbn_tow, captured)
+            print("No GPS week in the capture; using week", g.gps_week,
+                  "from the PBN time and the capture's date")
+        if rid and not g.rid:
+            g.rx_type = rid[0]
+            g.rx_ser_num = ser_num if ser_num is not None else ''
+            g.rid = rid + [g.rx_ser_num]
+        if self.verbose:
+            print("Capture RID:", g.rid, "GPS week:", g.gps_week)
+
+###############################################################################
+# the parts of the AshtechSerial interface that MsgSwitch uses
+###############################################################################
+    def reset_input(self):
+        pass
+
+    def write(self, message):
+        return len(message)		# nobody is listening
+
+    def StartReader(self):
+        self.records = read_capture(self.filename)
+        self.start = None
+        self.reader_running = True
+
+    def StopReader(self):
+        self.records = None
+        self.reader_running = False
+
+    def Close(self):
+        pass
+
+###############################################################################
+# get_frame -- next (msg_type, payload) from the capture, or None at the
+# end.  payload is a view into the decoder's buffer, good until the next
+# call.
+###############################################################################
+    def get_frame(self, timeout=None):
+        while True:
+            frame = self.decoder.decode()
+            if frame is not None:
+                return frame
+            try:
+                timestamp, data = next(self.records)
+            except StopIteration:
+                return None
+            if self.realtime:
+                now = time.monotonic()
+                if self.start is None:
+                    self.start = (timestamp, now)
+                delay = (timestamp - self.start[0]) - (now - self.start[1])
+                if delay > 0:
+                    time.sleep(delay)
+            self.bytes += len(data)
+            self.decoder.feed(data)
+
+# end of ashcapture.py
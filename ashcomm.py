@@ -33,6 +33,7 @@ from ashrinex import *
 from ashglobal import *
 from ashopt import *
 from asherror import *
+from ashsession import *
 
 ###############################################################################
 # MAIN PROGRAM
@@ -52,48 +53,18 @@ def main():
     original_sigint = signal.getsignal(signal.SIGINT)
     error = AshtechError(original_sigint, g)
     signal.signal(signal.SIGINT, error.exit_handler)
+    signal.signal(signal.SIGTERM, error.exit_handler)
 
-    Serial = AshtechSerial(g.opts['serport'],
-                           g.opts['baud'], g.opts['hwport'], verbose)
-    Commands = AshtechCommands(Serial, g, verbose)
-    RINEX = Rinex(Commands, g, verbose)
-    Messages = AshtechMessages(Serial, Commands,
-                               g, RINEX, verbose)
+    Session = AshtechSession(g, verbose)
+    error.serial = Session.Serial
 
     print()
-    Serial.Open()
+    Session.Start()
 
-    Commands.SetCommand("OUT,A", verbose=0)     # turn off output
-    Serial.reset_input()                        # clean the sluices
-    Serial.reset_output()
+    Session.Messages.MsgSwitch(verbose, timeout=Session.timeout())
     time.sleep(1)
-
-    Commands.QueryRID(verbose=True)
-    print()
-
-#   GetZ12Files()
-
-    g.start_time = datetime.datetime.utcnow()
-    RINEX.create_rinex_obs_file()
-    print()
-
-    gps_week = Messages.GetGPSWeek(verbose)
-    time.sleep(1)
-
-    # set message rate
-    msg_rate = str(g.opts['msg_rate'])
-    print("Setting message rate to", msg_rate, "seconds")
-    Commands.SetCommand("RCI," + msg_rate)
-    time.sleep(1)
-
-    print("Waiting for data; it may take a while...")
-    print()
-
-    Commands.SetCommand("OUT,A,PBN,MBN,BIN", verbose)
-    time.sleep(1)
-    Messages.MsgSwitch(verbose)
-    time.sleep(1)
-    Serial.Close()
+    Session.Serial.Close()
+    Session.RINEX.Close()
 
 
 if __name__ == '__main__':
@@ -30,6 +30,12 @@ from ashtime import *
 
 
 class AshtechCommands:
+    COMMAND_TIMEOUT = 2			# seconds to wait for each ACK/NAK
+
+    # We don't know how big the receiver's command input buffer is, so be
+    # conservative: never have more than this many bytes of commands sent
+    # but not yet acknowledged.
+    RX_INPUT_BUFFER = 64
 
 ###############################################################################
 ###############################################################################
@@ -48,6 +54,45 @@ class AshtechCommands:
         self.SerPort.write(command_string_bytes)
         return
 
+###############################################################################
+# SetCommands -- send a batch of $PASHS set commands and collect the ACK or
+# NAK for each.  Rather than sleeping between commands, we keep sending as
+# long as the unacknowledged ones would fit in the receiver's input buffer
+# and send more as the replies come back.  Each reply has to arrive within
+# timeout seconds of the previous one.  Returns a list with 'ACK', 'NAK' or
+# None (no reply) for each command, in order.
+###############################################################################
+    def SetCommands(self, commands, timeout=COMMAND_TIMEOUT, verbose=False):
+        pending = [b"$PASHS," + bytes(c, 'ascii') + b"\r\n" for c in commands]
+        outstanding = []			# (command, waiter) not yet answered
+        results = []
+
+        while pending or outstanding:
+            while pending and (not outstanding or sum(
+                    len(c) for c, w in outstanding) +
+                    len(pending[0]) <= self.RX_INPUT_BUFFER):
+                command = pending.pop(0)
+                if verbose:
+                    print("SetCommands sent: ", command)
+                waiter = self.SerPort.expect(('ACK', 'NAK'))
+                self.SerPort.write(command)
+                outstanding.append((command, waiter))
+
+            command, waiter = outstanding.pop(0)
+            frame = self.SerPort.collect(waiter, timeout)
+            if frame is None:
+                for command, waiter in outstanding:
+                    self.SerPort.forget(waiter)
+                break
+            results.append(frame[0])
+
+        # whatever is left never got an answer
+        results += [None] * (len(commands) - len(results))
+        for command, result in zip(commands, results):
+            if result != 'ACK':
+                print("Command", command, "failed:", result or "no reply")
+        return results
+
 ###############################################################################
 # QueryCommand -- send $PASHQ query command to Z12; don't wait for response
 ###############################################################################
@@ -84,32 +129,47 @@ class AshtechCommands:
 ###############################################################################
 # QueryRespond -- send a $PASHQ query command to Z12 and return response.  If
 # length specified, read that many bytes and return all, else read to EOL.
-# else return as list with $PASHR and command echo stripped
+# else return as list with $PASHR and command echo stripped.  Safe to use
+# while the reader is running: the reply is picked out of the data stream
+# and the observations carry on to MsgSwitch.
 ###############################################################################
     def QueryRespond(self, command, length=0, verbose=False):
 
         command_string_bytes = b"$PASHQ," + bytes(command, 'ascii') + b"\r\n"
-        self.SerPort.reset_input()		# clear out garbage
-        self.SerPort.reset_output()		# clear out garbage
-        self.SerPort.flush()			# clear out garbage
-
-        self.SerPort.write(command_string_bytes)
-        time.sleep(0.1)
 
         if verbose:
             print("Query sent:", command_string_bytes)
 
-        response = b''
         if length:			# get raw data of length bytes
-            while True:
-                response = self.SerPort.read_anything('', length)
-                break
-            return response
-        else:
-            while True:
-                response = self.SerPort.read_line().decode('ascii')
-                response = response.rstrip("\r\n")
-                break
+            self.SerPort.write(command_string_bytes)
+            return self.SerPort.read_anything('', length)
+
+        # wait for the reply to this query; it starts with the query name
+        frame = self.SerPort.Request(command_string_bytes,
+                                     command.split(',')[0])
+        return self.query_reply(command, frame)
+
+###############################################################################
+# QueryRespondAsync -- QueryRespond for use on the event loop while
+# StartAsyncReader() is feeding MsgSwitch
+###############################################################################
+    async def QueryRespondAsync(self, command, verbose=False):
+        command_string_bytes = b"$PASHQ," + bytes(command, 'ascii') + b"\r\n"
+        if verbose:
+            print("Query sent:", command_string_bytes)
+        frame = await self.SerPort.RequestAsync(command_string_bytes,
+                                                command.split(',')[0])
+        return self.query_reply(command, frame)
+
+###############################################################################
+# query_reply -- turn the reply frame to a query into a string
+###############################################################################
+    def query_reply(self, command, frame):
+        if frame is None:
+            print("No reply to query", command)
+            return ''
+        response = bytes(frame[1]).decode('ascii', 'replace')
+        response = response.rstrip("\r\n")
         return response
 
 ###############################################################################
@@ -121,11 +181,10 @@ class AshtechCommands:
 # QueryRID -- return receiver ID info as list; if verbose pretty print
 ###############################################################################
     def QueryRID(self, verbose=False):
-        response = self.QueryRespond("RID,A").split(',')
-        response = response[1:]
-
-        # sometimes there's a checksum, sometimes there isn't
-        response[4] = response[4].split('*', 1)[0]
+        response = self.rid_fields(self.QueryRespond("RID,A"))
+        if not response:
+            print("Bad RID reply from receiver!")
+            sys.exit(1)
 
         self.g.rx_type = response[0]
 
@@ -133,29 +192,109 @@ class AshtechCommands:
         # with two lines (dummy date field, then SN) so simple query
         # won't work
         if response[0] == "UZ":
+            waiters = [self.SerPort.expect(None), self.SerPort.expect(None)]
             self.QueryCommand("SID")
-            date = self.SerPort.read_line()
-            ser_num = self.SerPort.read_line()
-            ser_num = ser_num.decode('ascii')
+            date, ser_num = [self.SerPort.collect(w) for w in waiters]
+            ser_num = bytes(ser_num[1]).decode('ascii').rstrip() \
+                if ser_num else ''
         else:
             date = ""
             ser_num = 0
         response.append(ser_num)
         self.g.rx_ser_num = ser_num
+        self.g.rid = response
 
         if verbose:
-            # fields: 0 = rx type, 1 = channel option, 2 = nav version,
-            # 3 = options, 4 = channel version
-            string = "Rx type: {}".format(str(response[0]))
-            if ser_num:
-                string += ", SN: {}".format(str(ser_num))
-            string += ", options: {}/{}".format(
-                str(response[1]), str(response[3]))
-            string += ", versions: {}/{}".format(
-                str(response[2]), str(response[4]))
-            print(string)
+            self.show_rid(response)
 
         return response
 
+###############################################################################
+# CheckRID -- one RID query to see whether the receiver on the port is the
+# one whose RID fields (as saved by ashstate.py) we have, at the port speed
+# we think it's using.  If so, adopt them and return True.  Only the RID
+# fields are compared; the serial number comes along with them.
+###############################################################################
+    def CheckRID(self, rid, verbose=False):
+        frame = self.SerPort.Request(b"$PASHQ,RID,A\r\n", 'RID',
+                                     self.SerPort.reply_time())
+        if frame is None:
+            return False
+        response = self.rid_fields(self.query_reply("RID,A", frame))
+        if response != rid[:5]:
+            return False
+
+        self.g.rx_type = rid[0]
+        self.g.rx_ser_num = rid[5]
+        self.g.rid = list(rid)
+        if verbose:
+            self.show_rid(self.g.rid)
+        return True
+
+###############################################################################
+# rid_fields -- the five fields of a RID reply, or None if it's short
+###############################################################################
+    def rid_fields(self, reply):
+        response = reply.split(',')[1:]
+        if len(response) < 5:
+            return None
+
+        # sometimes there's a checksum, sometimes there isn't
+        response[4] = response[4].split('*', 1)[0]
+        return response[:5]
+
+###############################################################################
+# show_rid -- pretty print RID fields plus serial number
+###############################################################################
+    def show_rid(self, rid):
+        # fields: 0 = rx type, 1 = channel option, 2 = nav version,
+        # 3 = options, 4 = channel version, 5 = serial number
+        string = "Rx type: {}".format(str(rid[0]))
+        if rid[5]:
+            string += ", SN: {}".format(str(rid[5]))
+        string += ", options: {}/{}".format(str(rid[1]), str(rid[3]))
+        string += ", versions: {}/{}".format(str(rid[2]), str(rid[4]))
+        print(string)
+
+###############################################################################
+# QueryAlmanac -- ask for the almanac.  The receiver answers with one SAL
+# message per satellite whenever it gets round to it; they go through
+# MsgSwitch to g.almanac, so there's nothing to wait for here.
+###############################################################################
+    def QueryAlmanac(self, verbose=False):
+        self.QueryCommand("SAL", verbose)
+
+###############################################################################
+# QueryStatus -- ask for a handful of status items; returns a dict of the
+# replies (fields after the message name, checksum stripped) keyed by query.
+# Can be called from another thread while MsgSwitch is running.
+###############################################################################
+    STATUS_QUERIES = ('RID', 'PRT', 'PPS', 'WKN')
+
+    def QueryStatus(self, queries=STATUS_QUERIES, verbose=False):
+        status = {}
+        for query in queries:
+            response = self.QueryRespond(query, verbose=verbose)
+            status[query] = self.status_fields(response)
+        return status
+
+###############################################################################
+# QueryStatusAsync -- QueryStatus for use on the event loop
+###############################################################################
+    async def QueryStatusAsync(self, queries=STATUS_QUERIES, verbose=False):
+        status = {}
+        for query in queries:
+            response = await self.QueryRespondAsync(query, verbose=verbose)
+            status[query] = self.status_fields(response)
+        return status
+
+###############################################################################
+# status_fields -- split a reply like "PRT,A,6*2C" into ['A', '6']
+###############################################################################
+    def status_fields(self, response):
+        if not response:
+            return None
+        return response.split('*', 1)[0].split(',')[1:]
+
 
 # end of ashserial.py
@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+
+################################  N8UR ASHCOMM  ################################
+#
+#	Copyright 2019 by John Ackermann, N8UR jra@febo.com https://febo.com
+#	Version number can be found in the ashglobal.py file
+#
+#	This program is free software; you can redistribute it and/or modify
+#	it under the terms of the GNU General Public License as published by
+#	the Free Software Foundation; either version 2 of the License, or
+#	(at your option) any later version.
+#
+#	This program is distributed in the hope that it will be useful,
+#	but WITHOUT ANY WARRANTY; without even the implied warranty of
+#	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#	GNU General Public License for more details.
+#	Software to communicate with Ashtech GPS receivers via serial port.
+################################################################################
+
+#############################   ashcompress.py    ##############################
+
+import os
+import gzip
+import lzma
+import time
+import shutil
+import signal
+import threading
+import multiprocessing
+import concurrent.futures
+
+from ashindex import *
+
+###############################################################################
+# Compressing finished RINEX files without holding up the epochs.  When a
+# file is closed -- rotated out, or at the end of the run -- it's handed to
+# a Compressor, which gzips (".gz") or xz's (".xz") it in a worker process
+# and removes the original once the compressed copy is complete:
+#
+#	compressor = Compressor('gz')
+#	compressor.Submit("SITE291a.26d")	# returns at once
+#	...
+#	compressor.Finish(seconds)	# waits for the rest; prints a summary
+#
+# Finish() is given the seconds of data the files cover, so the summary
+# can give the CPU cost per day of data as well as the run's total.
+#
+# The worker writes to a ".part" name first, so a crash leaves the
+# original in place.  An obs file's index (see ashindex.py) is removed
+# along with it, as its offsets are into the uncompressed file.  Workers
+# ignore Ctrl-C, so the files being compressed when it comes still get
+# finished by Finish() in the exit handler.
+###############################################################################
+
+SUFFIXES = {'gz': '.gz', 'xz': '.xz'}
+GZIP_LEVEL = 6			# gzip's own default; 9 is slower for little gain
+
+###############################################################################
+###############################################################################
+# Compressor -- a worker pool and the totals of what it's done
+###############################################################################
+###############################################################################
+
+
+class Compressor:
+    WORKERS = 1			# a logger has better things to do with its cores
+
+###############################################################################
+###############################################################################
+    def __init__(self, method, workers=WORKERS):
+        if method not in SUFFIXES:
+            raise ValueError("unknown compression: {}".format(method))
+        self.method = method
+        self.workers = workers
+        self.pool = None		# started by the first Submit()
+        self.futures = []
+        self.lock = threading.Lock()
+        self.finished = False		# no more workers
+        self.reported = False		# by Finish(); later files say so
+        self.seconds = None		# of data, as given to Finish()
+        self.files = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.cpu = 0.0			# worker CPU seconds
+        self.errors = []
+
+###############################################################################
+# Submit -- queue filename for compression.  After Finish(), or if the
+# workers couldn't be started, there are none to do it, so it's done here
+# and now; after Finish() nothing else will report it, so it's reported
+# here.
+###############################################################################
+    def Submit(self, filename):
+        with self.lock:
+            if not self.finished:
+                try:
+                    if self.pool is None:
+                        self.pool = concurrent.futures.ProcessPoolExecutor(
+                            self.workers, mp_context=pool_context(),
+                            initializer=ignore_sigint)
+                    self.futures.append((filename, self.pool.submit(
+                        compress_file, filename, self.method)))
+                    return
+                except (OSError, RuntimeError) as e:
+                    # BrokenProcessPool is a RuntimeError; don't try again
+                    print("Compressing without workers:", e)
+                    self.finished = True
+        files = self.files
+        self.compress(filename)
+        if self.reported:
+            if self.files > files:
+                print("Compressed {} after Finish(); now {}".format(
+                    filename, self.Summary()))
+            self.print_errors()
+
+###############################################################################
+# Finish -- wait for everything submitted, shut the workers down and print
+# what was done; seconds is how much data the files cover, for the CPU
+# cost per day.  Safe to call more than once.
+###############################################################################
+    def Finish(self, seconds=None):
+        if seconds:
+            self.seconds = seconds
+        with self.lock:
+            futures, self.futures = self.futures, []
+            self.finished = True
+        for filename, future in futures:
+            try:
+                self.add(future.result())
+            except concurrent.futures.process.BrokenProcessPool:
+                self.compress(filename)
+            except OSError as e:
+                self.errors.append(str(e))
+        if self.pool:
+            self.pool.shutdown()
+            self.pool = None
+        if self.files and not self.reported:
+            print(self.Summary())
+        self.reported = True
+        self.print_errors()
+
+###############################################################################
+# print_errors -- report, once, the files that couldn't be compressed
+###############################################################################
+    def print_errors(self):
+        for error in self.errors:
+            print("Couldn't compress", error)
+        self.errors = []
+
+###############################################################################
+# compress -- compress_file() here rather than in a worker
+###############################################################################
+    def compress(self, filename):
+        try:
+            self.add(compress_file(filename, self.method))
+        except OSError as e:
+            self.errors.append(str(e))
+
+###############################################################################
+# add -- count one compress_file() result
+###############################################################################
+    def add(self, result):
+        bytes_in, bytes_out, cpu = result
+        self.files += 1
+        self.bytes_in += bytes_in
+        self.bytes_out += bytes_out
+        self.cpu += cpu
+
+###############################################################################
+# Summary -- one line: files, sizes, ratio and worker CPU time, in all
+# and, if Finish() was told how much data there was, per day of it
+###############################################################################
+    def Summary(self):
+        summary = "Compressed {} files ({}): {:.1f} MB to {:.1f} MB, " \
+            "{:.1f}:1, {:.1f} CPU seconds".format(
+                self.files, self.method, self.bytes_in / 1e6,
+                self.bytes_out / 1e6,
+                self.bytes_in / max(self.bytes_out, 1), self.cpu)
+        if self.seconds:
+            summary += " ({:.1f} per day of data)".format(
+                self.cpu * 86400 / self.seconds)
+        return summary
+
+###############################################################################
+# NOT IN Compressor class
+###############################################################################
+# compress_file -- compress filename to filename + suffix and remove it,
+# and its index if it has one; runs in a worker.  Returns (bytes in, bytes
+# out, CPU seconds).
+###############################################################################
+
+
+def compress_file(filename, method):
+    start = time.process_time()
+    output = filename + SUFFIXES[method]
+    part = output + ".part"
+    if method == 'gz':
+        opener, options = gzip.open, {'compresslevel': GZIP_LEVEL}
+    else:
+        opener, options = lzma.open, {}
+    try:
+        with open(filename, 'rb') as source, \
+                opener(part, 'wb', **options) as out:
+            shutil.copyfileobj(source, out, 1 << 20)
+        os.replace(part, output)
+    except OSError as e:
+        try:
+            os.remove(part)
+        except OSError:
+            pass
+        raise OSError("{}: {}".format(filename, e)) from None
+    bytes_in = os.path.getsize(filename)
+    os.remove(filename)
+    try:
+        os.remove(index_name(filename))
+    except FileNotFoundError:
+        pass
+    return bytes_in, os.path.getsize(output), time.process_time() - start
+
+###############################################################################
+# pool_context -- start workers from a clean process, not by forking this
+# one with its threads and open files
+###############################################################################
+
+
+def pool_context():
+    if 'forkserver' in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context('forkserver')
+    return multiprocessing.get_context('spawn')
+
+###############################################################################
+# ignore_sigint -- worker initializer: Ctrl-C is for the main process
+###############################################################################
+
+
+def ignore_sigint():
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+# end of ashcompress.py
@@ -0,0 +1,548 @@
+#!/usr/bin/env python3
+
+################################  N8UR ASHCOMM  ################################
+#
+#	Copyright 2019 by John Ackermann, N8UR jra@febo.com https://febo.com
+#	Version number can be found in the ashglobal.py file
+#
+#	This program is free software; you can redistribute it and/or modify
+#	it under the terms of the GNU General Public License as published by
+#	the Free Software Foundation; either version 2 of the License, or
+#	(at your option) any later version.
+#
+#	This program is distributed in the hope that it will be useful,
+#	but WITHOUT ANY WARRANTY; without even the implied warranty of
+#	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#	GNU General Public License for more details.
+#	Software to communicate with Ashtech GPS receivers via serial port.
+################################################################################
+
+#############################   ashcrx.py    ###################################
+
+import os
+import sys
+import time
+import argparse
+import datetime
+
+from ashobsfile import *
+from ashwriter import *
+
+###############################################################################
+# Compact RINEX 1.0 ("Hatanaka" compression) for RINEX 2.11 observation
+# files, done an epoch at a time as the epochs are written instead of by
+# running rnx2crx over the finished file:
+#
+#	encoder = CrxEncoder()
+#	out.write(encoder.Header(header_text))
+#	for record in epoch_records:
+#		out.write(encoder.Epoch(record))
+#
+# Each observable is kept as an integer in units of the last decimal
+# (0.001 for F14.3) and written as its third difference along the arc,
+# the first values of an arc as "3&value" then the first and second
+# differences.  A blank ends the arc.  The epoch line (satellite list
+# joined onto it, clock offset moved to a line of its own) and each
+# satellite's LLI/signal strength flags are written as text differences
+# from the last ones: a space where nothing changed, "&" where a character
+# became a space.  Trailing spaces are dropped everywhere.
+#
+# The result is a quarter to a third the size of the RINEX file and gzips
+# much better than it does.  CrxDecoder turns it back into RINEX, each
+# field in its standard columns, and the command line does either to
+# whole files:
+#
+#	./ashcrx.py SITE2910.26o	# writes SITE2910.26d
+#	./ashcrx.py -d SITE2910.26d	# writes SITE2910.26o
+###############################################################################
+
+ORDER = 3			# differences taken up to this order
+CRX_VERSION = "1.0"
+SATS_PER_LINE = 12		# on the RINEX epoch line
+EVENTS = ('2', '3', '4', '5')	# epoch flags followed by header records
+
+###############################################################################
+###############################################################################
+# CrxEncoder -- RINEX 2.11 text in, Compact RINEX text out
+###############################################################################
+###############################################################################
+
+
+class CrxEncoder:
+
+###############################################################################
+###############################################################################
+    def __init__(self, program="ashcrx.py"):
+        self.program = program
+        self.ntypes = 0
+        self.wrote_header = False
+        self.epoch_line = None		# last epoch line; None to start over
+        self.clock = None		# clock offset arc
+        self.sats = {}			# sat: (arcs, flags) from the last epoch
+					# (flags as the LLIs then the SSIs)
+
+###############################################################################
+# Header -- the header as it goes in the CRX file: the CRINEX lines the
+# first time, then the RINEX header text unchanged
+###############################################################################
+    def Header(self, text):
+        lines = text.splitlines()
+        types = ObsHeader(lines).obs_types
+        if types:
+            self.ntypes = len(types)
+        if self.wrote_header:
+            return text
+        self.wrote_header = True
+        date = datetime.datetime.utcnow().strftime("%d-%b-%y %H:%M")
+        return "{:<20}{:<40}{:<20}\n".format(
+            CRX_VERSION, "COMPACT RINEX FORMAT", "CRINEX VERS   / TYPE") + \
+            "{:<40}{:<20}{:<20}\n".format(
+                self.program, date, "CRINEX PROG / DATE") + text
+
+###############################################################################
+# Epoch -- one epoch record (its epoch line or lines and the observation
+# lines, each ending in a newline), compressed
+###############################################################################
+    def Epoch(self, record):
+        lines = record.split('\n')
+        first = lines[0]
+        if first[28:29] in EVENTS:
+            # an event: written as it is, and the next epoch starts over
+            self.epoch_line = None
+            return '&' + record[1:]
+
+        count = int(first[29:32] or 0)
+        sat_lines = -(-count // SATS_PER_LINE) or 1
+        sats = split_sats(''.join(line[32:68].ljust(36)
+                                  for line in lines[:sat_lines]))[:count]
+        epoch_line = first[:32] + ''.join(sats)
+        if self.epoch_line is None:
+            out = ['&' + epoch_line[1:]]
+            self.clock = None
+            self.sats = {}
+        else:
+            out = [text_diff(self.epoch_line, epoch_line)]
+        self.epoch_line = epoch_line
+
+        clock = first[68:80].strip()
+        if clock:
+            self.clock, field = difference(self.clock, text_int(clock))
+            out.append(field)
+        else:
+            self.clock = None
+            out.append('')
+
+        per_sat = -(-self.ntypes // PER_LINE)
+        width = self.ntypes * FIELD
+        starts = range(0, width, FIELD)
+        last = self.sats
+        self.sats = {}
+        row = sat_lines
+        for sat in sats:
+            block = ''.join(line.ljust(LINE) for line in
+                            lines[row:row + per_sat])
+            row += per_sat
+            arcs, old_flags = last.get(sat) or ([None] * self.ntypes, '')
+            fields = []
+            for j, start in enumerate(starts):
+                text = block[start:start + 14]
+                if text.isspace():
+                    arcs[j] = None
+                    fields.append('')
+                    continue
+                value = text_int(text)
+                arc = arcs[j]
+                if arc is not None and len(arc) == ORDER == 3:
+                    # difference() for a running arc, unrolled
+                    diff1 = value - arc[0]
+                    diff2 = diff1 - arc[1]
+                    fields.append(str(diff2 - arc[2]))
+                    arc[0] = value
+                    arc[1] = diff1
+                    arc[2] = diff2
+                else:
+                    arcs[j], text = difference(arc, value)
+                    fields.append(text)
+            # the flags only need interleaving when they've changed
+            flags = block[14:width:FIELD] + block[15:width:FIELD]
+            self.sats[sat] = (arcs, flags)
+            line = ' '.join(fields)
+            if flags != old_flags:
+                change = text_diff(interleave(old_flags),
+                                   interleave(flags))
+                if change:
+                    line += ' ' + change
+                    out.append(line)
+                    continue
+            out.append(line.rstrip())
+        return '\n'.join(out) + '\n'
+
+###############################################################################
+###############################################################################
+# CrxDecoder -- Compact RINEX text in, RINEX 2.11 text out; fed whole lines
+###############################################################################
+###############################################################################
+
+
+class CrxDecoder:
+
+###############################################################################
+###############################################################################
+    def __init__(self):
+        self.ntypes = 0
+        self.header = []
+        self.in_header = True
+        self.epoch_line = None
+        self.clock = None
+        self.sats = {}
+        self.pending = None		# epoch still waiting for its lines
+        self.special = 0		# event record lines still to copy
+
+###############################################################################
+# Lines -- decode lines (without newlines); returns the RINEX text they
+# complete, if any
+###############################################################################
+    def Lines(self, lines):
+        out = []
+        for line in lines:
+            if self.in_header:
+                self.header_line(line, out)
+            elif self.special:
+                out.append(line + '\n')
+                self.special -= 1
+            elif self.pending is None:
+                self.epoch(line, out)
+            else:
+                self.pending.append(line)
+                if len(self.pending) == self.pending_count:
+                    self.observations(out)
+        return ''.join(out)
+
+###############################################################################
+# header_line -- a header line: the CRINEX ones are dropped
+###############################################################################
+    def header_line(self, line, out):
+        label = line[60:].rstrip()
+        if label.startswith('CRINEX'):
+            return
+        self.header.append(line)
+        out.append(line + '\n')
+        if label == 'END OF HEADER':
+            self.ntypes = len(ObsHeader(self.header).obs_types)
+            self.in_header = False
+
+###############################################################################
+# epoch -- an epoch line, restored from the last one
+###############################################################################
+    def epoch(self, line, out):
+        if line.startswith('&'):
+            epoch_line = ' ' + line[1:]
+            if epoch_line[28:29] in EVENTS:
+                # an event: copied as it is, with its lines
+                self.epoch_line = None
+                out.append(epoch_line + '\n')
+                self.special = int(epoch_line[29:32] or 0)
+                return
+            self.clock = None
+            self.sats = {}
+        else:
+            epoch_line = text_repair(self.epoch_line, line)
+        self.epoch_line = epoch_line
+        # the clock offset line, then a line per satellite
+        self.pending = []
+        self.pending_count = 1 + int(epoch_line[29:32] or 0)
+
+###############################################################################
+# observations -- an epoch's lines are all in: write its RINEX record
+###############################################################################
+    def observations(self, out):
+        epoch_line = self.epoch_line
+        clock_line, sat_lines = self.pending[0], self.pending[1:]
+        self.pending = None
+        if clock_line:
+            self.clock, value = undifference(self.clock, clock_line)
+            clock = int_text(value, 9).rjust(12)
+        else:
+            self.clock = None
+            clock = ''
+
+        sats = split_sats(epoch_line[32:])
+        for i in range(0, max(len(sats), 1), SATS_PER_LINE):
+            head = epoch_line[:32] if i == 0 else ' ' * 32
+            line = head + ''.join(sats[i:i + SATS_PER_LINE])
+            if i == 0 and clock:
+                line = line.ljust(68) + clock
+            out.append(line + '\n')
+
+        last = self.sats
+        self.sats = {}
+        for sat, line in zip(sats, sat_lines):
+            parts = line.split(' ', self.ntypes)
+            parts += [''] * (self.ntypes + 1 - len(parts))
+            arcs, old_flags = last.get(sat) or ([None] * self.ntypes, '')
+            flags = text_repair(old_flags, parts[self.ntypes]). \
+                ljust(2 * self.ntypes)
+            fields = []
+            for j in range(self.ntypes):
+                if parts[j]:
+                    arcs[j], value = undifference(arcs[j], parts[j])
+                    fields.append(int_text(value, 3).rjust(14))
+                else:
+                    arcs[j] = None
+                    fields.append(' ' * 14)
+                fields.append(flags[2 * j:2 * j + 2])
+            self.sats[sat] = (arcs, flags)
+            for j in range(0, self.ntypes, PER_LINE):
+                out.append(''.join(fields[2 * j:2 * j + 2 * PER_LINE]).
+                           rstrip() + '\n')
+
+###############################################################################
+# CrxWriter -- a RinexWriter that writes Compact RINEX: header text given
+# to Write() and epoch records given to WriteBytes() with their time are
+# compressed on the way through.  There's no index; offsets into a CRX
+# file are no use to a reader, which has to start from the top.
+###############################################################################
+
+
+class CrxWriter(RinexWriter):
+
+###############################################################################
+###############################################################################
+    def __init__(self, filename, mode='a', program="ashcrx.py", **kwargs):
+        kwargs['index'] = False
+        super().__init__(filename, mode, **kwargs)
+        self.encoder = CrxEncoder(program)
+        self.cpu = 0.0			# seconds spent encoding
+
+###############################################################################
+# Write -- header lines
+###############################################################################
+    def Write(self, lines, time=None):
+        text = self.encoder.Header(''.join(lines))
+        super().WriteBytes(text.encode('ascii', 'replace'))
+
+###############################################################################
+# WriteBytes -- one epoch record
+###############################################################################
+    def WriteBytes(self, data, time=None):
+        super().WriteBytes(self.encode(data))
+
+###############################################################################
+# encode -- one epoch record, as bytes, compressed; the CPU time it takes
+# is added up in cpu
+###############################################################################
+    def encode(self, data):
+        start = time.process_time()
+        text = self.encoder.Epoch(data.decode('ascii', 'replace'))
+        self.cpu += time.process_time() - start
+        return text.encode('ascii')
+
+###############################################################################
+# NOT IN CrxEncoder class
+###############################################################################
+# crx_name -- the CRX name for a RINEX obs name: ".yyo" becomes ".yyd",
+# anything else gets ".crx" added
+###############################################################################
+
+
+def crx_name(filename):
+    base, ext = os.path.splitext(filename)
+    if len(ext) == 4 and ext[-1:] in ('o', 'O'):
+        return base + ext[:-1] + ('d' if ext[-1] == 'o' else 'D')
+    return filename + '.crx'
+
+###############################################################################
+# rinex_name -- the other way round
+###############################################################################
+
+
+def rinex_name(filename):
+    base, ext = os.path.splitext(filename)
+    if len(ext) == 4 and ext[-1:] in ('d', 'D'):
+        return base + ext[:-1] + ('o' if ext[-1] == 'd' else 'O')
+    if ext == '.crx':
+        return base
+    return filename + '.rnx'
+
+###############################################################################
+# split_sats -- satellite ids from the run of three-character ones on an
+# epoch line
+###############################################################################
+
+
+def split_sats(text):
+    text = text.rstrip()
+    return [text[i:i + 3] for i in range(0, len(text), 3)]
+
+###############################################################################
+# text_int -- a fixed point field ("-1234.567") as an integer in units of
+# its last decimal
+###############################################################################
+
+
+def text_int(text):
+    return int(text.replace('.', ''))
+
+###############################################################################
+# int_text -- and back, with places decimals
+###############################################################################
+
+
+def int_text(value, places):
+    sign = '-' if value < 0 else ''
+    whole, fraction = divmod(abs(value), 10 ** places)
+    return "{}{}.{:0{}d}".format(sign, whole, fraction, places)
+
+###############################################################################
+# difference -- next value on an arc: returns the arc's new state and the
+# field to write.  arc is None to start one, else the last value and its
+# differences up to ORDER - 1.
+###############################################################################
+
+
+def difference(arc, value):
+    if arc is None:
+        return [value], "{}&{}".format(ORDER, value)
+    new = [value]
+    for last in arc:
+        value -= last
+        new.append(value)
+    return new[:ORDER], str(value)
+
+###############################################################################
+# undifference -- difference() backwards: the arc's new state and the value
+###############################################################################
+
+
+def undifference(arc, field):
+    if '&' in field:
+        value = int(field.split('&')[1])
+        return [value], value
+    value = int(field)
+    new = [value]
+    for last in reversed(arc):
+        value += last
+        new.append(value)
+    new.reverse()
+    return new[:ORDER], value
+
+###############################################################################
+# interleave -- flags kept as all the LLIs then all the signal strengths,
+# in the CRX order of each observation's LLI and signal strength together
+###############################################################################
+
+
+def interleave(flags):
+    half = len(flags) // 2
+    return ''.join(map(str.__add__, flags[:half], flags[half:]))
+
+###############################################################################
+# text_diff -- new written as a change from old: a space where they're the
+# same, "&" where new has a space, otherwise new's character
+###############################################################################
+
+
+def text_diff(old, new):
+    if old == new:
+        return ''
+    width = max(len(old), len(new))
+    return ''.join(' ' if a == b else ('&' if b == ' ' else b)
+                   for a, b in zip(old.ljust(width),
+                                   new.ljust(width))).rstrip()
+
+###############################################################################
+# text_repair -- text_diff() backwards
+###############################################################################
+
+
+def text_repair(old, change):
+    width = max(len(old), len(change))
+    return ''.join(a if c == ' ' else (' ' if c == '&' else c)
+                   for a, c in zip(old.ljust(width),
+                                   change.ljust(width))).rstrip()
+
+###############################################################################
+# compress_obs -- RINEX obs file to CRX; returns the epochs written
+###############################################################################
+
+
+def compress_obs(filename, output):
+    obs = ObsFile(filename)
+    try:
+        writer = CrxWriter(output, 'w')
+        writer.Write([obs.header.Text()])
+        count = 0
+        for epoch in obs:
+            writer.WriteBytes(obs.map[epoch.offset:epoch.end], epoch.time)
+            count += 1
+        writer.Close()
+    finally:
+        obs.Close()
+    return count
+
+###############################################################################
+# expand_crx -- CRX file back to RINEX
+###############################################################################
+
+
+def expand_crx(filename, output):
+    decoder = CrxDecoder()
+    with open(filename, 'r', encoding='ascii', errors='replace',
+              newline='') as source, \
+            open(output, 'w', encoding='ascii', newline='') as out:
+        lines = []
+        for line in source:
+            lines.append(line.rstrip('\r\n'))
+            if len(lines) == 1000:
+                out.write(decoder.Lines(lines))
+                lines = []
+        out.write(decoder.Lines(lines))
+        if decoder.in_header or decoder.pending:
+            raise ValueError("{} ends part way through".format(filename))
+
+###############################################################################
+# main -- command line
+###############################################################################
+
+
+def main():
+    args = argparse.ArgumentParser(
+        description='Compact RINEX (Hatanaka) compression of RINEX 2.11 '
+        'observation files')
+    args.add_argument('files', nargs='+', metavar='FILE',
+                      help='RINEX obs files (.yyo), or CRX files with -d')
+    args.add_argument('-d', '--decompress', action='store_true',
+                      help='CRX to RINEX instead')
+    args.add_argument('-f', '--force', action='store_true',
+                      help='overwrite output files that exist')
+    opts = args.parse_args()
+
+    for filename in opts.files:
+        if opts.decompress:
+            output = rinex_name(filename)
+        else:
+            output = crx_name(filename)
+        if os.path.exists(output) and not opts.force:
+            print(output, "already exists; use --force to overwrite it")
+            sys.exit(1)
+        start = time.process_time()
+        try:
+            if opts.decompress:
+                expand_crx(filename, output)
+                print(filename, "->", output)
+            else:
+                count = compress_obs(filename, output)
+                print("{} -> {}: {} epochs, {:.1f}% of the size".format(
+                    filename, output, count, 100 *
+                    os.path.getsize(output) / os.path.getsize(filename)),
+                    end='')
+                print(", {:.2f} s".format(time.process_time() - start))
+        except (OSError, ValueError) as e:
+            print("Can't convert", filename, ":", e)
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
+
+# end of ashcrx.py
@@ -0,0 +1,492 @@
+#!/usr/bin/env python3
+
+################################  N8UR ASHCOMM  ################################
+#
+#	Copyright 2019 by John Ackermann, N8UR jra@febo.com https://febo.com
+#	Version number can be found in the ashglobal.py file
+#
+#	This program is free software; you can redistribute it and/or modify
+#	it under the terms of the GNU General Public License as published by
+#	the Free Software Foundation; either version 2 of the License, or
+#	(at your option) any later version.
+#
+#	This program is distributed in the hope that it will be useful,
+#	but WITHOUT ANY WARRANTY; without even the implied warranty of
+#	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#	GNU General Public License for more details.
+#	Software to communicate with Ashtech GPS receivers via serial port.
+################################################################################
+
+#############################   ashemu.py    ###################################
+
+import os
+import pty
+import sys
+import tty
+import math
+import time
+import random
+import heapq
+import select
+import struct
+import termios
+import argparse
+
+from ashglobal import *
+from ashutil import *
+from ashtime import *
+from ashhandler import *
+
+###############################################################################
+# ashemu.py pretends to be a Z12 or micro-Z on a pseudo-terminal, so the
+# rest of the suite can be exercised (and load- or soak-tested) without a
+# receiver.  Run it, then point ashcomm.py at the device name it prints.
+#
+# It answers the queries and set commands that ashcomm.py uses during
+# startup and for status (PRT, RID, SID, PPS, SAL, WKN, SPD, RCI, OUT,
+# NME), and once told "OUT,A,PBN,MBN,BIN" it streams one MBN per satellite
+# per epoch followed by a PBN (and with SNV in the list, ephemerides every
+# two hours), with valid checksums and observables that change smoothly
+# from epoch to epoch.  Output is paced to the emulated baud rate, so a
+# configuration that can't fit down the wire shows up as overruns just as
+# it would on a real receiver.  Frames can be corrupted or dropped on
+# purpose to test resynchronisation.
+###############################################################################
+
+BAUDRATES = [300, 600, 1200, 2400, 4800, 9600, 19200, 38400, 57600, 115200]
+
+# termios speed constants, so we can see what speed the host side set
+TERMIOS_SPEEDS = dict((getattr(termios, 'B' + str(b)), b) for b in BAUDRATES)
+
+L1_WAVELENGTH = 0.190293672798	# meters
+L2_WAVELENGTH = 0.244210213425
+
+MBN_STRUCT = struct.Struct(AshtechGlobals.mben_struct.replace('\t', ' ')
+                           .replace('\n', ' '))
+PBN_STRUCT = struct.Struct(AshtechGlobals.pben_struct)
+SNV_STRUCT = SnvHandler.record
+SAL_STRUCT = SalHandler.record
+
+###############################################################################
+# nmea_checksum -- XOR of everything between '$' and '*'
+###############################################################################
+
+
+def nmea_checksum(sentence):
+    return sentence + b'*%02X\r\n' % xor_checksum(sentence[1:])
+
+
+class AshtechEmulator:
+
+    def __init__(self, opts):
+        self.opts = opts
+        self.rx_type = opts.rx_type
+        self.baud = opts.speed			# receiver's port speed
+        self.rate = opts.rate			# seconds between epochs
+        self.sats = opts.sats
+        self.streaming = False			# OUT,A,PBN,MBN,BIN
+        self.send_snv = False			# OUT,A,PBN,MBN,SNV,BIN
+        self.last_toe = None			# ephemeris last sent
+        self.nmea = False			# OUT,A,NMEA
+        self.nmea_per = 1			# NME,PER
+        self.dal = False			# NME,DAL,A,ON
+        self.next_dal = 0
+
+        self.master, self.slave = pty.openpty()
+        tty.setraw(self.master)
+        tty.setraw(self.slave)
+        os.set_blocking(self.master, False)
+        self.name = os.ttyname(self.slave)
+        self.inbuf = b''
+
+        # pending output: heap of (time due, sequence, bytes)
+        self.pending = []
+        self.sequence = 0
+        self.line_free = 0.0		# when the emulated wire is idle again
+
+        self.stats = dict.fromkeys(['epochs', 'frames', 'bytes', 'dropped',
+                                    'corrupted', 'overruns', 'lost',
+                                    'commands'], 0)
+        self.running = False
+
+###############################################################################
+# host_baud -- the speed the host side has set on the pty, or None if it's
+# not one we know (or we've been told not to care)
+###############################################################################
+    def host_baud(self):
+        if not self.opts.strict_baud:
+            return self.baud
+        speed = termios.tcgetattr(self.slave)[4]
+        return TERMIOS_SPEEDS.get(speed)
+
+###############################################################################
+# send -- queue bytes for the host; flush_output() writes them when they're
+# due, in order, paced to the emulated line rate
+###############################################################################
+    def send(self, data, due=None):
+        if due is None:
+            due = time.monotonic()
+        self.sequence += 1
+        heapq.heappush(self.pending, (due, self.sequence, data))
+
+    def flush_output(self):
+        while self.pending and self.pending[0][0] <= time.monotonic():
+            due, sequence, data = heapq.heappop(self.pending)
+            # wait for the wire to finish with what we sent last
+            now = time.monotonic()
+            if self.line_free > now:
+                time.sleep(self.line_free - now)
+            # a real receiver doesn't wait for the host to read, so if
+            # the pty is full the data is lost
+            try:
+                written = os.write(self.master, data)
+            except BlockingIOError:
+                written = 0
+            if written < len(data):
+                self.stats['lost'] += len(data) - written
+            self.line_free = time.monotonic() + len(data) * 10.0 / self.baud
+            self.stats['bytes'] += written
+
+###############################################################################
+# reply -- send an ASCII "$PASHR," response with checksum
+###############################################################################
+    def reply(self, text):
+        if self.host_baud() != self.baud:
+            # wrong speed; the host would see garbage
+            self.send(bytes(random.getrandbits(8) for i in range(8)))
+            return
+        self.send(nmea_checksum(b'$PASHR,' + text.encode('ascii')))
+
+    def ack(self):
+        self.reply('ACK')
+
+    def nak(self):
+        self.reply('NAK')
+
+###############################################################################
+# command -- handle one line from the host
+###############################################################################
+    def command(self, line):
+        self.stats['commands'] += 1
+        line = line.strip().decode('ascii', 'replace')
+        if '*' in line:
+            line = line.split('*', 1)[0]
+        fields = line.split(',')
+        if self.opts.verbose:
+            print("host:", line)
+        if len(fields) < 2:
+            return
+
+        if fields[0] == '$PASHQ':
+            query = fields[1]
+            if query == 'PRT':
+                self.reply('PRT,A,{}'.format(BAUDRATES.index(self.baud)))
+            elif query == 'RID':
+                self.reply('RID,{},12,{},-AEXMPRTUY-M-,1C59'.format(
+                    self.rx_type, 'UC00' if self.rx_type == 'UZ' else '1L03'))
+            elif query == 'SID' and self.rx_type == 'UZ':
+                # two bare lines: a date, then the serial number
+                self.send(b'$PASHR,06/15/2004\r\n')
+                self.send(b'$PASHR,' +
+                          self.opts.serial_number.encode('ascii') + b'\r\n')
+            elif query == 'SAL':
+                week, tow = self.gps_time()
+                for prn in self.sats:
+                    self.send(self.sal(week, tow, prn))
+            elif query == 'PPS':
+                self.reply('PPS,1.0,+0000.0000,R')
+            elif query == 'WKN' and self.rx_type == 'UZ':
+                week, tow = self.gps_time()
+                self.reply('WKN,{}'.format(week % 1024))
+            else:
+                self.nak()
+
+        elif fields[0] == '$PASHS':
+            if self.host_baud() != self.baud:
+                return
+            cmd = fields[1]
+            if cmd == 'SPD' and len(fields) > 3:
+                self.ack()
+                self.flush_output()
+                self.baud = BAUDRATES[int(fields[3])]
+                return
+            elif cmd == 'RCI' and len(fields) > 2:
+                self.rate = float(fields[2])
+            elif cmd == 'OUT':
+                self.streaming = 'MBN' in fields and 'PBN' in fields
+                self.nmea = 'NMEA' in fields
+                self.send_snv = 'SNV' in fields
+                self.last_toe = None
+                if self.streaming:
+                    week, tow = self.gps_time()
+                    self.next_epoch = (math.floor(tow / self.rate) + 1) * \
+                        self.rate
+            elif cmd == 'NME' and len(fields) > 2:
+                if fields[2] == 'PER':
+                    self.nmea_per = float(fields[3])
+                elif fields[2] == 'DAL':
+                    self.dal = fields[-1] == 'ON'
+                    self.next_dal = time.monotonic() + self.nmea_per
+                elif fields[2] == 'ALL':
+                    self.dal = False
+            self.ack()
+
+###############################################################################
+# gps_time -- current (full) GPS week and time of week from the host clock
+###############################################################################
+    def gps_time(self):
+        now = time.time() + AshtechGlobals.LEAPSECONDS - 315964800
+        week, tow = divmod(now, 604800)
+        return int(week), tow
+
+###############################################################################
+# dal -- one DAL almanac sentence; ashcomm only looks at the week field
+###############################################################################
+    def dal_sentence(self):
+        week, tow = self.gps_time()
+        prn = self.sats[0]
+        fields = [prn, 0, '4.1E-03', 319488, '3.0E-01', '-2.6E-09',
+                  '5153.6', '-1.2E+00', '9.1E-01', '2.3E+00', '-1.4E-04',
+                  '0.0E+00', week % 1024]
+        sentence = 'DAL,' + ','.join(str(f) for f in fields)
+        return nmea_checksum(b'$PASHR,' + sentence.encode('ascii'))
+
+###############################################################################
+# mbn -- one MBN record for prn at time of week tow
+###############################################################################
+    def mbn(self, tow, prn, left, channel):
+        seq = int(round((tow % 1800) * 20))
+
+        # range swings between about 20,000 and 26,000 km twice a day
+        angle = 2 * math.pi * tow / 43082.0 + prn
+        distance = 2.3e7 + 3.0e6 * math.sin(angle)
+        rate = 3.0e6 * math.cos(angle) * 2 * math.pi / 43082.0
+        seconds = distance / (AshtechGlobals.LIGHTSPEED * 1000.0)
+        el = 10 + (prn * 7) % 80
+        az = (prn * 23) % 180
+
+        values = [seq, left, prn, el, az, channel]
+        for band, wavelength in ((0, L1_WAVELENGTH), (1, L1_WAVELENGTH),
+                                 (2, L2_WAVELENGTH)):
+            phase = distance / wavelength
+            doppler = -rate / wavelength
+            snr = 120 + (prn * 5) % 80 - band * 10
+            values += [0, 24, b'\x00', snr, 0, phase, seconds,
+                       int(doppler * 10000), 0]
+        payload = MBN_STRUCT.pack(*values)
+        return b'$PASHR,MPC,' + payload + bytes([xor_checksum(payload)]) + \
+            b'\r\n'
+
+###############################################################################
+# pbn -- position message for time of week tow
+###############################################################################
+    def pbn(self, tow):
+        payload = PBN_STRUCT.pack(int(round(tow * 1000)), b'????',
+                                  518038.16, -4660158.70, 4273406.88,
+                                  0.0, 0.0, 0.0, 0.0, 0.0, 180)
+        chksum = word_checksum(payload)
+        return b'$PASHR,PBN,' + payload + struct.pack('> H', chksum) + \
+            b'\r\n'
+
+###############################################################################
+# snv -- ephemeris message for prn, reference time toe; made-up but
+# plausible orbital elements, with the IODE changing every toe
+###############################################################################
+    def snv(self, week, tow, prn, toe):
+        payload = SNV_STRUCT.pack(
+            week % 1024, int(tow), 1.0e-9 * prn, toe // 7200 % 1024, toe,
+            0.0, 1.0e-12 * prn, 1.0e-5 * prn, toe // 7200 % 256,
+            1.5e-9, prn / 32.0 - 0.5, 0.01 + prn / 3200.0, 5153.6, toe,
+            1.0e-7, 200.0, -1.0e-7, 50.0, 2.0e-6, 8.0e-6,
+            prn / 16.0 - 1.0, 0.25, 0.3, -2.6e-9, 1.0e-10,
+            0, 0, 0, prn - 1, 0)
+        chksum = word_checksum(payload)
+        return b'$PASHR,SNV,' + payload + struct.pack('> H', chksum) + \
+            b'\r\n'
+
+###############################################################################
+# sal -- almanac message for prn: six planes, evenly spaced in each
+###############################################################################
+    def sal(self, week, tow, prn):
+        toa = int(tow // 4096) * 4096
+        payload = SAL_STRUCT.pack(
+            prn - 1, 0, 0.005, toa, 0.0083, -2.6e-9, 5153.6,
+            ((prn % 6) / 3.0 + 1.0) % 2.0 - 1.0, 0.25,
+            ((prn // 6) / 3.0 + prn % 6 / 18.0 + 1.0) % 2.0 - 1.0,
+            0.0, 0.0, week % 256, week % 1024, int(tow))
+        chksum = word_checksum(payload)
+        return b'$PASHR,SAL,' + payload + struct.pack('> H', chksum) + \
+            b'\r\n'
+
+###############################################################################
+# mangle -- maybe drop or corrupt a frame
+###############################################################################
+    def mangle(self, frame):
+        if random.random() < self.opts.drop:
+            self.stats['dropped'] += 1
+            return b''
+        if random.random() < self.opts.corrupt:
+            self.stats['corrupted'] += 1
+            frame = bytearray(frame)
+            frame[random.randrange(len(frame))] ^= 1 << random.randrange(8)
+            frame = bytes(frame)
+        self.stats['frames'] += 1
+        return frame
+
+###############################################################################
+# epoch -- queue the MBN burst for one epoch and the PBN that follows it
+###############################################################################
+    def epoch(self, tow):
+        now = time.monotonic()
+        if self.line_free > now + self.rate:
+            self.stats['overruns'] += 1	# wire can't keep up
+
+        burst = b''
+        toe = int(tow // 7200) * 7200
+        if self.send_snv and toe != self.last_toe:	# new ephemerides
+            week, now_tow = self.gps_time()
+            for prn in self.sats:
+                burst += self.mangle(self.snv(week, tow, prn, toe))
+            self.last_toe = toe
+        for i, prn in enumerate(self.sats):
+            burst += self.mangle(self.mbn(tow, prn, len(self.sats) - i - 1,
+                                          i + 1))
+        self.send(burst)
+
+        # the PBN comes out a few seconds later; don't let it slip past
+        # the next epoch
+        delay = min(self.opts.pbn_delay, self.rate / 2)
+        self.send(self.mangle(self.pbn(tow)), now + delay)
+        self.stats['epochs'] += 1
+
+###############################################################################
+# run -- main loop
+###############################################################################
+    def run(self):
+        print("Emulating", self.rx_type, "on", self.name, "at", self.baud,
+              "baud")
+        sys.stdout.flush()
+        started = time.monotonic()
+        next_stats = started + self.opts.stats
+        self.running = True
+        while self.running:
+            now = time.monotonic()
+            if self.opts.duration and now - started > self.opts.duration:
+                break
+
+            # work out how long we can sleep
+            wake = [next_stats]
+            if self.pending:
+                wake.append(self.pending[0][0])
+            if self.streaming:
+                week, tow = self.gps_time()
+                wake.append(now + self.next_epoch - tow)
+            if self.dal and self.nmea:
+                wake.append(self.next_dal)
+            timeout = max(0, min(wake) - now)
+
+            ready, _, _ = select.select([self.master], [], [], timeout)
+            if ready:
+                try:
+                    self.inbuf += os.read(self.master, 1024)
+                except OSError:			# host closed the port
+                    self.inbuf = b''
+                while b'\n' in self.inbuf:
+                    line, self.inbuf = self.inbuf.split(b'\n', 1)
+                    self.command(line)
+
+            if self.streaming:
+                week, tow = self.gps_time()
+                if tow >= self.next_epoch:
+                    self.epoch(self.next_epoch % 604800)
+                    self.next_epoch += self.rate
+                    if self.next_epoch < tow:		# fell behind
+                        self.stats['overruns'] += 1
+                        self.next_epoch = \
+                            (math.floor(tow / self.rate) + 1) * self.rate
+
+            if self.dal and self.nmea and time.monotonic() >= self.next_dal:
+                self.send(self.dal_sentence())
+                self.next_dal = time.monotonic() + self.nmea_per
+
+            self.flush_output()
+
+            if time.monotonic() >= next_stats:
+                self.print_stats(time.monotonic() - started)
+                next_stats += self.opts.stats
+
+        self.print_stats(time.monotonic() - started)
+
+    def stop(self):
+        self.running = False
+
+    def print_stats(self, elapsed):
+        print("{:9.0f} s: ".format(elapsed) +
+              ", ".join("{} {}".format(k, v) for k, v in self.stats.items()))
+        sys.stdout.flush()
+
+    def close(self):
+        os.close(self.master)
+        os.close(self.slave)
+
+###############################################################################
+# getargs -- command line options
+###############################################################################
+
+
+def getargs(argv=None):
+    args = argparse.ArgumentParser(
+        description='Z12 / micro-Z receiver emulator on a pseudo-terminal')
+    args.add_argument('--rx_type', default='UZ', choices=['UZ', 'Z12'],
+                      help='receiver to emulate')
+    args.add_argument('--serial_number', default='ZR520021234', type=str,
+                      help='micro-Z serial number')
+    args.add_argument('--speed', default=115200, type=int, choices=BAUDRATES,
+                      help='initial receiver port speed')
+    args.add_argument('--strict_baud', default=False, action='store_true',
+                      help='only answer when the host pty speed matches')
+    args.add_argument('--rate', default=1.0, type=float,
+                      help='seconds between epochs (0.1 = 10 Hz)')
+    args.add_argument('--sats', default=12, type=int,
+                      help='satellites per epoch (max 32)')
+    args.add_argument('--pbn_delay', default=3.0, type=float,
+                      help='seconds from MBN burst to PBN')
+    args.add_argument('--corrupt', default=0.0, type=float,
+                      help='probability of flipping a bit in a frame')
+    args.add_argument('--drop', default=0.0, type=float,
+                      help='probability of dropping a frame')
+    args.add_argument('--duration', default=0, type=float,
+                      help='seconds to run (0 = forever)')
+    args.add_argument('--stats', default=60, type=float,
+                      help='seconds between statistics lines')
+    args.add_argument('--seed', default=None, type=int,
+                      help='random seed for corruption/drops')
+    args.add_argument('-v', '--verbose', default=False, action='store_true',
+                      help='print commands from the host')
+    opts = args.parse_args(argv)
+
+    # spread the PRNs out a bit rather than 1..n
+    count = max(1, min(opts.sats, 32))
+    opts.sats = sorted((i * 5) % 32 + 1 for i in range(count))
+    return opts
+
+###############################################################################
+# MAIN PROGRAM
+###############################################################################
+
+
+def main():
+    opts = getargs()
+    random.seed(opts.seed)
+    emulator = AshtechEmulator(opts)
+    try:
+        emulator.run()
+    except KeyboardInterrupt:
+        pass
+    emulator.close()
+
+
+if __name__ == '__main__':
+    main()
+
+# end of ashemu.py
@@ -0,0 +1,305 @@
+#!/usr/bin/env python3
+
+################################  N8UR ASHCOMM  ################################
+#
+#	Copyright 2019 by John Ackermann, N8UR jra@febo.com https://febo.com
+#	Version number can be found in the ashglobal.py file
+#
+#	This program is free software; you can redistribute it and/or modify
+#	it under the terms of the GNU General Public License as published by
+#	the Free Software Foundation; either version 2 of the License, or
+#	(at your option) any later version.
+#
+#	This program is distributed in the hope that it will be useful,
+#	but WITHOUT ANY WARRANTY; without even the implied warranty of
+#	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#	GNU General Public License for more details.
+#	Software to communicate with Ashtech GPS receivers via serial port.
+################################################################################
+
+#############################   ashepoch.py    #################################
+
+from array import array
+
+from ashtime import *
+
+###############################################################################
+# The observations for one epoch live in an Epoch: one fixed-size array per
+# observable, indexed by PRN (slot 0 unused), and a bitmask saying which
+# PRNs are present.  Epochs come from an EpochPool and go back to it once
+# written, so a running session allocates no per-satellite objects at all.
+# Columns are plain array.array objects; numpy.frombuffer() can view them
+# without copying.
+###############################################################################
+
+MAX_PRN = 32
+BANDS = ('ca', 'l1', 'l2')
+
+SEQ_MS = 50			# MBN seq counts 50 ms...
+SEQ_SPAN_MS = 1800000		# ...modulo 30 minutes
+
+# per-band columns, in the order of Epoch.bands
+BAND_COLUMNS = (('snr', 'd'), ('phase', 'd'), ('range', 'd'), ('dopp', 'd'),
+                ('lli', 'B'), ('phase_lli', 'B'), ('sbyte', 'B'))
+
+EPOCH_COLUMNS = (('el', 'B'), ('az', 'H'), ('ch_id', 'B')) + tuple(
+    (band + '_' + name, typecode)
+    for band in BANDS for name, typecode in BAND_COLUMNS)
+
+###############################################################################
+###############################################################################
+# Epoch -- observations for all satellites at one epoch
+###############################################################################
+###############################################################################
+
+
+class Epoch:
+    __slots__ = ('seq', 'time', 'closed', 'pben', 'fix',
+                 'present', 'count', 'bands') + \
+        tuple(name for name, typecode in EPOCH_COLUMNS)
+
+###############################################################################
+###############################################################################
+    def __init__(self):
+        for name, typecode in EPOCH_COLUMNS:
+            setattr(self, name, array(typecode, [0]) * (MAX_PRN + 1))
+        # the columns for each band, for code that loops over bands
+        self.bands = tuple(
+            tuple(getattr(self, band + '_' + name)
+                  for name, typecode in BAND_COLUMNS)
+            for band in BANDS)
+        self.Clear()
+
+###############################################################################
+# Clear -- forget all satellites; the columns themselves aren't touched
+###############################################################################
+    def Clear(self):
+        self.seq = None
+        self.time = None		# GpsTime; see EpochAssembler
+        self.closed = False	# the last MBN (struct_left 0) arrived
+        self.pben = None	# the matching PBN, and its fix
+        self.fix = None
+        self.present = 0
+        self.count = 0
+
+###############################################################################
+# Mark -- note that prn has data in this epoch
+###############################################################################
+    def Mark(self, prn):
+        bit = 1 << prn
+        if not self.present & bit:
+            self.present |= bit
+            self.count += 1
+
+###############################################################################
+# Has -- True if prn has data in this epoch
+###############################################################################
+    def Has(self, prn):
+        return bool(self.present & (1 << prn))
+
+###############################################################################
+# prns -- PRNs present, in ascending order
+###############################################################################
+    def prns(self):
+        mask = self.present
+        while mask:
+            low = mask & -mask
+            yield low.bit_length() - 1
+            mask ^= low
+
+###############################################################################
+###############################################################################
+# EpochPool -- recycles Epochs.  Get() returns a cleared one; Release()
+# hands it back when the consumer is done with it.
+###############################################################################
+###############################################################################
+
+
+class EpochPool:
+
+###############################################################################
+###############################################################################
+    def __init__(self, size=4):
+        self.size = size
+        self.free = [Epoch() for i in range(size)]
+        self.created = size
+
+###############################################################################
+# Get -- a cleared epoch, from the pool if there's one left
+###############################################################################
+    def Get(self):
+        if self.free:
+            return self.free.pop()
+        self.created += 1
+        return Epoch()
+
+###############################################################################
+# Release -- return an epoch to the pool
+###############################################################################
+    def Release(self, epoch):
+        epoch.Clear()
+        if len(self.free) < self.size:
+            self.free.append(epoch)
+
+###############################################################################
+# seq_time -- GpsTime of an MBN seq value.  seq only counts 50 ms steps
+# modulo 30 minutes, so it is placed relative to a time known to be within
+# 15 minutes of it (the last PBN); GpsTime takes care of week rollover.
+###############################################################################
+
+
+def seq_time(near, seq):
+    ms = near.ms - near.ms % SEQ_SPAN_MS + seq * SEQ_MS
+    if ms < near.ms - SEQ_SPAN_MS // 2:
+        ms += SEQ_SPAN_MS
+    elif ms > near.ms + SEQ_SPAN_MS // 2:
+        ms -= SEQ_SPAN_MS
+    return GpsTime(near.week, ms)
+
+###############################################################################
+###############################################################################
+# EpochAssembler -- builds epochs out of MBN records and the PBN that follows
+# them.  Epochs are keyed by their GpsTime, so several can be in
+# flight at once: the MBNs for one epoch take a second or so to arrive and
+# its PBN comes about three seconds after that (see the notes at the end of
+# ashglobal.py), by which time the next epoch's MBNs are well under way.
+#
+# An epoch is handed out by Ready() when its PBN arrives.  One that never
+# gets a PBN is handed out anyway once it is more than deadline ms older
+# than the newest epoch, once more than depth epochs are in flight, or once
+# a later epoch's PBN has arrived; Flush() hands out everything left at the
+# end of a run.  Epochs always come out in time order, and anything that
+# arrives for an epoch that has already gone is dropped.  Every one of these
+# cases is counted in stats.
+###############################################################################
+###############################################################################
+
+ASSEMBLER_COUNTERS = (
+    'epochs',		# epochs started
+    'complete',		# handed out with their PBN
+    'deadline',		# handed out without a PBN: too old
+    'overflow',		# handed out without a PBN: too many in flight
+    'superseded',	# handed out without a PBN: a later PBN arrived
+    'drained',		# handed out without a PBN by Flush()
+    'unclosed',		# handed out without their last MBN
+    'merged',		# MBNs for an epoch other than the newest
+    'duplicates',	# MBNs for a PRN the epoch already had
+    'late_mbn',		# MBNs dropped: epoch already handed out
+    'orphan_pbn',	# PBNs dropped: no epoch in flight for them
+    'untimed',		# MBNs dropped: no PBN yet to place them in time
+)
+
+
+class EpochAssembler:
+    DEPTH = 16			# epochs in flight
+    DEADLINE = 10000		# ms an epoch waits for its PBN
+
+###############################################################################
+###############################################################################
+    def __init__(self, pool, depth=DEPTH, deadline=DEADLINE):
+        self.pool = pool
+        self.depth = depth
+        self.deadline = deadline
+        self.flight = {}		# key -> Epoch
+        self.ready = []			# handed out, oldest first
+        self.newest = None		# key of the newest epoch in flight
+        self.last = None		# key of the last epoch handed out
+        self.stats = dict.fromkeys(ASSEMBLER_COUNTERS, 0)
+
+###############################################################################
+# Add -- the epoch an MBN for prn at GpsTime key belongs in, started if
+# need be; None if that epoch has already been handed out
+###############################################################################
+    def Add(self, key, prn):
+        epoch = self.flight.get(key)
+        if epoch is None:
+            if self.last is not None and key <= self.last:
+                self.stats['late_mbn'] += 1
+                return None
+            epoch = self.pool.Get()
+            epoch.time = key
+            self.flight[key] = epoch
+            self.stats['epochs'] += 1
+            if self.newest is None or key > self.newest:
+                self.newest = key
+                self.expire()
+            if len(self.flight) > self.depth:
+                self.hand_out(min(self.flight), 'overflow')
+            if key not in self.flight:	# we just handed it out
+                return None
+        elif key != self.newest:
+            self.stats['merged'] += 1
+
+        if epoch.Has(prn):
+            self.stats['duplicates'] += 1
+        return epoch
+
+###############################################################################
+# Untimed -- count an MBN that arrived before we knew the time
+###############################################################################
+    def Untimed(self):
+        self.stats['untimed'] += 1
+
+###############################################################################
+# Attach -- give the epoch at GpsTime key its PBN and fix and hand it
+# out, along with any older epochs still waiting.  Returns the epoch, or
+# None if there's nothing in flight for this PBN.
+###############################################################################
+    def Attach(self, key, pben, fix):
+        epoch = self.flight.get(key)
+        if epoch is None:
+            self.stats['orphan_pbn'] += 1
+            return None
+
+        epoch.pben = pben
+        epoch.fix = fix
+        for older in sorted(k for k in self.flight if k < key):
+            self.hand_out(older, 'superseded')
+        self.hand_out(key, 'complete')
+        return epoch
+
+###############################################################################
+# Flush -- hand out everything still in flight
+###############################################################################
+    def Flush(self):
+        for key in sorted(self.flight):
+            self.hand_out(key, 'drained')
+
+###############################################################################
+# Ready -- epochs handed out since the last call, oldest first.  The
+# caller gives each back to the pool when it's done with it.
+###############################################################################
+    def Ready(self):
+        ready = self.ready
+        self.ready = []
+        return ready
+
+###############################################################################
+# Summary -- the counters, on one line
+###############################################################################
+    def Summary(self):
+        return ", ".join("{} {}".format(name.replace('_', ' '), count)
+                         for name, count in self.stats.items())
+
+###############################################################################
+# expire -- hand out epochs that have waited too long for their PBN
+###############################################################################
+    def expire(self):
+        limit = self.newest.total - self.deadline
+        for key in sorted(self.flight):
+            if key.total >= limit:
+                break
+            self.hand_out(key, 'deadline')
+
+###############################################################################
+# hand_out -- move the epoch at key from in flight to ready
+###############################################################################
+    def hand_out(self, key, reason):
+        epoch = self.flight.pop(key)
+        self.stats[reason] += 1
+        if not epoch.closed:
+            self.stats['unclosed'] += 1
+        self.last = key
+        self.ready.append(epoch)
+
+# end of ashepoch.py
@@ -35,12 +35,14 @@ from ashopt import *
 
 class AshtechError:
 
-    def __init__(self, original_sigint, g):
+    def __init__(self, original_sigint, g, serial=None):
         self.original_sigint = original_sigint
         self.g = g
+        self.serial = serial		# AshtechSerial, once there is one
 
 ###############################################################################
-# exit_handler -- grab CTRL+C and exit gracefully
+# exit_handler -- grab CTRL+C (or SIGTERM) and exit gracefully, with the
+# RINEX files and the raw capture flushed and closed
 ###############################################################################
 
     def exit_handler(self, signum, frame):
@@ -48,6 +50,7 @@ class AshtechError:
         def real_handler(signum, frame):
             # restore the original signal handler
             signal.signal(signal.SIGINT, self.original_sigint)
+            self.close_files()
             self.stats()
             sys.exit(1)
             try:
@@ -62,6 +65,14 @@ class AshtechError:
 
         real_handler(signum, frame)
 
+###############################################################################
+# close_files -- flush and close the RINEX files and the capture file
+###############################################################################
+    def close_files(self):
+        close_rinex_files(self.g)
+        if self.serial:
+            self.serial.StopCapture()
+
 ###############################################################################
 # stats -- prints session details for the exit handler
 ###############################################################################
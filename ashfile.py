@@ -396,6 +396,7 @@ def main():
                            g.opts['baud'], g.opts['hwport'], verbose)
     Commands = AshtechCommands(Serial, g, verbose)
     ZFile = AshtechFile(Serial, Commands, g, verbose)
+    error.serial = Serial
 
     print()
     Serial.Open()
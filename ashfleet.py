@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+
+################################  N8UR ASHCOMM  ################################
+#
+#	Copyright 2019 by John Ackermann, N8UR jra@febo.com https://febo.com
+#	Version number can be found in the ashglobal.py file
+#
+#	This program is free software; you can redistribute it and/or modify
+#	it under the terms of the GNU General Public License as published by
+#	the Free Software Foundation; either version 2 of the License, or
+#	(at your option) any later version.
+#
+#	This program is distributed in the hope that it will be useful,
+#	but WITHOUT ANY WARRANTY; without even the implied warranty of
+#	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#	GNU General Public License for more details.
+#	Software to communicate with Ashtech GPS receivers via serial port.
+################################################################################
+
+#############################   ashfleet.py    #################################
+
+import sys
+import signal
+import asyncio
+
+from ashglobal import *
+from ashopt import *
+from asherror import *
+from ashsession import *
+
+###############################################################################
+# ashfleet.py runs several receivers from one process on a single asyncio
+# event loop.  It takes the same options as ashcomm.py, except that
+# --serport and --site_name may be comma-separated lists, one entry per
+# receiver.  Each receiver gets its own session state and its own RINEX
+# file; if there are fewer site names than ports, the last site name is
+# reused with the receiver number appended so the file names don't collide.
+###############################################################################
+
+###############################################################################
+# make_sessions -- build one AshtechSession per serial port
+###############################################################################
+
+
+def make_sessions(opts, verbose):
+    ports = [p for p in opts['serport'].split(',') if p]
+    sites = [s for s in opts['site_name'].split(',') if s] or ['NONE']
+
+    sessions = []
+    for i, port in enumerate(ports):
+        if i < len(sites):
+            site = sites[i]
+        else:
+            site = sites[-1][:3] + str(i)
+        g = AshtechGlobals()
+        g.opts = dict(opts)
+        g.opts['serport'] = port
+        g.opts['site_name'] = site
+        if len(ports) > 1:			# one file per receiver
+            g.opts['rinex_file'] = ''
+            if opts['capture']:
+                g.opts['capture'] = opts['capture'] + '.' + str(i)
+        sessions.append(AshtechSession(g, verbose))
+    return sessions
+
+###############################################################################
+# run_fleet -- run all sessions until they have all stopped
+###############################################################################
+
+
+async def run_fleet(sessions):
+    results = await asyncio.gather(*(s.Run() for s in sessions),
+                                   return_exceptions=True)
+    for session, result in zip(sessions, results):
+        if isinstance(result, BaseException):
+            print(session.g.opts['serport'] + ":", result)
+
+###############################################################################
+# MAIN PROGRAM
+###############################################################################
+
+
+def main():
+    g = AshtechGlobals()
+    option = AshtechOpts(g)
+
+    option.getargs()
+    verbose = g.opts['verbose']
+    if verbose:
+        print("Verbose mode")
+
+    sessions = make_sessions(g.opts, verbose)
+    print("Running", len(sessions), "receivers:",
+          ", ".join(s.g.opts['serport'] for s in sessions))
+
+    # on Ctrl-C or SIGTERM, close the files and print stats for every
+    # receiver
+    original_sigint = signal.getsignal(signal.SIGINT)
+    errors = [AshtechError(original_sigint, s.g, s.Serial) for s in sessions]
+
+    def exit_handler(signum, frame):
+        signal.signal(signal.SIGINT, original_sigint)
+        for error in errors:
+            error.close_files()
+            error.stats()
+        sys.exit(1)
+
+    signal.signal(signal.SIGINT, exit_handler)
+    signal.signal(signal.SIGTERM, exit_handler)
+
+    asyncio.run(run_fleet(sessions))
+
+
+if __name__ == '__main__':
+    main()
+
+# end of ashfleet.py
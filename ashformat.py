@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+
+################################  N8UR ASHCOMM  ################################
+#
+#	Copyright 2019 by John Ackermann, N8UR jra@febo.com https://febo.com
+#	Version number can be found in the ashglobal.py file
+#
+#	This program is free software; you can redistribute it and/or modify
+#	it under the terms of the GNU General Public License as published by
+#	the Free Software Foundation; either version 2 of the License, or
+#	(at your option) any later version.
+#
+#	This program is distributed in the hope that it will be useful,
+#	but WITHOUT ANY WARRANTY; without even the implied warranty of
+#	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#	GNU General Public License for more details.
+#	Software to communicate with Ashtech GPS receivers via serial port.
+################################################################################
+
+#############################   ashformat.py    ################################
+
+from operator import itemgetter
+from itertools import chain
+
+###############################################################################
+# EpochFormatter -- turns the satellites of an Epoch into RINEX observation
+# lines in one go.  The layout is a tuple of lines, each a tuple of fields;
+# a field is a %-format fragment and the Epoch columns that fill it, e.g.
+#
+#	("%14.3f%1d%1d", ('ca_range', 'ca_lli', 'ca_sbyte'))
+#
+# with 'prn' standing for the PRN itself.  The fragments for a whole epoch
+# are joined into one template (kept per satellite count), the column values
+# gathered into one flat tuple, and a single % builds the block.
+#
+# With blank set, an observation the receiver reported as exactly zero is
+# written as blanks, flags included, as RINEX asks for missing data.
+# Satellites with such fields are formatted on their own, with a template
+# kept for each pattern of missing fields.
+###############################################################################
+
+
+class EpochFormatter:
+
+###############################################################################
+###############################################################################
+    def __init__(self, layout, blank=False):
+        self.blank = blank
+        fields = [field for line in layout for field in line]
+        self.names = [name for fragment, names in fields for name in names]
+
+        # per field: where its values start in a row, how many, and the
+        # blanks that replace it; the first column is the observation
+        self.fields = []
+        start = 0
+        for fragment, names in fields:
+            width = len(fragment % ((0,) * len(names)))
+            can_blank = names[0] != 'prn'
+            self.fields.append((start, len(names), " " * width, can_blank))
+            start += len(names)
+
+        # the satellite template, with a newline after each line
+        self.fragments = []
+        for line in layout:
+            self.fragments += [fragment for fragment, names in line]
+            self.fragments[-1] += "\n"
+        self.template = "".join(self.fragments)
+        self.epoch_templates = {}	# satellite count -> template
+        self.blank_templates = {}	# missing fields -> template
+
+###############################################################################
+# Format -- the observation lines for epoch, as one string
+###############################################################################
+    def Format(self, epoch):
+        prns = list(epoch.prns())
+        count = len(prns)
+        if not count:
+            return ""
+
+        if count == 1:
+            prn = prns[0]
+            columns = [(prn,) if name == 'prn' else
+                       (getattr(epoch, name)[prn],) for name in self.names]
+        else:
+            get = itemgetter(*prns)
+            columns = [tuple(prns) if name == 'prn' else
+                       get(getattr(epoch, name)) for name in self.names]
+        rows = zip(*columns)
+
+        if self.blank:
+            rows = list(rows)
+            if any(self.missing(row) for row in rows):
+                return "".join(self.format_row(row) for row in rows)
+
+        template = self.epoch_templates.get(count)
+        if template is None:
+            template = self.epoch_templates[count] = self.template * count
+        return template % tuple(chain.from_iterable(rows))
+
+###############################################################################
+# missing -- which fields of a satellite's row are zero, as a tuple of
+# field numbers (empty if none)
+###############################################################################
+    def missing(self, row):
+        return tuple(i for i, (start, size, blanks, can_blank)
+                     in enumerate(self.fields)
+                     if can_blank and row[start] == 0)
+
+###############################################################################
+# format_row -- one satellite, with its missing fields blank
+###############################################################################
+    def format_row(self, row):
+        missing = self.missing(row)
+        if not missing:
+            return self.template % row
+
+        template = self.blank_templates.get(missing)
+        if template is None:
+            fragments = list(self.fragments)
+            for i in missing:
+                blanks = self.fields[i][2]
+                # keep the newline if the field ends a line
+                fragments[i] = blanks + ("\n" if fragments[i][-1:] == "\n"
+                                         else "")
+            template = self.blank_templates[missing] = "".join(fragments)
+
+        values = [value for i, (start, size, blanks, can_blank)
+                  in enumerate(self.fields) if i not in missing
+                  for value in row[start:start + size]]
+        return template % tuple(values)
+
+# end of ashformat.py
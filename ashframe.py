@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+
+################################  N8UR ASHCOMM  ################################
+#
+#	Copyright 2019 by John Ackermann, N8UR jra@febo.com https://febo.com
+#	Version number can be found in the ashglobal.py file
+#
+#	This program is free software; you can redistribute it and/or modify
+#	it under the terms of the GNU General Public License as published by
+#	the Free Software Foundation; either version 2 of the License, or
+#	(at your option) any later version.
+#
+#	This program is distributed in the hope that it will be useful,
+#	but WITHOUT ANY WARRANTY; without even the implied warranty of
+#	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#	GNU General Public License for more details.
+#	Software to communicate with Ashtech GPS receivers via serial port.
+################################################################################
+
+#############################   ashframe.py    #################################
+
+###############################################################################
+# RingBuffer -- fixed-size byte buffer that the serial reader drains into.
+# Bytes are appended at "tail" and consumed from "head"; when the free
+# space at the end runs out, the unread bytes are slid back to the start
+# of the buffer rather than reallocating.  If the consumer falls so far
+# behind that even that isn't enough, the oldest bytes are thrown away.
+###############################################################################
+
+RING_SIZE = 65536
+
+
+class RingBuffer:
+
+    def __init__(self, size=RING_SIZE):
+        self.buf = bytearray(size)
+        self.size = size
+        self.head = 0			# first unread byte
+        self.tail = 0			# one past last byte written
+        self.dropped = 0		# bytes lost to overflow
+
+    def __len__(self):
+        return self.tail - self.head
+
+###############################################################################
+# compact -- slide unread bytes to the start of the buffer
+###############################################################################
+    def compact(self):
+        count = self.tail - self.head
+        if self.head:
+            self.buf[0:count] = self.buf[self.head:self.tail]
+            self.head = 0
+            self.tail = count
+
+###############################################################################
+# write -- append bytes, compacting or dropping old data if necessary
+###############################################################################
+    def write(self, data):
+        count = len(data)
+        if count > self.size:			# keep only the newest data
+            self.dropped += len(self) + count - self.size
+            data = data[-self.size:]
+            count = self.size
+            self.head = self.tail = 0
+        if self.tail + count > self.size:
+            self.compact()
+        if self.tail + count > self.size:
+            overflow = self.tail + count - self.size
+            self.dropped += overflow
+            self.head += overflow
+            self.compact()
+        self.buf[self.tail:self.tail + count] = data
+        self.tail += count
+        return count
+
+###############################################################################
+# find -- offset (relative to head) of sub in unread data, or -1
+###############################################################################
+    def find(self, sub, start=0):
+        index = self.buf.find(sub, self.head + start, self.tail)
+        if index < 0:
+            return index
+        return index - self.head
+
+###############################################################################
+# peek -- return count unread bytes as bytes without consuming them
+###############################################################################
+    def peek(self, count):
+        return bytes(self.buf[self.head:self.head + count])
+
+###############################################################################
+# consume -- discard count bytes from the head of the buffer
+###############################################################################
+    def consume(self, count):
+        self.head = min(self.head + count, self.tail)
+        if self.head == self.tail:
+            self.head = self.tail = 0
+
+###############################################################################
+# clear -- throw away everything
+###############################################################################
+    def clear(self):
+        self.head = self.tail = 0
+
+###############################################################################
+# FrameDecoder -- split the receiver's output into messages.
+#
+# The receiver interleaves binary "$PASHR,XXX," messages with ASCII lines
+# ("$PASHR,RID,...", "$PASHR,ACK*3D", NMEA sentences).  Binary payloads can
+# contain anything, including crlf and "$PASHR", so we can't frame on
+# delimiters.  Instead, for each binary type we know the payload size (from
+# the Z-12 manual; checksum included) and take exactly that many bytes,
+# then insist on the crlf that should follow.  If it isn't there the frame
+# is bogus: skip a byte and hunt for the next '$'.  Anything that isn't a
+# known binary type is read as a line up to crlf.
+#
+# Frames are returned as (msg_type, payload) where payload is a memoryview
+# into the ring buffer, so nothing is copied.  The view is only good until
+# the next feed(); copy it (bytes(payload)) if you need to keep it.  For
+# binary messages payload is the raw data plus checksum; for ASCII lines
+# it is everything after "$PASHR," (or after "$" for NMEA) minus the crlf,
+# which is what read_line() has always returned.
+###############################################################################
+
+# payload bytes after "$PASHR,XXX," up to (not including) crlf
+BINARY_LENGTHS = {
+    'MPC': 95,		# MBN measurement: 94 + 1 byte checksum
+    'PBN': 56,		# position: 54 + 2 byte checksum
+    'SNV': 132,		# ephemeris: 130 + 2 byte checksum
+    'SAL': 70,		# almanac: 68 + 2 byte checksum
+    'EPB': 125,		# "nn," prn field, 120 raw subframe bytes, checksum
+}
+
+HEADER = b'$PASHR,'
+HEADER_LEN = len(HEADER) + 4		# "$PASHR,XXX,"
+MAX_LINE = 512				# longest ASCII line we believe
+
+
+class FrameDecoder:
+
+    def __init__(self, size=RING_SIZE):
+        self.ring = RingBuffer(size)
+        self.view = memoryview(self.ring.buf)
+        self.frames = 0			# messages decoded
+        self.resyncs = 0		# times we lost and regained sync
+        self.skipped = 0		# garbage bytes thrown away
+
+###############################################################################
+# feed -- add bytes from the receiver
+###############################################################################
+    def feed(self, data):
+        return self.ring.write(data)
+
+###############################################################################
+# skip -- throw away count bytes of garbage
+###############################################################################
+    def skip(self, count):
+        self.ring.consume(count)
+        self.skipped += count
+
+###############################################################################
+# decode -- return the next complete frame, or None if more data is needed
+###############################################################################
+    def decode(self):
+        ring = self.ring
+        buf = ring.buf
+        view = self.view
+        while True:
+            head = ring.head
+            tail = ring.tail
+            if head == tail:
+                return None
+
+            # every message starts with '$'
+            if buf[head] != 0x24:
+                start = buf.find(b'$', head, tail)
+                self.resyncs += 1
+                if start < 0:
+                    self.skip(tail - head)
+                    return None
+                self.skip(start - head)
+                continue
+
+            if tail - head < HEADER_LEN:
+                return None
+
+            if buf.startswith(HEADER, head):
+                msg_type = buf[head + 7:head + 10].decode('ascii', 'replace')
+                length = BINARY_LENGTHS.get(msg_type)
+                if length and buf[head + 10] == 0x2c:
+                    start = head + HEADER_LEN
+                    end = start + length
+                    if end + 2 > tail:
+                        if end + 2 - head > ring.size:	# can't ever fit
+                            self.skip(1)
+                            continue
+                        return None
+                    if buf[end] != 0x0d or buf[end + 1] != 0x0a:
+                        self.skip(1)		# not really a header
+                        continue
+                    ring.head = end + 2
+                    self.frames += 1
+                    return msg_type, view[start:end]
+                start = head + len(HEADER)
+            else:				# NMEA or other '$' line
+                start = head + 1
+                msg_type = None
+
+            # ASCII line; look for the crlf
+            end = buf.find(b'\r\n', head, tail)
+            if end < 0:
+                if tail - head > MAX_LINE:
+                    self.skip(1)
+                    continue
+                return None
+            if end - head > MAX_LINE:
+                self.skip(1)
+                continue
+            if msg_type is None:
+                msg_type = buf[start:start + 5].decode('ascii', 'replace')
+            ring.head = end + 2
+            self.frames += 1
+            return msg_type.strip(), view[start:end]
+
+###############################################################################
+# __iter__ -- iterate over all complete frames currently buffered
+###############################################################################
+    def __iter__(self):
+        return iter(self.decode, None)
+
+# end of ashframe.py
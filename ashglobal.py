@@ -20,6 +20,9 @@
 #############################   ashglobal.py    ################################
 
 from ashglobal import *
+from ashepoch import *
+from ashnav import *
+from ashalmanac import *
 from ashserial import *
 from ashcommand import *
 from ashutil import *
@@ -31,10 +34,60 @@ from ashrinex import *
 
 class AshtechGlobals:
 
-    ###############################################################################
-    ###############################################################################
+###############################################################################
+# Everything that changes while a receiver is running lives on the instance,
+# so each AshtechGlobals is the session state for one receiver and a single
+# process can drive several of them.  Constants and message layouts, which
+# are the same for every receiver, stay on the class.
+###############################################################################
     def __init__(self):
-        pass
+
+        # command line options (set by argparse)
+        self.opts = dict.fromkeys(self.opt_keys, None)  # make empty dict
+
+        self.rx_type = None			# set by QueryRID()
+        self.rx_ser_num = None			# set by QueryRID() if rx_type = "UZ"
+        self.rid = None			# full QueryRID() result
+
+        # mben observations (see ashepoch.py); epochs are assembled in
+        # AshtechMessages and epoch is the one being written
+        self.epoch_pool = EpochPool(8)
+        self.epoch = None
+
+        # pben navigation message
+        self.current_pben = dict.fromkeys(self.pben_keys, None)
+        self.current_pben_epoch = None	# GpsTime, set in parse_pben()
+        self.current_fix = None
+
+        # time stuff
+        self.first_observation = GpsTime(0, 0)	# set in write_epoch()
+        self.first_observation_string = ""	# set in write_epoch()
+        self.start_time = None			# set in main()
+        self.obs_epoch_count = 0		# set in write_obs_epoch()
+
+        # for convenience, week and current tow are kept in separate variables
+        self.gps_week = 0		# set in get_gps_week()
+        self.gps_tow = None		# set by parse_pben()
+        self.last_tow = 0		# set by parse_pben()
+
+        # stuff for building RINEX files
+        self.obs_filename = ""			# from create_obs_file()
+        self.obs_writer = None			# RinexWriter; see ashwriter.py
+        self.next_obs_writer = None		# opened ahead for --rotate
+        self.next_obs_thread = None		# ... by this thread
+        self.retiring = []			# threads closing rotated-out files
+        self.obs_outputs = []			# --decimate files; see ObsOutput
+        self.compressor = None			# --compress; see ashcompress.py
+        self.wrote_rinex_obs_file_header = False  # set by write_rinex_obs()
+        self.nav_filename = ""			# from create_rinex_nav_file()
+        self.nav_writer = None
+        self.nav_record_count = 0		# set in write_rinex_nav()
+
+        # broadcast ephemerides from SNV messages (see ashnav.py)
+        self.ephemeris = EphemerisCache()
+
+        # almanac from SAL messages (see ashalmanac.py)
+        self.almanac = Almanac()
 
 ###############################################################################
 # Constants
@@ -73,12 +126,12 @@ class AshtechGlobals:
                 'elmask', 'dopmask', 'site_name', 'project_name', 'msg_rate',
                 'operator', 'comment', 'marker', 'marker_number', 'observer',
                 'agency', 'rx_number', 'antenna_number', 'antenna_type',
-                'antenna_height', 'antenna_east', 'antenna_north']
-
-    opts = dict.fromkeys(opt_keys, None)  # make empty dict
+                'antenna_height', 'antenna_east', 'antenna_north',
+                'capture', 'realtime', 'nav', 'flush_secs', 'fsync_epochs',
+                'state_dir', 'rotate', 'rinex_version', 'blank_missing',
+                'index', 'decimate', 'hatanaka', 'compress']
 
-    rx_type = None					# set by QueryRID()
-    rx_ser_num = None				# set by QueryRID() if rx_type = "UZ"
+    # the options themselves are per-receiver; see __init__()
 
 ###############################################################################
 # mben measurement has the key observation data.  There is one data dictionary
@@ -86,7 +139,7 @@ class AshtechGlobals:
 # but remember list starts with element 0) provides # a slot for each of
 # the GPS satellites; the appropriate position is filled in for the
 # satellites received in each epoch.  The entire list is cleared before
-# writing a new epoch.
+# writing a new epoch.  The list itself is per-receiver (see __init__()).
 #
 # Z12 manual says 97 bytes including checksum but counting fields yields
 # 95.  There's a set of common values followed by three identical sets of
@@ -107,7 +160,7 @@ class AshtechGlobals:
         'l1_phase', 'l1_range', 'l1_dopp', 'l1_correction',
 
         'l2_warn', 'l2_goodbad', 'l2_spare', 'l2_snr', 'l2_qual',
-        'l2_phase', 'l2_range', 'l2_dopp', 'l1_correction']
+        'l2_phase', 'l2_range', 'l2_dopp', 'l2_correction']
 
     mben_flag_keys = [
         'ca_phase_lli', 'ca_phase_sbyte',
@@ -122,15 +175,6 @@ class AshtechGlobals:
         'l2_range_lli', 'l2_range_sbyte',
         'l2_dopp_lli', 'l2_dopp_sbyte']
 
-    # make empty structs
-    mben_dict = dict.fromkeys(mben_keys, None)
-    mben_flag_dict = dict.fromkeys(mben_flag_keys, None)
-
-    mben_list = [None] * 33         # current observables; index = PRN (1-32)
-    mben_flag_list = [None] * 33    # current observables; index = PRN
-    mben_list_full = False          # keep track of messages per epoch
-    current_mben_epoch = GPS_Time(0, 0)  # set in parse_mben()
-    current_mben_epoch_string = ""
 
 ###############################################################################
 # pben is "navigation" message which includes time of week, llh, vlvlvh,
@@ -141,35 +185,6 @@ class AshtechGlobals:
     pben_keys = ['tow', 'site', 'navx', 'navy', 'navz', 'offset',
                  'velx', 'vely', 'velz', 'drift', 'pdop']
 
-    current_pben = dict.fromkeys(pben_keys, None)  # make empty dict
-    new_pben = False        # toggles in MsgSwitch
-    current_pben_epoch = GPS_Time(0, 0)  # set in parse_pben()
-    current_pben_epoch_string = ""  # set in parse_pben()
-    current_fix = [None]
-
-    # this contains all the data for one epoch
-    epoch_data = [mben_list, current_pben]
-
-###############################################################################
-# time stuff
-    first_observation = GPS_Time(0, 0)     # set in parse_pben()
-    first_observation_string = ""  # set in parse_pben()
-
-    # these have to be available in the exit hanlder. how???
-    start_time = None			# set in main()
-    obs_epoch_count = 0	        	# set in write_obs_epoch()
-
-    # for convenience, week and current tow are kept in separate variables
-    gps_week = 0		# set in get_gps_week()
-    gps_tow = 0			# set by parse_pben()
-    last_tow = 0                # set by parse_pben()
-
-###############################################################################
-# stuff for building RINEX files
-###############################################################################
-    obs_filename = ""						# from create_obs_file()
-    wrote_rinex_obs_file_header = False		# set by write_rinex_obs_epoch()
-
 ###############################################################################
 # GENERAL COMMENTS FOR THE BENEFIT OF FUTURE GENERATIONS
 ###############################################################################
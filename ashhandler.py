@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+
+################################  N8UR ASHCOMM  ################################
+#
+#	Copyright 2019 by John Ackermann, N8UR jra@febo.com https://febo.com
+#	Version number can be found in the ashglobal.py file
+#
+#	This program is free software; you can redistribute it and/or modify
+#	it under the terms of the GNU General Public License as published by
+#	the Free Software Foundation; either version 2 of the License, or
+#	(at your option) any later version.
+#
+#	This program is distributed in the hope that it will be useful,
+#	but WITHOUT ANY WARRANTY; without even the implied warranty of
+#	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#	GNU General Public License for more details.
+#	Software to communicate with Ashtech GPS receivers via serial port.
+################################################################################
+
+#############################   ashhandler.py    ###############################
+
+import struct
+
+from ashutil import *
+
+###############################################################################
+# Message dispatch.  AshtechMessages keeps a MessageRegistry that maps each
+# message type ("MPC", "SNV", ...) to a handler object; HandleFrame() looks
+# the type up in a dict, so adding a message type means registering a
+# handler, not editing the loop.
+#
+# A handler's consumers subscribe to it as "sinks" (any callable taking the
+# decoded message).  Handlers with no sinks skip decoding altogether, so
+# messages nobody uses cost one dict lookup.  Handlers whose parsing keeps
+# session state (MBN and PBN feed the RINEX writer) are registered as
+# required and always run.
+###############################################################################
+
+###############################################################################
+###############################################################################
+# MessageHandler -- base handler; Decode() returns the raw payload.  parse,
+# if given, is used instead of Decode().
+###############################################################################
+###############################################################################
+
+
+class MessageHandler:
+
+###############################################################################
+###############################################################################
+    def __init__(self, parse=None, required=False):
+        self.parse = parse or self.Decode
+        self.required = required
+        self.sinks = []
+        self.count = 0				# messages seen
+        self.skipped = 0			# ... and not decoded
+        self.errors = 0				# ... and failed to decode
+
+###############################################################################
+# Subscribe -- have sink(message) called with each decoded message
+###############################################################################
+    def Subscribe(self, sink):
+        self.sinks.append(sink)
+
+###############################################################################
+# Unsubscribe -- stop calling sink
+###############################################################################
+    def Unsubscribe(self, sink):
+        if sink in self.sinks:
+            self.sinks.remove(sink)
+
+###############################################################################
+# Handle -- decode payload if anybody wants it and pass it on to the sinks
+###############################################################################
+    def Handle(self, payload, verbose=False):
+        self.count += 1
+        if not (self.sinks or self.required):
+            self.skipped += 1
+            return None
+        message = self.parse(payload, verbose)
+        if message is None:
+            return None
+        for sink in self.sinks:
+            sink(message)
+        return message
+
+###############################################################################
+# Decode -- turn the payload into a message; None if it's no good
+###############################################################################
+    def Decode(self, payload, verbose=False):
+        return bytes(payload)
+
+###############################################################################
+# check -- strip and verify the checksum of a binary payload; returns the
+# payload without it, or None (and counts an error) if it's wrong
+###############################################################################
+    def check(self, payload, length):
+        message = payload[:-length]
+        if not verify_chksum(message, payload[-length:]):
+            self.errors += 1
+            print("Checksum error!")
+            return None
+        return message
+
+###############################################################################
+###############################################################################
+# SnvHandler -- $PASHR,SNV ephemeris: 130 bytes plus checksum.  Returns a
+# dict of the broadcast ephemeris in ICD-GPS-200 units (angles in
+# semicircles), with the week number corrected for rollover.
+###############################################################################
+###############################################################################
+
+
+class SnvHandler(MessageHandler):
+    record = struct.Struct("> h l f l l f f f l f d d d l f f f f f f "
+                           "d d d f f h h h b b")
+    keys = ['wn', 'tow', 'tgd', 'aodc', 'toc', 'af2', 'af1', 'af0', 'aode',
+            'deltan', 'm0', 'e', 'roota', 'toe', 'cic', 'crc', 'cis', 'crs',
+            'cuc', 'cus', 'omega0', 'omega', 'i0', 'omegadot', 'idot',
+            'accuracy', 'health', 'fit', 'prn', 'reserved']
+
+    def Decode(self, payload, verbose=False):
+        message = self.check(payload, 2)
+        if message is None:
+            return None
+        try:
+            snav_dict = dict(zip(self.keys, self.record.unpack(message)))
+        except struct.error:
+            self.errors += 1
+            print("Corrupted snav record!")
+            return None
+        snav_dict['prn'] += 1			# sent as PRN - 1
+        if verbose:
+            print("SNV PRN", snav_dict['prn'], "raw week number:",
+                  snav_dict['wn'])
+        snav_dict['wn'] = fix_rollover(snav_dict['wn'])
+        return snav_dict
+
+###############################################################################
+###############################################################################
+# SalHandler -- $PASHR,SAL almanac: 68 bytes plus checksum.  Returns a dict
+# in ICD-GPS-200 units; wn and wna are full week numbers.
+###############################################################################
+###############################################################################
+
+
+class SalHandler(MessageHandler):
+    record = struct.Struct("> h h f l f f d d d d f f h h l")
+    keys = ['prn', 'health', 'e', 'toa', 'i0', 'omegadot', 'roota',
+            'omega0', 'omega', 'm0', 'af0', 'af1', 'wna', 'wn', 'tow']
+
+    def Decode(self, payload, verbose=False):
+        message = self.check(payload, 2)
+        if message is None:
+            return None
+        try:
+            salm_dict = dict(zip(self.keys, self.record.unpack(message)))
+        except struct.error:
+            self.errors += 1
+            print("Corrupted almanac record!")
+            return None
+        salm_dict['prn'] += 1			# sent as PRN - 1
+        salm_dict['wn'] = fix_rollover(salm_dict['wn'])
+        # wna may be truncated to 8 bits; take the nearest matching week
+        salm_dict['wna'] = salm_dict['wn'] + \
+            (salm_dict['wna'] - salm_dict['wn'] + 128) % 256 - 128
+        if verbose:
+            print("SAL PRN", salm_dict['prn'], "week", salm_dict['wna'],
+                  "toa", salm_dict['toa'])
+        return salm_dict
+
+###############################################################################
+###############################################################################
+# EpbHandler -- $PASHR,EPB raw ephemeris: "nn," (PRN) then subframes 1-3 as
+# 30 32-bit words, then checksum.  Returns {'prn': n, 'words': [...]} with
+# each word's 30 data bits right-justified.
+###############################################################################
+###############################################################################
+
+
+class EpbHandler(MessageHandler):
+    record = struct.Struct("> 30L")
+
+    def Decode(self, payload, verbose=False):
+        message = self.check(payload[3:], 2)
+        if message is None:
+            return None
+        try:
+            prn = int(bytes(payload[0:2]))
+        except ValueError:
+            self.errors += 1
+            print("Corrupted raw ephemeris record!")
+            return None
+        words = [word & 0x3fffffff for word in self.record.unpack(message)]
+        if verbose:
+            print("EPB PRN", prn)
+        return {'prn': prn, 'words': words}
+
+###############################################################################
+###############################################################################
+# RpcHandler -- $PASHR,RPC (DBN) carrier-phase data.  It arrives as a line;
+# passed on as {'fields': [...]} with the checksum stripped off.
+###############################################################################
+###############################################################################
+
+
+class RpcHandler(MessageHandler):
+
+    def Decode(self, payload, verbose=False):
+        line = bytes(payload).decode('ascii', 'replace').split('*', 1)[0]
+        return {'fields': line.split(',')[1:]}
+
+###############################################################################
+###############################################################################
+# MessageRegistry -- message type to handler
+###############################################################################
+###############################################################################
+
+
+class MessageRegistry:
+
+###############################################################################
+###############################################################################
+    def __init__(self):
+        self.handlers = {}
+        self.live = {}				# msg_type: bound Handle or None
+        self.unknown = 0
+        self.report_unknown = True		# print each one as it comes
+
+###############################################################################
+# Register -- handle msg_type with handler; returns the handler
+###############################################################################
+    def Register(self, msg_type, handler):
+        self.handlers[msg_type] = handler
+        self.refresh(msg_type)
+        return handler
+
+###############################################################################
+# Subscribe -- call sink with each decoded message of type msg_type
+###############################################################################
+    def Subscribe(self, msg_type, sink):
+        self.handlers[msg_type].Subscribe(sink)
+        self.refresh(msg_type)
+
+###############################################################################
+# Unsubscribe -- stop calling sink with messages of type msg_type
+###############################################################################
+    def Unsubscribe(self, msg_type, sink):
+        self.handlers[msg_type].Unsubscribe(sink)
+        self.refresh(msg_type)
+
+###############################################################################
+# refresh -- point msg_type at its handler's Handle if it has anything to
+# do, or at None if it doesn't
+###############################################################################
+    def refresh(self, msg_type):
+        handler = self.handlers[msg_type]
+        if handler.sinks or handler.required:
+            self.live[msg_type] = handler.Handle
+        else:
+            self.live[msg_type] = None
+
+###############################################################################
+# Dispatch -- hand a payload to its handler; returns the decoded message,
+# or None if it wasn't decoded.  Types nobody wants stop here, without a
+# call to the handler (so they aren't in its count).  Unknown types are
+# counted, and printed unless report_unknown is off.
+###############################################################################
+    def Dispatch(self, msg_type, payload, verbose=False):
+        try:
+            handle = self.live[msg_type]
+        except KeyError:
+            self.unknown += 1
+            if self.report_unknown:
+                print("Message type", msg_type, "is unknown!")
+            return None
+        if handle is None:
+            return None
+        return handle(payload, verbose)
+
+###############################################################################
+# Stats -- (seen, skipped, errors) for each message type; types nobody
+# wants are dropped by Dispatch and don't get this far
+###############################################################################
+    def Stats(self):
+        return dict((msg_type, (h.count, h.skipped, h.errors))
+                    for msg_type, h in self.handlers.items())
+
+# end of ashhandler.py
@@ -0,0 +1,369 @@
+#!/usr/bin/env python3
+
+################################  N8UR ASHCOMM  ################################
+#
+#	Copyright 2019 by John Ackermann, N8UR jra@febo.com https://febo.com
+#	Version number can be found in the ashglobal.py file
+#
+#	This program is free software; you can redistribute it and/or modify
+#	it under the terms of the GNU General Public License as published by
+#	the Free Software Foundation; either version 2 of the License, or
+#	(at your option) any later version.
+#
+#	This program is distributed in the hope that it will be useful,
+#	but WITHOUT ANY WARRANTY; without even the implied warranty of
+#	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#	GNU General Public License for more details.
+#	Software to communicate with Ashtech GPS receivers via serial port.
+################################################################################
+
+#############################   ashindex.py    #################################
+
+import os
+import sys
+import mmap
+import struct
+import argparse
+from array import array
+from bisect import bisect_left
+
+from ashobsfile import *
+
+###############################################################################
+# Epoch index sidecars.  Next to each observation file "name.26o" the
+# writer keeps "name.26o.idx": an 8 byte magic, the size the obs file had
+# when the sidecar was last added to, then one 16 byte record per epoch,
+# the epoch's GPS time (ms since the GPS epoch) and the byte offset of its
+# epoch line.  All numbers are little-endian signed 64 bit.
+#
+# Records are appended only after the obs data they point at has been
+# flushed, so a crash can lose the last few records, or leave half of one,
+# but never leave one pointing past the data.  Readers drop a partial
+# record and catch up on whatever the index is missing by scanning the
+# file from the last good record, so an index is never wrong, only short.
+# An obs file smaller than its sidecar's size isn't the one the sidecar
+# was written for (that was compressed away, say, and the name used
+# again), so the sidecar is ignored, and ObsIndex rebuilds it.
+#
+#	obs = ObsFile("site2910.26o")
+#	index = ObsIndex(obs)
+#	for epoch in index.Window(start, end):	# GpsTimes
+#		...
+#
+# "./ashindex.py FILE..." builds indexes for files that don't have one.
+###############################################################################
+
+MAGIC = b'ASHIDX02'
+SIZE = struct.Struct('<q')
+HEADER = len(MAGIC) + SIZE.size	# records start here
+RECORD = struct.Struct('<qq')
+CHECKS = 8			# bad records dropped from the end before giving up
+
+###############################################################################
+###############################################################################
+# IndexWriter -- appends records to the sidecar of an obs file being
+# written.  The sidecar isn't created until there's something to put in it;
+# unless append is set, one left over from an older file of the same name
+# is removed at once.
+###############################################################################
+###############################################################################
+
+
+class IndexWriter:
+
+###############################################################################
+###############################################################################
+    def __init__(self, filename, append=True):
+        self.filename = index_name(filename)
+        self.append = append
+        self.file = None
+        self.pending = bytearray()
+        self.writes = 0
+        if not append:
+            try:
+                os.remove(self.filename)
+            except FileNotFoundError:
+                pass
+
+###############################################################################
+# Add -- note that the epoch at time (a GpsTime) starts at offset
+###############################################################################
+    def Add(self, time, offset):
+        self.pending += RECORD.pack(time.total, offset)
+
+###############################################################################
+# Flush -- append the pending records, then record size, the obs data
+# flushed so far; call only once the data they point at has been flushed
+###############################################################################
+    def Flush(self, size, fsync=False):
+        if not self.pending:
+            return
+        if self.file is None:
+            self.open_sidecar(size)
+        self.file.seek(0, os.SEEK_END)
+        self.file.write(self.pending)
+        self.file.seek(len(MAGIC))
+        self.file.write(SIZE.pack(size))
+        self.pending = bytearray()
+        self.writes += 2
+        if fsync:
+            os.fsync(self.file.fileno())
+
+###############################################################################
+# open_sidecar -- open the sidecar to add to, starting it afresh unless
+# it's one of ours for this file (size is the obs file's now)
+###############################################################################
+    def open_sidecar(self, size):
+        if self.append and os.path.exists(self.filename):
+            self.file = open(self.filename, 'r+b', buffering=0)
+        else:
+            self.file = open(self.filename, 'w+b', buffering=0)
+        length = self.file.seek(0, os.SEEK_END)
+        self.file.seek(0)
+        if not sidecar_matches(self.file.read(HEADER), size):
+            self.file.truncate(0)
+            self.file.seek(0)
+            self.file.write(MAGIC + SIZE.pack(0))
+        elif (length - HEADER) % RECORD.size:
+            # half a record left by a crash
+            self.file.truncate(length - (length - HEADER) % RECORD.size)
+
+###############################################################################
+# Close -- write what's pending and close; harmless if already closed
+###############################################################################
+    def Close(self, size):
+        self.Flush(size, fsync=True)
+        if self.file is not None and not self.file.closed:
+            self.file.close()
+
+###############################################################################
+###############################################################################
+# ObsIndex -- epoch times and offsets for an open ObsFile, from its sidecar
+# if it has one, topped up by scanning whatever the sidecar doesn't cover
+###############################################################################
+###############################################################################
+
+
+class ObsIndex:
+
+###############################################################################
+###############################################################################
+    def __init__(self, obs):
+        self.obs = obs
+        self.times, self.offsets = read_index(obs.filename)
+        had_sidecar = os.path.exists(index_name(obs.filename))
+
+        # drop records past the end of the file, and any at the end that
+        # don't point at an epoch at their time (the file was cut short
+        # after they were written); if a few of those don't get us to a
+        # good one, the sidecar isn't for this file
+        size = len(obs.map)
+        while self.offsets and self.offsets[-1] >= size:
+            self.times.pop()
+            self.offsets.pop()
+        start = None
+        for tries in range(CHECKS):
+            if not self.offsets:
+                break
+            epoch = self.epoch_at(self.offsets[-1])
+            if epoch and epoch.time and epoch.time.total == self.times[-1]:
+                start = epoch.end
+                break
+            self.times.pop()
+            self.offsets.pop()
+        if start is None:
+            self.times, self.offsets = array('q'), array('q')
+        self.loaded = len(self.times)
+
+        for epoch in obs.Epochs(start):
+            if epoch.time is not None and epoch.sats:
+                self.times.append(epoch.time.total)
+                self.offsets.append(epoch.offset)
+        self.scanned = len(self.times) - self.loaded
+
+        # nothing in the sidecar was any good: it's for some other file
+        if had_sidecar and not self.loaded and self.scanned:
+            try:
+                self.Save()
+            except OSError:
+                pass
+
+###############################################################################
+# epoch_at -- the epoch at offset, or None if there isn't a whole one there
+###############################################################################
+    def epoch_at(self, offset):
+        try:
+            return next(self.obs.Epochs(offset), None)
+        except ValueError:
+            return None
+
+###############################################################################
+# Find -- offset of the first epoch at or after time (a GpsTime), or None
+###############################################################################
+    def Find(self, time):
+        i = bisect_left(self.times, time.total)
+        return self.offsets[i] if i < len(self.offsets) else None
+
+###############################################################################
+# Window -- the epochs from start up to (not including) end, read straight
+# from the first one's offset
+###############################################################################
+    def Window(self, start, end):
+        offset = self.Find(start)
+        if offset is None:
+            return
+        for epoch in self.obs.Epochs(offset):
+            if epoch.time is not None and epoch.time >= end:
+                return
+            yield epoch
+
+###############################################################################
+# Save -- write the sidecar afresh from what's in memory
+###############################################################################
+    def Save(self):
+        filename = index_name(self.obs.filename)
+        temp = filename + ".tmp"
+        with open(temp, 'wb') as writer:
+            writer.write(MAGIC + SIZE.pack(len(self.obs.map)))
+            writer.write(b''.join(RECORD.pack(time, offset) for time, offset
+                                  in zip(self.times, self.offsets)))
+            writer.flush()
+            os.fsync(writer.fileno())
+        os.replace(temp, filename)
+
+###############################################################################
+# NOT IN ObsIndex class
+###############################################################################
+
+###############################################################################
+# index_name -- the sidecar's name for an obs file
+###############################################################################
+
+
+def index_name(filename):
+    return filename + ".idx"
+
+###############################################################################
+# read_index -- (times, offsets) from an obs file's sidecar, as arrays;
+# empty if there's no usable sidecar.  A partial last record is ignored.
+###############################################################################
+
+
+def read_index(filename):
+    times, offsets = array('q'), array('q')
+    try:
+        with open(index_name(filename), 'rb') as reader:
+            data = reader.read()
+        size = os.path.getsize(filename)
+    except OSError:
+        return times, offsets
+    if not sidecar_matches(data, size):
+        return times, offsets
+
+    records = array('q')
+    end = len(data) - (len(data) - HEADER) % RECORD.size
+    records.frombytes(data[HEADER:end])
+    if sys.byteorder == 'big':
+        records.byteswap()
+    return records[0::2], records[1::2]
+
+###############################################################################
+# sidecar_matches -- True if data, a sidecar's contents, can be for an obs
+# file of size bytes
+###############################################################################
+
+
+def sidecar_matches(data, size):
+    return len(data) >= HEADER and data[:len(MAGIC)] == MAGIC and \
+        SIZE.unpack_from(data, len(MAGIC))[0] <= size
+
+###############################################################################
+# find_offset -- offset in obs (an ObsFile) of the first epoch at or after
+# time, by bisecting its sidecar in place; None if it has no sidecar, or
+# the record found doesn't check out, and the caller must scan instead.
+# Unlike ObsIndex this holds nothing in memory however long the file.
+###############################################################################
+
+
+def find_offset(obs, time):
+    try:
+        size = os.path.getsize(obs.filename)
+        with open(index_name(obs.filename), 'rb') as reader:
+            data = mmap.mmap(reader.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return None
+    try:
+        if not sidecar_matches(data, size):
+            return None
+        low, high = 0, (len(data) - HEADER) // RECORD.size
+        while low < high:
+            middle = (low + high) // 2
+            if RECORD.unpack_from(data, HEADER +
+                                  middle * RECORD.size)[0] < time.total:
+                low = middle + 1
+            else:
+                high = middle
+        if low == (len(data) - HEADER) // RECORD.size:
+            return None		# past the index; maybe not past the file
+        total, offset = RECORD.unpack_from(data, HEADER +
+                                           low * RECORD.size)
+    finally:
+        data.close()
+
+    try:
+        epoch = next(obs.Epochs(offset), None)
+    except ValueError:
+        return None
+    if epoch is None or epoch.time is None or epoch.time.total != total:
+        return None
+    return offset
+
+###############################################################################
+# build_index -- make or bring up to date the sidecar for an obs file;
+# returns the ObsIndex
+###############################################################################
+
+
+def build_index(filename, rebuild=False):
+    obs = ObsFile(filename)
+    try:
+        if rebuild:
+            try:
+                os.remove(index_name(filename))
+            except OSError:
+                pass
+        index = ObsIndex(obs)
+        if index.scanned or rebuild:
+            index.Save()
+    finally:
+        obs.Close()
+    return index
+
+###############################################################################
+# MAIN PROGRAM
+###############################################################################
+
+
+def main():
+    args = argparse.ArgumentParser(
+        description='build epoch index sidecars for RINEX 2 obs files')
+    args.add_argument('files', nargs='+', help='observation files')
+    args.add_argument('--rebuild', action='store_true',
+                      help='rebuild indexes even if they look current')
+    opts = args.parse_args()
+
+    for filename in opts.files:
+        try:
+            index = build_index(filename, opts.rebuild)
+        except (OSError, ValueError) as error:
+            print(error)
+            continue
+        print("{}: {} epochs ({} from the index, {} scanned)".format(
+            index_name(filename), len(index.times), index.loaded,
+            index.scanned))
+
+
+if __name__ == '__main__':
+    main()
+
+# end of ashindex.py
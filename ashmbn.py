@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+
+################################  N8UR ASHCOMM  ################################
+#
+#	Copyright 2019 by John Ackermann, N8UR jra@febo.com https://febo.com
+#	Version number can be found in the ashglobal.py file
+#
+#	This program is free software; you can redistribute it and/or modify
+#	it under the terms of the GNU General Public License as published by
+#	the Free Software Foundation; either version 2 of the License, or
+#	(at your option) any later version.
+#
+#	This program is distributed in the hope that it will be useful,
+#	but WITHOUT ANY WARRANTY; without even the implied warranty of
+#	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#	GNU General Public License for more details.
+#	Software to communicate with Ashtech GPS receivers via serial port.
+################################################################################
+
+#############################   ashmbn.py    ###################################
+
+import struct
+
+from ashutil import *
+from ashframe import *
+from ashcapture import *
+
+# NumPy is optional; without it DecodeBatch() falls back to decoding one
+# record at a time (still with the precompiled struct and tables)
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+MBN_LENGTH = 94				# payload without checksum
+BANDS = ('ca', 'l1', 'l2')
+
+###############################################################################
+###############################################################################
+# AshtechMbn -- MBN decoding shared by the per-message path (parse_mben) and
+# the batch path used for reprocessing captures.  The struct format is
+# compiled once, and the LLI and S/N bytes come from lookup tables built
+# from make_lli() and make_sbyte() rather than being worked out for every
+# band of every message.
+###############################################################################
+###############################################################################
+
+
+class AshtechMbn:
+
+###############################################################################
+###############################################################################
+    def __init__(self, g):
+        self.g = g
+        self.keys = g.mben_keys
+        self.range_scale = g.LIGHTSPEED * 1000.0
+        self.snr_scale = g.Z12_SNR_SCALE
+        self.record = struct.Struct(g.mben_struct.replace('\t', ' '))
+
+        # LLI indexed by (warn << 8) | goodbad
+        self.lli_table = bytes(make_lli(warn, goodbad)
+                               for warn in range(256)
+                               for goodbad in range(256))
+
+        # S/N byte indexed by the raw S/N byte from the receiver
+        self.sbyte_table = bytes(make_sbyte(snr / self.snr_scale)
+                                 for snr in range(256))
+
+        if numpy is not None:
+            self.make_dtypes()
+
+###############################################################################
+# make_dtypes -- NumPy record layouts.  wire matches the message including
+# the checksum byte, so a run of 95-byte MBN payloads can be viewed in place
+# with numpy.frombuffer().  decoded holds the scaled values plus the lli
+# (phase lli separately, as overflows add to it) and sbyte for each band.
+###############################################################################
+    def make_dtypes(self):
+        self.wire = numpy.dtype(
+            [('seq', '>u2'), ('struct_left', 'u1'), ('prn', 'u1'),
+             ('el', 'u1'), ('az', 'u1'), ('ch_id', 'u1')] +
+            [(band + field, fmt) for band in BANDS for field, fmt in (
+                ('_warn', 'u1'), ('_goodbad', 'u1'), ('_spare', 'S1'),
+                ('_snr', 'u1'), ('_qual', 'u1'), ('_phase', '>f8'),
+                ('_range', '>f8'), ('_dopp', '>i4'),
+                ('_correction', '>i4'))] +
+            [('chksum', 'u1')])
+
+        self.decoded = numpy.dtype(
+            [('seq', 'u2'), ('struct_left', 'u1'), ('prn', 'u1'),
+             ('el', 'u1'), ('az', 'u2'), ('ch_id', 'u1')] +
+            [(band + field, fmt) for band in BANDS for field, fmt in (
+                ('_warn', 'u1'), ('_goodbad', 'u1'), ('_snr', 'f8'),
+                ('_qual', 'u1'), ('_phase', 'f8'), ('_range', 'f8'),
+                ('_dopp', 'f8'), ('_correction', 'i4'), ('_lli', 'u1'),
+                ('_phase_lli', 'u1'), ('_sbyte', 'u1'))])
+
+        self.lli_array = numpy.frombuffer(self.lli_table, numpy.uint8)
+        self.sbyte_array = numpy.frombuffer(self.sbyte_table, numpy.uint8)
+
+###############################################################################
+# Decode -- decode one MBN payload (checksum already stripped) into the
+# mben_dict and mben_flag_dict that parse_mben() stores for the RINEX writer
+###############################################################################
+    def Decode(self, message):
+        mben_dict = dict(zip(self.keys, self.record.unpack(message)))
+        mben_flag_dict = {}
+
+        # convert values (formulas from Lady Heather -- thanks, Mark!)
+        mben_dict['az'] *= 2
+        for band in BANDS:
+            snr = mben_dict[band + '_snr']
+            lli = self.lli_table[(mben_dict[band + '_warn'] << 8) |
+                                 mben_dict[band + '_goodbad']]
+            sbyte = self.sbyte_table[snr]
+            mben_dict[band + '_snr'] = snr / self.snr_scale
+            mben_dict[band + '_range'] *= self.range_scale
+            mben_dict[band + '_dopp'] /= 10000.0
+
+            # one lli and one sbyte per band, copied to each observable;
+            # phase overflows also set the phase lli
+            mben_flag_dict[band + '_range_lli'] = \
+                mben_flag_dict[band + '_dopp_lli'] = lli
+            mben_dict[band + '_phase'], \
+                mben_flag_dict[band + '_phase_lli'] = \
+                fixphase(mben_dict[band + '_phase'], lli)
+            mben_flag_dict[band + '_phase_sbyte'] = \
+                mben_flag_dict[band + '_range_sbyte'] = \
+                mben_flag_dict[band + '_dopp_sbyte'] = sbyte
+
+        return mben_dict, mben_flag_dict
+
+###############################################################################
+# Unpack -- raw MBN fields as a tuple in mben_keys order
+###############################################################################
+    def Unpack(self, message):
+        return self.record.unpack(message)
+
+###############################################################################
+# Store -- scale the fields from Unpack() into epoch (an ashepoch.Epoch),
+# with the same conversions as Decode() but no dicts
+###############################################################################
+    def Store(self, values, epoch):
+        prn = values[2]
+        epoch.el[prn] = values[3]
+        epoch.az[prn] = values[4] * 2
+        epoch.ch_id[prn] = values[5]
+        base = 6
+        for snr, phase, prange, dopp, lli, phase_lli, sbyte in epoch.bands:
+            flag = self.lli_table[(values[base] << 8) | values[base + 1]]
+            snr[prn] = values[base + 3] / self.snr_scale
+            sbyte[prn] = self.sbyte_table[values[base + 3]]
+            lli[prn] = flag
+            phase[prn], phase_lli[prn] = fixphase(values[base + 5], flag)
+            prange[prn] = values[base + 6] * self.range_scale
+            dopp[prn] = values[base + 7] / 10000.0
+            base += 9
+        epoch.Mark(prn)
+
+###############################################################################
+# DecodeBatch -- decode many MBN payloads at once.  data is either the
+# payloads (checksum byte included, as FrameDecoder returns them) joined
+# end to end, or a list of them.  Records with a bad checksum or a PRN
+# outside 1..32 are dropped.  Returns a NumPy structured array, or without
+# NumPy a dict of lists with the same field names; either way
+# batch['l1_range'][i] works.  Raises ValueError if data isn't a whole
+# number of records, since then every record may be misaligned.
+###############################################################################
+    def DecodeBatch(self, data, verify=True):
+        if not isinstance(data, (bytes, bytearray, memoryview)):
+            data = b''.join(data)
+        size = MBN_LENGTH + 1
+        if len(data) % size:
+            raise ValueError("MBN batch of {} bytes is not a whole number "
+                             "of {} byte records".format(len(data), size))
+
+        if numpy is None:
+            return self.decode_columns(data, verify)
+
+        raw = numpy.frombuffer(data, self.wire)
+        keep = (raw['prn'] >= 1) & (raw['prn'] <= 32)
+        if verify:
+            keep &= verify_chksums(data, size, 1)
+        if not keep.all():
+            raw = raw[keep]
+
+        batch = numpy.empty(len(raw), self.decoded)
+        for name in ('seq', 'struct_left', 'prn', 'el', 'ch_id'):
+            batch[name] = raw[name]
+        batch['az'] = raw['az'] * numpy.uint16(2)
+        for band in BANDS:
+            warn = raw[band + '_warn']
+            goodbad = raw[band + '_goodbad']
+            lli = self.lli_array[(warn.astype(numpy.uint16) << 8) | goodbad]
+            batch[band + '_warn'] = warn
+            batch[band + '_goodbad'] = goodbad
+            batch[band + '_qual'] = raw[band + '_qual']
+            batch[band + '_correction'] = raw[band + '_correction']
+            batch[band + '_snr'] = raw[band + '_snr'] / self.snr_scale
+            batch[band + '_sbyte'] = self.sbyte_array[raw[band + '_snr']]
+            batch[band + '_range'] = raw[band + '_range'] * self.range_scale
+            batch[band + '_dopp'] = raw[band + '_dopp'] / 10000.0
+            batch[band + '_lli'] = lli
+            batch[band + '_phase'], batch[band + '_phase_lli'] = \
+                fix_phases(raw[band + '_phase'].astype(numpy.float64), lli)
+        return batch
+
+###############################################################################
+# decode_columns -- DecodeBatch() without NumPy
+###############################################################################
+    def decode_columns(self, data, verify=True):
+        size = MBN_LENGTH + 1
+        columns = None
+        for start in range(0, len(data), size):
+            message = data[start:start + MBN_LENGTH]
+            chksum = data[start + MBN_LENGTH:start + size]
+            if verify and not verify_chksum(message, chksum):
+                continue
+            mben_dict, mben_flag_dict = self.Decode(message)
+            if not 1 <= mben_dict['prn'] <= 32:
+                continue
+            for band in BANDS:
+                del mben_dict[band + '_spare']
+                mben_dict[band + '_lli'] = \
+                    mben_flag_dict[band + '_range_lli']
+                mben_dict[band + '_phase_lli'] = \
+                    mben_flag_dict[band + '_phase_lli']
+                mben_dict[band + '_sbyte'] = \
+                    mben_flag_dict[band + '_range_sbyte']
+            if columns is None:
+                columns = dict((key, []) for key in mben_dict)
+            for key, value in mben_dict.items():
+                columns[key].append(value)
+        return columns or {}
+
+###############################################################################
+# DecodeCapture -- all the MBN records in a capture file as one batch
+###############################################################################
+    def DecodeCapture(self, filename, verify=True):
+        decoder = FrameDecoder()
+        payloads = []
+        for timestamp, data in read_capture(filename):
+            decoder.feed(data)
+            for msg_type, payload in decoder:
+                if msg_type == 'MPC':
+                    payloads.append(bytes(payload))
+        return self.DecodeBatch(payloads, verify)
+
+###############################################################################
+# fix_phases -- vectorised fixphase(): wrap phase overflows and set the
+# loss-of-lock bit where it happened
+###############################################################################
+
+
+def fix_phases(phase, lli):
+    magnitude = numpy.abs(phase)
+    over = magnitude >= 1.0E10
+    if over.any():
+        count = numpy.floor(magnitude / 1.0E10)
+        phase = numpy.where(count >= 10, 0.0,
+                            phase - numpy.sign(phase) * count * 1.0E10)
+        lli = lli | over.astype(numpy.uint8)
+    return phase, lli
+
+# end of ashmbn.py
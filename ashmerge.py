@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+
+################################  N8UR ASHCOMM  ################################
+#
+#	Copyright 2019 by John Ackermann, N8UR jra@febo.com https://febo.com
+#	Version number can be found in the ashglobal.py file
+#
+#	This program is free software; you can redistribute it and/or modify
+#	it under the terms of the GNU General Public License as published by
+#	the Free Software Foundation; either version 2 of the License, or
+#	(at your option) any later version.
+#
+#	This program is distributed in the hope that it will be useful,
+#	but WITHOUT ANY WARRANTY; without even the implied warranty of
+#	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#	GNU General Public License for more details.
+#	Software to communicate with Ashtech GPS receivers via serial port.
+################################################################################
+
+#############################   ashmerge.py    #################################
+
+import os
+import sys
+import time
+import heapq
+import argparse
+import datetime
+
+from ashobsfile import *
+from ashindex import *
+from ashwriter import *
+from ashrinex import *
+
+###############################################################################
+# ashmerge.py merges RINEX 2.11 observation files into one -- the
+# fragments a rotated or restarted session leaves -- or cuts a time window
+# out of them:
+#
+#	./ashmerge.py -o SITE2910.26o SITE291a.26o SITE291b.26o ...
+#	./ashmerge.py -o part.26o --start 14:00 --end 14:15 SITE2910.26o
+#
+# Every input is read lazily and the epochs merged by time through a heap,
+# so memory use doesn't grow with the files.  An epoch at a time already
+# written, as where a restarted session overlaps the last one, is dropped,
+# and so is an event record that's already been written for that time.
+# Epoch records are copied byte for byte.
+#
+# The header is the earliest input's, in the same list-of-lines form
+# Rinex.obs_file_header() builds: TIME OF FIRST OBS, TIME OF LAST OBS and
+# INTERVAL are set from the epochs actually written -- patched in place
+# once they're known, since the lines don't change length -- a COMMENT
+# says what was merged, and per-satellite counts, which would be wrong,
+# are dropped.  The output gets an epoch index like any other obs file.
+###############################################################################
+
+FLUSH_EPOCHS = 1000		# epochs (and index records) between flushes
+DROP_LABELS = ('# OF SATELLITES', 'PRN / # OF OBS')
+
+###############################################################################
+# epoch_stream -- (ms, number, count, epoch) for each epoch of obs from
+# start, for heapq.merge(); number and count keep ties in input order.
+# Event records without a time go with the epoch before them.
+###############################################################################
+
+
+def epoch_stream(obs, number, start=None):
+    offset = find_offset(obs, start) if start is not None else None
+    total = -1
+    for count, epoch in enumerate(obs.Epochs(offset)):
+        if epoch.time is not None:
+            total = epoch.time.total
+        if start is not None and total < start.total:
+            continue
+        yield total, number, count, epoch
+
+###############################################################################
+# merge_header -- the output header: the earliest input's, with the lines
+# merge() patches at the end set to placeholders
+###############################################################################
+
+
+def merge_header(files, start, end):
+    first = min(files, key=lambda obs: obs.header.first_obs.total
+                if obs.header.first_obs else 0)
+    header = ObsHeader(list(first.header.lines))
+    for label in DROP_LABELS:
+        header.Remove(label)
+
+    comments = ["{:<60}{:<20}".format(
+        "Merged from {} file(s) by ashmerge.py".format(len(files)),
+        "COMMENT")]
+    if start is not None or end is not None:
+        comments.append("{:<60}{:<20}".format("Window {} to {}".format(
+            start.timestring() if start else "start",
+            end.timestring() if end else "end"), "COMMENT"))
+    header.Set('COMMENT', ["{:<60}{:<20}".format(content, "COMMENT")
+                           for content in header.Get('COMMENT')] + comments)
+
+    header.Set('INTERVAL', [interval_line(header.interval or 0)])
+    header.Set('TIME OF FIRST OBS',
+               [obs_time_line(GpsTime(0, 0), "TIME OF FIRST OBS")])
+    header.Set('TIME OF LAST OBS',
+               [obs_time_line(GpsTime(0, 0), "TIME OF LAST OBS")])
+    return header
+
+###############################################################################
+# merge -- merge the obs files named in filenames, or the window from
+# start up to end (GpsTimes) of them, into output; returns counts
+###############################################################################
+
+
+def merge(filenames, output, start=None, end=None, force=False, index=True):
+    files = [ObsFile(filename) for filename in filenames]
+    try:
+        types = files[0].header.obs_types
+        for obs in files[1:]:
+            if obs.header.obs_types != types:
+                raise ValueError("{}: observation types differ from {}".format(
+                    obs.filename, files[0].filename))
+
+        header = merge_header(files, start, end)
+        writer = RinexWriter(output, 'w' if force else 'x', index=index)
+
+        # where the lines to patch start
+        places = {}
+        position = 0
+        for line in header.lines:
+            places[line[60:].rstrip()] = position
+            position += len(line) + 1
+        writer.Write([header.Text()])
+
+        counts = {'epochs': 0, 'events': 0, 'duplicates': 0,
+                  'out of order': 0}
+        first = last = interval = None
+        events = (None, set())		# time, records written at it
+        streams = [epoch_stream(obs, number, start)
+                   for number, obs in enumerate(files)]
+        for total, number, count, epoch in heapq.merge(*streams):
+            if end is not None and total >= end.total:
+                break
+            record = files[number].map[epoch.offset:epoch.end]
+            if epoch.time is None or not epoch.sats:
+                if events[0] != total:
+                    events = (total, set())
+                if record in events[1]:
+                    counts['duplicates'] += 1
+                    continue
+                events[1].add(record)
+                counts['events'] += 1
+            elif last is not None and total <= last:
+                counts['duplicates' if total == last else 'out of order'] += 1
+                continue
+            else:
+                if last is not None:
+                    interval = min(interval or total - last, total - last)
+                first = total if first is None else first
+                last = total
+                counts['epochs'] += 1
+            writer.WriteBytes(record, epoch.time if epoch.sats else None)
+            if counts['epochs'] % FLUSH_EPOCHS == 0:
+                writer.Flush()
+        writer.Close()
+    finally:
+        for obs in files:
+            obs.Close()
+
+    # now the header can be finished
+    patches = []
+    if first is not None:
+        patches += [(places['TIME OF FIRST OBS'], obs_time_line(
+                        GpsTime(0, first), "TIME OF FIRST OBS")),
+                    (places['TIME OF LAST OBS'], obs_time_line(
+                        GpsTime(0, last), "TIME OF LAST OBS"))]
+    if interval:
+        patches.append((places['INTERVAL'], interval_line(interval / 1000)))
+    with open(output, 'r+b') as patcher:
+        for position, line in patches:
+            patcher.seek(position)
+            patcher.write(line.encode('ascii'))
+    return counts
+
+###############################################################################
+# parse_time -- GpsTime from "YYYY-MM-DD HH:MM[:SS]" or, on the day of
+# first (a GpsTime), "HH:MM[:SS]"
+###############################################################################
+
+
+def parse_time(text, first):
+    text = text.strip().replace('T', ' ')
+    if ' ' in text:
+        day, clock = text.split(None, 1)
+        year, month, mday = (int(field) for field in day.split('-'))
+    else:
+        day = first.datetime
+        year, month, mday, clock = day.year, day.month, day.day, text
+    fields = clock.split(':')
+    return GpsTime.FromCalendar(year, month, mday, int(fields[0]),
+                                int(fields[1]) if len(fields) > 1 else 0,
+                                float(fields[2]) if len(fields) > 2 else 0)
+
+###############################################################################
+# MAIN PROGRAM
+###############################################################################
+
+
+def main():
+    args = argparse.ArgumentParser(
+        description='merge RINEX 2 obs files, or cut a time window out')
+    args.add_argument('files', nargs='+', help='observation files')
+    args.add_argument('-o', '--output', required=True,
+                      help='file to write')
+    args.add_argument('--start', help='first epoch time (GPS), '
+                      '"YYYY-MM-DD HH:MM[:SS]" or "HH:MM[:SS]" on the '
+                      'first input\'s day')
+    args.add_argument('--end', help='time to stop before, same forms')
+    args.add_argument('--force', action='store_true',
+                      help='overwrite the output if it exists')
+    args.add_argument('--no_index', action='store_true',
+                      help='don\'t write an epoch index for the output')
+    opts = args.parse_args()
+
+    try:
+        start = end = None
+        if opts.start or opts.end:
+            obs = ObsFile(opts.files[0])
+            first = obs.header.first_obs or next(iter(obs)).time
+            obs.Close()
+            start = parse_time(opts.start, first) if opts.start else None
+            end = parse_time(opts.end, first) if opts.end else None
+
+        began = time.perf_counter()
+        counts = merge(opts.files, opts.output, start, end, opts.force,
+                       not opts.no_index)
+    except FileExistsError:
+        print(opts.output, "already exists; use --force to overwrite")
+        sys.exit(1)
+    except (OSError, ValueError, StopIteration) as error:
+        print(error)
+        sys.exit(1)
+
+    print("Wrote {} epochs from {} file(s) to {} in {:.2f} s: "
+          "{} duplicates and {} out of order dropped, {} events".format(
+              counts['epochs'], len(opts.files), opts.output,
+              time.perf_counter() - began, counts['duplicates'],
+              counts['out of order'], counts['events']))
+
+
+if __name__ == '__main__':
+    main()
+
+# end of ashmerge.py
@@ -17,6 +17,7 @@
 #	Software to communicate with Ashtech GPS receivers via serial port.
 ################################################################################
 
+import math
 import struct
 
 from ashserial import *
@@ -26,9 +27,13 @@ from ashposition import *
 from ashtime import *
 from ashrinex import *
 from ashglobal import *
+from ashmbn import *
+from ashhandler import *
 
 
 class AshtechMessages:
+    DAL_TIMEOUT = 5			# seconds to wait for a DAL sentence
+    DAL_BYTES = 32 * 80			# a DAL sentence per almanac satellite
 
 ###############################################################################
 ###############################################################################
@@ -38,93 +43,104 @@ class AshtechMessages:
         self.g = structs
         self.RINEX = rinex
         self.verbose = verbose
+        self.Mbn = AshtechMbn(structs)
+        self.Assembler = EpochAssembler(structs.epoch_pool)
+
+        # message type -> handler; see ashhandler.py.  Handlers for
+        # anything else we learn to use get registered the same way.
+        self.Registry = MessageRegistry()
+        self.Registry.Register('MPC', MessageHandler(self.parse_mben, True))
+        self.Registry.Register('PBN', MessageHandler(self.parse_pben, True))
+        self.Registry.Register('SNV', SnvHandler())
+        self.Registry.Register('SAL', SalHandler())
+        self.Registry.Register('EPB', EpbHandler())
+        self.Registry.Register('RPC', RpcHandler())
+        # replies to our commands and queries, which go to whoever asked
+        # (see ashserial.py); any left over aren't processed here
+        for msg_type in ('DAL', 'ACK', 'NAK', 'RID', 'PRT', 'PPS', 'WKN'):
+            self.Registry.Register(msg_type, MessageHandler())
+
+        # ephemerides always go to the cache, and from there to the nav file
+        self.Registry.Subscribe('SNV', self.store_ephemeris)
+        self.Registry.Subscribe('SAL', self.g.almanac.Add)
 
 ###############################################################################
 ###############################################################################
 # MsgSwitch -- sit on serial port and hand messages off to appropriate handler
-# relies on another command to start message stream
+# relies on another command to start message stream.  Messages are framed by
+# the serial reader thread; if nothing at all arrives for timeout seconds,
+# or the reader stops because the port has gone, we give up and return.
 ###############################################################################
-    def MsgSwitch(self, verbose=False):
-
-        self.SerPort.inter_byte_timeout = 5  # tenths of second?
-        delimiter = b'$PASHR'
-
-        self.SerPort.reset_input()		# clear out garbage
-        while True:
-            message = self.SerPort.read_anything(delimiter, 0)
-            if len(message) > 9:  # ignore leftover b'$PASHR' in buffer
-
-                # strip crlf and beyond from end
-                if (message[-8:] == b'\r\n$PASHR'):
-                    message = message[:-8]
-                # sometimes we don't get the $PASHR part
-                elif (message[-2:] == b'\r\n'):
-                    message = message[:-2]
-                else:
-                    print("Bad message trailer: \"", message[-8:], "\"")
-                    continue
+    def MsgSwitch(self, verbose=False, timeout=None):
 
-                # extract message type, strip whitespace
-                msg_type = message[1:4].decode('ascii')
-                msg_type = msg_type.strip()
-                # trim off msg type including comma, leave checksum byte(s)
-                payload = message[5:]
-
-                if verbose:
-                    print ("msg_type:", msg_type, "length:", len(payload))
-                if msg_type == 'MPC':
-                    self.parse_mben(payload, verbose)
-                elif msg_type == 'PBN':
-                    self.parse_pben(payload, verbose)
-                elif msg_type == 'SNV':
-                    pass  # self.parse_snav(payload,verbose)
-                elif msg_type == 'SAL':
-                    pass  # self.parse_salm(payload,verbose)
-                elif msg_type == 'EPB':
-                    pass  # self.parse_epb(payload,verbose)
-                elif msg_type == 'RPC':
-                    pass  # self.parse_dben(payload,verbose)
-                elif msg_type == 'DAL':
-                    pass  # not processed here
-                else:
-                    print("Message type", msg_type, "is unknown!")
-
-            # test whether we're ready to print a RINEX epoch
-            # mben_list_full means we have all the SV data for an epoch
-            if self.g.mben_list_full:
-                # new_pben means we have a pben message
-                if self.g.new_pben:
-                    # but it might have prior epoch
-                    if (self.g.current_mben_epoch_string !=
-                            self.g.current_pben_epoch_string):
-                        # so ignore it
-                        self.g.new_pben = False
-                        if verbose:
-                            print(str(datetime.datetime.utcnow().time())[:-5],
-                                  "epoch mismatch!",
-                                  "mben:", self.g.current_mben_epoch_string,
-                                  "pben:", self.g.current_pben_epoch_string)
-                        continue
-                    else:
-
-                        if verbose:
-                            print(str(datetime.datetime.utcnow().time())[:-5],
-                                  "mben:", self.g.current_mben_epoch_string,
-                                  "pben:", self.g.current_pben_epoch_string)
-                            print("Off to RINEX...")
-
-                        self.RINEX.write_rinex_obs()
-
-                        # we're done with mben, so
-                        # clear for another cycle
-                        self.g.mben_list_full = False
-                        self.g.mben_list = [None] * 33  # 1 - 32
-
-                # we never reuse pben
-                self.g.new_pben = False
+        # don't clear the input here; the first epoch may already be
+        # sitting in the decoder
+        self.SerPort.StartReader()
+        try:
+            while True:
+                frame = self.SerPort.get_frame(timeout)
+                if frame is None:
+                    if not self.SerPort.reader_running:
+                        print("Lost the serial port; giving up")
+                    elif timeout:
+                        print("No data from receiver for", timeout,
+                              "seconds; giving up")
+                    break
+                self.HandleFrame(*frame, verbose=verbose)
+        finally:
+            self.SerPort.StopReader()
+            self.Finish(verbose)
+
+        return
+
+###############################################################################
+# HandleFrame -- dispatch one decoded message (see FrameDecoder) and write
+# any RINEX epochs that completes
+###############################################################################
+    def HandleFrame(self, msg_type, payload, verbose=False):
+
+        if verbose:
+            print ("msg_type:", msg_type, "length:", len(payload))
+        self.Registry.Dispatch(msg_type, payload, verbose)
+
+        for epoch in self.Assembler.Ready():
+            self.write_epoch(epoch, verbose)
 
         return
 
+###############################################################################
+# Finish -- write whatever epochs are still waiting for a PBN and report
+# what the assembler saw
+###############################################################################
+    def Finish(self, verbose=False):
+        self.Assembler.Flush()
+        for epoch in self.Assembler.Ready():
+            self.write_epoch(epoch, verbose)
+        print()
+        print("Epochs:", self.Assembler.Summary())
+
+###############################################################################
+# write_epoch -- hand one assembled epoch to the RINEX writer, then give it
+# back to the pool
+###############################################################################
+    def write_epoch(self, epoch, verbose=False):
+        if verbose:
+            print(str(datetime.datetime.utcnow().time())[:-5], "epoch:",
+                  epoch.time.timestring(),
+                  "pben:", "yes" if epoch.pben else "no",
+                  "closed:", "yes" if epoch.closed else "no")
+            print("Off to RINEX...")
+
+        if self.RINEX and self.g.current_fix:
+            if not self.g.first_observation_string:
+                self.g.first_observation = epoch.time
+                self.g.first_observation_string = \
+                    self.g.first_observation.timestring()
+            self.g.epoch = epoch
+            self.RINEX.write_rinex_obs()
+            self.g.epoch = None
+        self.g.epoch_pool.Release(epoch)
+
 ###############################################################################
 # parse_mben -- parse measurement binary response ($PASHQ,MBN)
 # returns a dict with a header as the first item, followed by 1 to 3 items
@@ -132,9 +148,6 @@ class AshtechMessages:
 # properly scaled ones.
 ###############################################################################
     def parse_mben(self, message, verbose=False):
-        LIGHTSPEED = self.g.LIGHTSPEED		# speed of light, km/s
-        Z12_SNR_SCALE = self.g.Z12_SNR_SCALE  # scale to sensible range
-
         # first, strip off checksum byte and test
         chksum = message[-1:]
         message = message[:-1]
@@ -142,126 +155,49 @@ class AshtechMessages:
             print("Checksum error!")
             return
 
-        # message structure and keys defined in ashglobal.py
+        # message structure and keys defined in ashglobal.py; decoding,
+        # scaling and flags in ashmbn.py
         try:
-            mben_list = struct.unpack(self.g.mben_struct, message)
-        except:
+            values = self.Mbn.Unpack(message)
+        except struct.error:
             print("Corrupted mben record!")
             return
-        mben_dict = dict(zip(self.g.mben_keys, mben_list))
-        mben_flag_list = [None] * 33
-        mben_flag_dict = dict(zip(self.g.mben_flag_keys, mben_flag_list))
+        seq, struct_left, prn = values[0:3]
 
-        prn = mben_dict['prn']
+        if not 1 <= prn <= 32:
+            return
 
-        if not prn in range(1, 32):
+        # "seq" (unit: 50ms modulo 30 minutes) only becomes a time once a
+        # pben has told us roughly where we are
+        if self.g.current_pben_epoch is None:
+            self.Assembler.Untimed()
             return
+        epoch_time = seq_time(self.g.current_pben_epoch, seq)
 
-        # convert "seq" (unit: 50ms modulo 30 minutes) to real time
-        seq = int(mben_dict['seq'])
-        # get current gps time (set by pben)
-        temp = GPS_Time(self.g.gps_week, self.g.gps_tow)
-        # use that plus seq to get epoch tow
-        seq_seconds = temp.time_from_seq(self.g.gps_week, self.g.gps_tow, seq)
-        # turn tow and gps_week into epoch time
-        self.g.current_mben_epoch = GPS_Time(self.g.gps_week, seq_seconds)
-        self.g.current_mben_epoch_string = \
-            GPS_Time(self.g.gps_week, seq_seconds).timestring()
-
-        # convert values (formulas from Lady Heather -- thanks, Mark!)
-        mben_dict['az'] = mben_dict['az'] * 2
-        mben_dict['ca_snr'] /= Z12_SNR_SCALE
-        mben_dict['l1_snr'] /= Z12_SNR_SCALE
-        mben_dict['l2_snr'] /= Z12_SNR_SCALE
-
-        # see below for phase processing
-
-        mben_dict['ca_range'] *= (LIGHTSPEED * 1000.0)
-        mben_dict['l1_range'] *= (LIGHTSPEED * 1000.0)
-        mben_dict['l2_range'] *= (LIGHTSPEED * 1000.0)
-
-        mben_dict['ca_dopp'] /= 10000.0
-        mben_dict['l1_dopp'] /= 10000.0
-        mben_dict['l2_dopp'] /= 10000.0
-
-        # add the lli values to mben_flag_dict; one flag for
-        # each of ca, l1, l2 so calc once copy thrice
-        flag_tmp = make_lli(mben_dict['ca_warn'], mben_dict['ca_goodbad'])
-        mben_flag_dict['ca_phase_lli'] = \
-            mben_flag_dict['ca_range_lli'] = \
-            mben_flag_dict['ca_dopp_lli'] = \
-            flag_tmp
-
-        flag_tmp = make_lli(mben_dict['l1_warn'], mben_dict['l1_goodbad'])
-        mben_flag_dict['l1_phase_lli'] = \
-            mben_flag_dict['l1_range_lli'] = \
-            mben_flag_dict['l1_dopp_lli'] = \
-            flag_tmp
-
-        flag_tmp = make_lli(mben_dict['l2_warn'], mben_dict['l2_goodbad'])
-        mben_flag_dict['l2_phase_lli'] = \
-            mben_flag_dict['l2_range_lli'] = \
-            mben_flag_dict['l2_dopp_lli'] = \
-            flag_tmp
-
-        # fix phase overflows and update lli if necessary
-        mben_dict['ca_phase'], mben_flag_dict['ca_phase_lli'] = \
-            fixphase(mben_dict['ca_phase'], mben_flag_dict['ca_phase_lli'])
-        mben_dict['l1_phase'], mben_flag_dict['l1_phase_lli'] = \
-            fixphase(mben_dict['l1_phase'], mben_flag_dict['l1_phase_lli'])
-        mben_dict['l2_phase'], mben_flag_dict['l2_phase_lli'] = \
-            fixphase(mben_dict['l2_phase'], mben_flag_dict['l2_phase_lli'])
-
-        # add the sbyte values to mben_flag_dict; one flag for
-        # each of ca, l1, l2 so calc once copy thrice
-        sbyte_tmp = make_sbyte(mben_dict['ca_snr'])
-        mben_flag_dict['ca_phase_sbyte'] = \
-            mben_flag_dict['ca_range_sbyte'] = \
-            mben_flag_dict['ca_dopp_sbyte'] = \
-            sbyte_tmp
-
-        sbyte_tmp = make_sbyte(mben_dict['l1_snr'])
-        mben_flag_dict['l1_phase_sbyte'] = \
-            mben_flag_dict['l1_range_sbyte'] = \
-            mben_flag_dict['l1_dopp_sbyte'] = \
-            sbyte_tmp
-
-        sbyte_tmp = make_sbyte(mben_dict['l2_snr'])
-        mben_flag_dict['l2_phase_sbyte'] = \
-            mben_flag_dict['l2_range_sbyte'] = \
-            mben_flag_dict['l2_dopp_sbyte'] = \
-            sbyte_tmp
-
-        self.g.mben_list[prn] = mben_dict
-        self.g.mben_flag_list[prn] = mben_flag_dict
+        epoch = self.Assembler.Add(epoch_time, prn)
+        if epoch is None:
+            if verbose:
+                print("Late mben for", epoch_time.timestring(), "prn", prn,
+                      "dropped")
+            return
+        epoch.seq = seq
+        self.Mbn.Store(values, epoch)
 
         if verbose:
             print()
-            print("Epoch:", epoch)
-            mbn = "MBN" + str(mben_dict['struct_left'])
-            print(mbn, "seq:", mben_dict['seq'], "prn:", mben_dict['prn'],
-                  "el:", mben_dict['el'], "az:", mben_dict['az'],
-                  "ch_id:", mben_dict['ch_id'])
-            print("CA:", mben_dict['ca_qual'], mben_dict['ca_snr'],
-                  mben_dict['ca_phase'], mben_dict['ca_prange'],
-                  mben_dict['ca_dop'])
-            print("L1:", mben_dict['l1_qual'], mben_dict['l1_snr'],
-                  mben_dict['l1_phase'], mben_dict['l1_prange'],
-                  mben_dict['l1_dop'])
-            print("L2:", mben_dict['l2_qual'], mben_dict['l2_snr'],
-                  mben_dict['l2_phase'], mben_dict['l2_prange'],
-                  mben_dict['l2_dop'])
-            if mben_dict['struct_left'] == 0:
-                print("PRNs in this epoch:", end=' ', flush=True)
-                for i in self.g.mben_list:
-                    if i != None:
-                        print(i['prn'], end=' ', flush=True)
-                print()
-
-        if mben_dict['struct_left'] == 0:  # last message for this epoch
-            if verbose:
-                print("setting mben_list_full")
-            self.g.mben_list_full = True
+            print("Epoch:", epoch.time.timestring())
+            mbn = "MBN" + str(struct_left)
+            print(mbn, "seq:", seq, "prn:", prn, "el:", epoch.el[prn],
+                  "az:", epoch.az[prn], "ch_id:", epoch.ch_id[prn])
+            for band, columns in zip(BANDS, epoch.bands):
+                snr, phase, prange, dopp = columns[0:4]
+                print(band.upper() + ":", snr[prn], phase[prn],
+                      prange[prn], dopp[prn])
+            if struct_left == 0:
+                print("PRNs in this epoch:", *epoch.prns())
+
+        if struct_left == 0:  # last message for this epoch
+            epoch.closed = True
 
         return
 
@@ -271,10 +207,6 @@ class AshtechMessages:
 ###############################################################################
     def parse_pben(self, message, verbose=False):
 
-        # only get pben after we've received the first mben
-        if not self.g.current_mben_epoch_string:
-            return
-
         # first, strip off checksum bytes and test
         chksum = message[-2:]
         message = message[:-2]
@@ -290,7 +222,8 @@ class AshtechMessages:
             return
         pben_dict = dict(zip(self.g.pben_keys, vallist))
 
-        pben_dict['tow'] = pben_dict['tow'] / 1000.0
+        tow_ms = pben_dict['tow']
+        pben_dict['tow'] = tow_ms / 1000.0
         pben_dict['site'] = pben_dict['site'].decode('ascii')
         pben_dict['pdop'] = pben_dict['pdop'] / 100.0
         self.g.current_pben = pben_dict
@@ -300,24 +233,22 @@ class AshtechMessages:
 
         self.g.gps_tow = pben_dict['tow']
 
-        # have we entered a new week?
-        if pben_dict['tow'] < self.g.last_tow:
+        # have we entered a new week?  A pben that's merely late or out of
+        # order doesn't jump back by anything like half a week.
+        if pben_dict['tow'] < self.g.last_tow - 302400:
             self.g.gps_week += 1
-            print("New GPS week: {}".format(self.gps_week))
+            print("New GPS week: {}".format(self.g.gps_week))
         self.g.last_tow = self.g.gps_tow
 
-        self.g.current_pben_epoch = \
-            GPS_Time(self.g.gps_week, self.g.gps_tow)
-
-        self.g.current_pben_epoch_string = \
-            GPS_Time(self.g.gps_week, self.g.gps_tow).timestring()
+        self.g.current_pben_epoch = GpsTime(self.g.gps_week, tow_ms)
 
-        if not self.g.first_observation_string:
-            self.g.first_observation = self.g.current_pben_epoch
-            self.g.first_observation_string = self.g.current_pben_epoch_string
-
-        # set flag for MsgSwitch
-        self.g.new_pben = True
+        # the epoch this pben belongs to, if its mbens are still in flight
+        epoch = self.Assembler.Attach(self.g.current_pben_epoch, pben_dict,
+                                      fix)
+        if verbose and epoch is None:
+            print(str(datetime.datetime.utcnow().time())[:-5],
+                  "no mben epoch for pben:",
+                  self.g.current_pben_epoch.timestring())
 
         if verbose:
             #			print("navx,navy,navz:",navx,navy,navz)
@@ -341,51 +272,12 @@ class AshtechMessages:
         return fix, pben_dict['tow']
 
 ###############################################################################
-# parse_salm -- parse almanac binary response ($PASHQ,SLM)
-###############################################################################
-    def parse_salm(self, message, verbose=False):
-        print("In SALM parser")
-        return
-
-###############################################################################
-# parse_snav -- parse measurement binary response ($PASHQ,SNV)
+# store_ephemeris -- put a decoded SNV in the ephemeris cache; if it's one we
+# didn't have, add it to the nav file
 ###############################################################################
-    def parse_snav(self, message, verbose=False):
-
-        # first, strip off checksum bytes and test
-        chksum = message[-2]
-        message = message[:-2]
-        if not verify_chksum(message, chksum):
-            print("Checksum error!")
-            return
-
-        if verbose:
-            print("In SNAV handler")
-            print("svn message length", len(message))
-
-        # Z12 manual says 130 bytes excluding checksum
-        svn_struct = \
-            ("> s l f l l f f f f d d d l f f f f f f d d d f f h h c c ")
-        print("svn_struct length", len(svn_struct))
-        keylist = ['Wn', 'Sn', 'tgd_gp_del', 'iodc_clock_data_issue', 'toc',
-                   'af2', 'af1', 'af0', 'iode_orb_data_issue', 'imean_anom_corr',
-                   'ecc', 'a1div2', 'toe', 'cic_harm_corr_rad', 'crc_harm_corr_m',
-                   'cis_harm_corr_rad', 'crs_harm_corr_m', 'cuc_harm_corr_rad',
-                   'omega_0', 'arg_of_perigee', 'inc_angle', 'omegadot', 'idot',
-                   'acc', 'health', 'curve_fit', 'prn_minus_one', 'reserved']
-
-        vallist = list(struct.unpack(svn_struct, message))
-        if verbose:
-            print("Raw week number:", vallist[0])
-
-        snav_dict = dict(zip(keylist, vallist))
-        if verbose:
-            print("Original week number:", snav_dict['Wn'])
-        snav_dict['Wn'] = fix_gps_week_number(snav_Dict['Wn'])
-        if verbose:
-            print("Adjusted week number:", snav_dict['Wn'])
-
-        return snav_dict
+    def store_ephemeris(self, eph):
+        if self.g.ephemeris.Add(eph) and self.RINEX:
+            self.RINEX.write_rinex_nav(eph)
 
 ##############################################################################
 # GetGPSWeek -- use DAL NMEA message to get GPS week number and and
@@ -401,9 +293,15 @@ class AshtechMessages:
 
         # uZ has a "GPS Week" command so use it if we can
         if self.g.rx_type == "UZ":
-            gps_week = self.Commands.QueryRespond("WKN")
-            gps_week = gps_week.split(',')[1]
-            gps_week = gps_week.split('*', 1)[0]
+            reply = self.Commands.QueryRespond("WKN").split(',')
+            gps_week = reply[1].split('*', 1)[0].strip() \
+                if len(reply) > 1 else ''
+            if not gps_week.isdigit():
+                # no (or a garbled) reply; the host clock will do, as
+                # below for a missing DAL
+                gps_week = clock_gps_week()
+                print("No WKN reply from receiver; using GPS week",
+                      gps_week, "from system clock")
 
             # correct for epoch
             gps_week = fix_rollover(gps_week)
@@ -413,31 +311,27 @@ class AshtechMessages:
         # in theory, we should be able to do $PASHQ,DAL,A to get one
         # sentence, but that doesn't work, at least on my Z12.
         # So instead we start streaming the sentence then stop
-        # after we get one.
-
-        # enable NMEA output
-        self.Commands.SetCommand("OUT,A,NMEA")
-        time.sleep(1)
-
-        # set sentence rate to every 20 seconds, so we
-        # have time to turn it off before getting flooded
-        self.Commands.SetCommand("NME,PER,20")
-        time.sleep(1)
-
-        # start streaming DAL sentence
-        self.Commands.SetCommand("NME,DAL,A,ON")
-        time.sleep(1)
-
-        self.SerPort.reset_input()		# clear out garbage
+        # after we get one.  Each period brings a sentence for every
+        # satellite in the almanac; we used to set a 20 second period so
+        # as to turn them off before getting flooded, but then the first
+        # one can be 20 seconds coming.  A period just long enough to
+        # send a whole almanac at our baud rate (1 second at 115200)
+        # never lets the receiver's output back up, so the ACK for
+        # turning them off waits behind one burst at most.
+        baud = int(self.g.opts.get('baud') or 9600)
+        period = max(1, math.ceil(self.DAL_BYTES * 10 / baud))
+        self.Commands.SetCommands(["OUT,A,NMEA", "NME,PER," + str(period),
+                                   "NME,DAL,A,ON"], verbose=verbose)
 
         gps_week = 0
-        messasge = b''
-        while not gps_week:
+        deadline = time.monotonic() + self.DAL_TIMEOUT + period
+        while not gps_week and time.monotonic() < deadline:
             # get one sentence
-            time.sleep(0.1)
-            message = self.SerPort.read_line()
-            if message:
-                response = message.split(b',')
+            frame = self.SerPort.wait_for('DAL', deadline - time.monotonic())
+            if frame:
+                response = bytes(frame[1]).split(b',')
+                if len(response) < 14:
+                    continue
 
                 # Wn is contained in field 13 before "*" and checksum,
                 # except some receivers don't include the checksum
@@ -447,9 +341,16 @@ class AshtechMessages:
                     gps_week = response[13]
 
         # turn off NMEA sentences
-        self.Commands.SetCommand("NME,ALL,A,OFF")
+        self.Commands.SetCommands(["NME,ALL,A,OFF"], verbose=verbose)
         self.SerPort.reset_input()		# clear out leftovers
 
+        if not gps_week:
+            # fall back on the host clock; good enough unless it's wrong
+            # by more than the quarter hour that seq_time() allows
+            gps_week = clock_gps_week()
+            print("No DAL sentence from receiver; using GPS week",
+                  gps_week, "from system clock")
+
         if verbose:
             print("Raw GPS week:", gps_week)
 
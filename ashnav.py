@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+
+################################  N8UR ASHCOMM  ################################
+#
+#	Copyright 2019 by John Ackermann, N8UR jra@febo.com https://febo.com
+#	Version number can be found in the ashglobal.py file
+#
+#	This program is free software; you can redistribute it and/or modify
+#	it under the terms of the GNU General Public License as published by
+#	the Free Software Foundation; either version 2 of the License, or
+#	(at your option) any later version.
+#
+#	This program is distributed in the hope that it will be useful,
+#	but WITHOUT ANY WARRANTY; without even the implied warranty of
+#	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#	GNU General Public License for more details.
+#	Software to communicate with Ashtech GPS receivers via serial port.
+################################################################################
+
+#############################   ashnav.py    ###################################
+
+import math
+
+from ashtime import *
+
+###############################################################################
+# Broadcast ephemerides.  SNV messages (decoded by SnvHandler in
+# ashhandler.py) go into an EphemerisCache keyed by PRN and IODE, so a
+# repeat of an ephemeris we already have is recognised and dropped, and
+# anything that wants orbits (the RINEX nav writer, visibility prediction)
+# can ask the cache rather than re-reading a nav file.  nav_record() turns
+# one ephemeris into a RINEX 2.11 navigation record.
+###############################################################################
+
+# URA index to meters, ICD-GPS-200 20.3.3.3.1.3
+URA_METERS = (2.4, 3.4, 4.85, 6.85, 9.65, 13.65, 24.0, 48.0, 96.0, 192.0,
+              384.0, 768.0, 1536.0, 3072.0, 6144.0, 6144.0)
+
+###############################################################################
+###############################################################################
+# EphemerisCache -- ephemerides by PRN and IODE
+###############################################################################
+###############################################################################
+
+
+class EphemerisCache:
+    HISTORY = 4				# IODEs kept per PRN
+
+###############################################################################
+###############################################################################
+    def __init__(self):
+        self.ephemerides = {}			# prn -> {iode: ephemeris}
+        self.latest = {}			# prn -> newest ephemeris
+        self.added = 0
+        self.repeats = 0
+
+    def __len__(self):
+        return len(self.latest)
+
+    def __contains__(self, prn):
+        return prn in self.latest
+
+###############################################################################
+# Add -- store an ephemeris (a dict from SnvHandler); returns True if it's
+# new, False if we already had this PRN and IODE with the same toe
+###############################################################################
+    def Add(self, eph):
+        prn = eph['prn']
+        iode = eph['aode']
+        by_iode = self.ephemerides.setdefault(prn, {})
+        old = by_iode.get(iode)
+        if old is not None and old['toe'] == eph['toe'] and \
+                old['wn'] == eph['wn']:
+            self.repeats += 1
+            return False
+
+        by_iode.pop(iode, None)			# re-insert as the newest
+        by_iode[iode] = eph
+        while len(by_iode) > self.HISTORY:
+            del by_iode[next(iter(by_iode))]
+        self.latest[prn] = eph
+        self.added += 1
+        return True
+
+###############################################################################
+# Get -- the ephemeris for prn with the given IODE, or the newest one;
+# None if we don't have it
+###############################################################################
+    def Get(self, prn, iode=None):
+        if iode is None:
+            return self.latest.get(prn)
+        return self.ephemerides.get(prn, {}).get(iode)
+
+###############################################################################
+# Find -- the ephemeris for prn whose toe is nearest to week/tow
+###############################################################################
+    def Find(self, prn, week, tow):
+        best = None
+        for eph in self.ephemerides.get(prn, {}).values():
+            age = abs((week - eph['wn']) * 604800 + tow - eph['toe'])
+            if best is None or age < best[0]:
+                best = (age, eph)
+        return best[1] if best else None
+
+###############################################################################
+# All -- newest ephemeris for every PRN we have, in PRN order
+###############################################################################
+    def All(self):
+        return [self.latest[prn] for prn in sorted(self.latest)]
+
+###############################################################################
+# nav_float -- format a number the way RINEX 2 nav files do (FORTRAN
+# D19.12: " 0.123456789012D-04")
+###############################################################################
+
+
+def nav_float(value):
+    if value == 0:
+        return " 0.000000000000D+00"
+    text = "{:.11E}".format(abs(value))		# d.dddddddddddE+xx
+    digits = text[0] + text[2:13]
+    exponent = int(text[14:]) + 1
+    return "{}0.{}D{:+03d}".format('-' if value < 0 else ' ',
+                                    digits, exponent)
+
+###############################################################################
+# nav_record -- RINEX 2.11 navigation record for one ephemeris, as a list
+# of lines (no newlines).  Angles go from semicircles to radians.
+###############################################################################
+
+
+def nav_record(eph):
+    semicircle = math.pi
+
+    (sec, minute, hour, mday, mon, year,
+     weeknum, yday) = GpsTime.FromSeconds(eph['wn'], eph['toc']).time_list
+    line = "{:2d} {:02d} {:2d} {:2d} {:2d} {:2d}{:5.1f}".format(
+        eph['prn'], int(year) % 100, int(mon), int(mday), int(hour),
+        int(minute), float(sec))
+    lines = [line + nav_float(eph['af0']) + nav_float(eph['af1']) +
+             nav_float(eph['af2'])]
+
+    ura = eph['accuracy']
+    fit = 6.0 if eph['fit'] else 4.0
+    orbits = (
+        (eph['aode'], eph['crs'], eph['deltan'] * semicircle,
+         eph['m0'] * semicircle),
+        (eph['cuc'], eph['e'], eph['cus'], eph['roota']),
+        (eph['toe'], eph['cic'], eph['omega0'] * semicircle, eph['cis']),
+        (eph['i0'] * semicircle, eph['crc'], eph['omega'] * semicircle,
+         eph['omegadot'] * semicircle),
+        (eph['idot'] * semicircle, 0.0, eph['wn'], 0.0),
+        (URA_METERS[ura] if 0 <= ura < 16 else float(ura), eph['health'],
+         eph['tgd'], eph['aodc']),
+        (eph['tow'], fit))
+    for orbit in orbits:
+        lines.append("   " + "".join(nav_float(value) for value in orbit))
+    return lines
+
+# end of ashnav.py
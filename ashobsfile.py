@@ -0,0 +1,457 @@
+#!/usr/bin/env python3
+
+################################  N8UR ASHCOMM  ################################
+#
+#	Copyright 2019 by John Ackermann, N8UR jra@febo.com https://febo.com
+#	Version number can be found in the ashglobal.py file
+#
+#	This program is free software; you can redistribute it and/or modify
+#	it under the terms of the GNU General Public License as published by
+#	the Free Software Foundation; either version 2 of the License, or
+#	(at your option) any later version.
+#
+#	This program is distributed in the hope that it will be useful,
+#	but WITHOUT ANY WARRANTY; without even the implied warranty of
+#	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#	GNU General Public License for more details.
+#	Software to communicate with Ashtech GPS receivers via serial port.
+################################################################################
+
+#############################   ashobsfile.py    ###############################
+
+import mmap
+
+from ashtime import *
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+###############################################################################
+# Reading back RINEX 2.11 observation files like the ones Rinex writes.
+#
+#	obs = ObsFile("site2910.26o")
+#	print(obs.header.obs_types)
+#	for epoch in obs:
+#		print(epoch.time, epoch.sats, epoch.obs[0])
+#	obs.Close()
+#
+# The file is memory-mapped and the header parsed once.  Epochs are made
+# one at a time as the loop asks for them, and an epoch's observations
+# are only converted when something reads them: the epoch's lines are
+# padded to 80 columns so the fields of the whole block sit at fixed
+# strides, and are cut out and converted together.
+# Arrays() does the same for the whole file at once with NumPy.
+###############################################################################
+
+LINE = 80			# observation lines are padded to this
+PER_LINE = 5			# observations per line
+FIELD = 16			# 14 for the value, then LLI and signal strength
+BLANK = b' ' * 14
+NAN = float('nan')
+SEPARATOR = b'|'
+FLAGS = bytes.maketrans(b' 0123456789', bytes(1) + bytes(range(10)))
+CHUNK = 65536			# observations per Arrays() conversion step
+RELEASE = 1 << 22		# bytes read between handing pages back
+
+###############################################################################
+###############################################################################
+# ObsHeader -- the header of an observation file, as the list of 80
+# column lines (without newlines) that Rinex.obs_file_header() builds.
+# lines keeps the header as read so it can be written back unchanged;
+# the fields a reader usually wants are parsed out of it, and again after
+# Set() or Remove().
+###############################################################################
+###############################################################################
+
+
+class ObsHeader:
+
+###############################################################################
+###############################################################################
+    def __init__(self, lines):
+        self.lines = lines
+        self.parse()
+
+###############################################################################
+# parse -- pick the fields out of lines
+###############################################################################
+    def parse(self):
+        first = self.lines[0] if self.lines else ""
+        try:
+            self.version = float(first[:9])
+        except ValueError:
+            self.version = None
+        self.file_type = first[20:21]
+        self.system = first[40:41].strip() or 'G'
+
+        self.obs_types = []
+        for content in self.Get('# / TYPES OF OBSERV'):
+            self.obs_types += content[6:60].split()
+        self.lines_per_sat = max(1, -(-len(self.obs_types) // PER_LINE))
+
+        marker = self.Get('MARKER NAME')
+        self.marker = marker[0].strip() if marker else ""
+        interval = self.Get('INTERVAL')
+        self.interval = float(interval[0][:10]) if interval else None
+        self.first_obs = header_time(self.Get('TIME OF FIRST OBS'))
+        self.last_obs = header_time(self.Get('TIME OF LAST OBS'))
+
+###############################################################################
+# Get -- the contents (columns 1-60) of every line with this label
+###############################################################################
+    def Get(self, label):
+        return [line[:60] for line in self.lines
+                if line[60:].rstrip() == label]
+
+###############################################################################
+# Set -- replace the lines with this label by lines, where the first of
+# them was or else just before END OF HEADER
+###############################################################################
+    def Set(self, label, lines):
+        where = [i for i, line in enumerate(self.lines)
+                 if line[60:].rstrip() == label]
+        if not where:
+            where = [i for i, line in enumerate(self.lines)
+                     if line[60:].rstrip() == 'END OF HEADER'][:1] or \
+                [len(self.lines)]
+            self.lines[where[0]:where[0]] = lines
+        else:
+            self.lines = [line for i, line in enumerate(self.lines)
+                          if i not in where[1:]]
+            self.lines[where[0]:where[0] + 1] = lines
+        self.parse()
+
+###############################################################################
+# Remove -- drop the lines with this label
+###############################################################################
+    def Remove(self, label):
+        self.lines = [line for line in self.lines
+                      if line[60:].rstrip() != label]
+        self.parse()
+
+###############################################################################
+# Text -- the header as it would be written
+###############################################################################
+    def Text(self):
+        return "".join(line + "\n" for line in self.lines)
+
+###############################################################################
+###############################################################################
+# ObsEpoch -- one epoch record.  offset and end are its byte range in the
+# file.  sats are the satellite ids ("G01"), and obs, lli and ssi hold one
+# entry per satellite in the same order: the values (NaN where blank) in
+# header obs_types order, and the flags as bytes (0 where blank).
+#
+# Event records (flags 2 to 5) have no satellites; their header lines are
+# in records.
+###############################################################################
+###############################################################################
+
+
+class ObsEpoch:
+    __slots__ = ('offset', 'end', 'time', 'flag', 'sats', 'clock', 'block',
+                 'types', 'records', 'values')
+
+###############################################################################
+###############################################################################
+    def __init__(self, offset, end, time, flag, sats, clock, block, types):
+        self.offset = offset
+        self.end = end
+        self.time = time		# GpsTime, or None for some events
+        self.flag = flag
+        self.sats = sats
+        self.clock = clock		# receiver clock offset, or None
+        self.block = block		# satellite lines, as in the file
+        self.types = types
+        self.records = []
+        self.values = None		# (obs, lli, ssi), when needed
+
+###############################################################################
+# obs, lli, ssi -- converted on first use
+###############################################################################
+    @property
+    def obs(self):
+        return (self.values or self.convert())[0]
+
+    @property
+    def lli(self):
+        return (self.values or self.convert())[1]
+
+    @property
+    def ssi(self):
+        return (self.values or self.convert())[2]
+
+###############################################################################
+# Value -- one observation, by satellite id and observation type
+###############################################################################
+    def Value(self, sat, obs_type):
+        return self.obs[self.sats.index(sat)][self.types.index(obs_type)]
+
+###############################################################################
+# convert -- turn the block into values and flags.  The flag columns are
+# picked out with extended slices; overwritten with separators, what's left
+# splits into the value fields, blank ones becoming "nan" first.
+###############################################################################
+    def convert(self):
+        block = pad_lines(self.block)
+        fields = len(block) // FIELD
+        llis = block[14::FIELD].translate(FLAGS)
+        ssis = block[15::FIELD].translate(FLAGS)
+        text = bytearray(block)
+        text[14::FIELD] = SEPARATOR * fields
+        text[15::FIELD] = SEPARATOR * fields
+        values = list(map(float, bytes(text).replace(BLANK, b'nan').split(
+            SEPARATOR * 2)[:fields]))
+
+        count = len(self.types)
+        step = -(-count // PER_LINE) * PER_LINE
+        self.values = (
+            [values[i:i + count] for i in range(0, fields, step)],
+            [llis[i:i + count] for i in range(0, fields, step)],
+            [ssis[i:i + count] for i in range(0, fields, step)])
+        return self.values
+
+###############################################################################
+###############################################################################
+# ObsFile -- a RINEX 2.11 observation file, read through a memory map
+###############################################################################
+###############################################################################
+
+
+class ObsFile:
+
+###############################################################################
+###############################################################################
+    def __init__(self, filename):
+        self.filename = filename
+        self.file = open(filename, 'rb')
+        self.map = None
+        self.days = {}		# b'yy mm dd' -> ms of that day
+        try:
+            self.map = mmap.mmap(self.file.fileno(), 0,
+                                 access=mmap.ACCESS_READ)
+        except ValueError:		# empty file
+            self.Close()
+            raise ValueError(filename + ": empty file")
+
+        end = self.map.find(b'END OF HEADER')
+        if end < 0:
+            self.Close()
+            raise ValueError(filename + ": no END OF HEADER")
+        self.data_start = self.map.find(b'\n', end) + 1 or len(self.map)
+        self.header = ObsHeader(
+            self.map[:self.data_start].decode('ascii', 'replace')
+            .rstrip('\r\n').replace('\r', '').split('\n'))
+        if self.header.version is None or \
+                not 2 <= self.header.version < 3 or \
+                self.header.file_type != 'O':
+            self.Close()
+            raise ValueError(filename +
+                             ": not a RINEX 2 observation file")
+
+###############################################################################
+# Close -- release the map and the file
+###############################################################################
+    def Close(self):
+        if self.map is not None:
+            self.map.close()
+            self.map = None
+        self.file.close()
+
+###############################################################################
+# __iter__ -- all the epochs, from the start
+###############################################################################
+    def __iter__(self):
+        return self.Epochs()
+
+###############################################################################
+# Epochs -- yield ObsEpochs from byte offset (the first epoch by default),
+# which must be the start of an epoch record.  A record cut short by the
+# end of the file, as after a crash, is left out.
+###############################################################################
+    def Epochs(self, offset=None):
+        mm = self.map
+        types = self.header.obs_types
+        per_sat = self.header.lines_per_sat
+        mm.seek(self.data_start if offset is None else offset)
+        released = mm.tell() // mmap.PAGESIZE * mmap.PAGESIZE
+
+        while True:
+            start = mm.tell()
+            if start - released >= RELEASE:
+                released = self.release(released, start)
+            line = mm.readline()
+            if not line:
+                return
+            line = line.rstrip(b'\r\n')
+            if len(line) < 32:
+                continue			# blank line, or junk
+            flag = line[28] - 48 if line[28] != 32 else 0
+            count = int(line[29:32])
+            time = self.epoch_time(line)
+            clock = line[68:80].strip()
+            clock = float(clock) if clock else None
+
+            if 2 <= flag <= 5:
+                records = [mm.readline() for i in range(count)]
+                if records and not records[-1].endswith(b'\n'):
+                    return
+                epoch = ObsEpoch(start, mm.tell(), time, flag, [], clock,
+                                 b'', types)
+                epoch.records = [record.rstrip(b'\r\n').decode(
+                    'ascii', 'replace') for record in records]
+                yield epoch
+                continue
+
+            sats = line[32:68]
+            for i in range((count - 1) // 12):
+                sats += mm.readline().rstrip(b'\r\n')[32:68]
+            sats = sats.decode('ascii', 'replace')
+            sats = [sats[i:i + 3] if sats[i] != ' ' else
+                    'G' + sats[i + 1:i + 3] for i in range(0, count * 3, 3)]
+
+            # the satellite lines, kept as they are: one slice and a split
+            # to find where they end, unless the file ends or a line is
+            # longer than it should be
+            lines = count * per_sat
+            here = mm.tell()
+            chunk = mm[here:here + lines * (LINE + 2)]
+            body = chunk.split(b'\n', lines)
+            if len(body) > lines:
+                block = chunk[:len(chunk) - len(body[-1])]
+            else:
+                block = b''.join([mm.readline() for i in range(lines)])
+                if not block.endswith(b'\n'):
+                    return			# cut short
+            mm.seek(here + len(block))
+            yield ObsEpoch(start, mm.tell(), time, flag, sats, clock, block,
+                           types)
+
+###############################################################################
+# release -- tell the OS we're done with the pages from released up to
+# offset, so reading a big file doesn't fill memory with it; returns the
+# new released mark
+###############################################################################
+    def release(self, released, offset):
+        offset = offset // mmap.PAGESIZE * mmap.PAGESIZE
+        if hasattr(mmap, 'MADV_DONTNEED'):
+            self.map.madvise(mmap.MADV_DONTNEED, released, offset - released)
+        return offset
+
+###############################################################################
+# epoch_time -- GpsTime of an epoch line, or None if it's blank
+###############################################################################
+    def epoch_time(self, line):
+        day = line[1:9]
+        if not day.strip():
+            return None
+        day_ms = self.days.get(day)
+        if day_ms is None:
+            year = int(line[1:3])
+            year += 1900 if year >= 80 else 2000
+            day_ms = self.days[day] = GpsTime.FromCalendar(
+                year, int(line[4:6]), int(line[7:9])).total
+        return GpsTime(0, day_ms + (int(line[10:12]) * 60 +
+                                    int(line[13:15])) * 60000 +
+                       int(round(float(line[15:26]) * 1000)))
+
+###############################################################################
+# Arrays -- the whole file as NumPy arrays, one row per satellite per
+# epoch: 'time' (ms since the GPS epoch), 'sat' (ids), 'obs' (float, NaN
+# where blank), 'lli' and 'ssi' (uint8); columns in header obs_types
+# order.  Returns None without NumPy.
+###############################################################################
+    def Arrays(self):
+        if numpy is None:
+            print("ObsFile.Arrays() needs NumPy")
+            return None
+
+        times, sats, blocks = [], [], []
+        for epoch in self.Epochs():
+            if epoch.sats:
+                times += [epoch.time.total] * len(epoch.sats)
+                sats += epoch.sats
+                blocks.append(epoch.block)
+
+        count = len(self.header.obs_types)
+        width = self.header.lines_per_sat * PER_LINE
+        chars = numpy.frombuffer(pad_lines(b''.join(blocks)),
+                                 numpy.uint8).reshape(
+            len(sats), width, FIELD)[:, :count]
+        flags = chars[:, :, 14:]
+        flags = numpy.where((flags >= 48) & (flags <= 57), flags - 48,
+                            0).astype(numpy.uint8)
+        return {'time': numpy.array(times, numpy.int64),
+                'sat': numpy.array(sats, 'S3'),
+                'obs': column_floats(chars[:, :, :14].reshape(-1, 14))
+                .reshape(len(sats), count),
+                'lli': flags[:, :, 0],
+                'ssi': flags[:, :, 1]}
+
+###############################################################################
+# NOT IN ObsFile class
+###############################################################################
+
+###############################################################################
+# header_time -- GpsTime from TIME OF FIRST/LAST OBS contents, or None
+###############################################################################
+
+
+def header_time(contents):
+    if not contents:
+        return None
+    try:
+        fields = contents[0][:43].split()
+        return GpsTime.FromCalendar(*[int(field) for field in fields[:5]],
+                                    float(fields[5]))
+    except (ValueError, IndexError):
+        return None
+
+###############################################################################
+# pad_lines -- observation lines as they are in the file to one string of
+# 80 column lines, without line ends, so every field is at a fixed offset
+###############################################################################
+
+
+def pad_lines(text):
+    lines = text.replace(b'\r', b'').split(b'\n')[:-1]
+    if max(map(len, lines), default=0) > LINE:
+        lines = [line[:LINE] for line in lines]
+    return b''.join([line.ljust(LINE) for line in lines])
+
+###############################################################################
+# column_floats -- convert an (n, 14) uint8 array of RINEX value fields to
+# floats.  Fields in the usual F14.3 form are turned into integers with
+# one matrix product and divided by 1000, which gives the same double as
+# float() on the text; anything else goes through NumPy's own parser.
+###############################################################################
+
+
+def column_floats(chars):
+    digits = [i for i in range(14) if i != 10]
+    weights = 10.0 ** numpy.arange(12, -1, -1)
+
+    values = numpy.empty(len(chars))
+    for start in range(0, len(chars), CHUNK):
+        part = chars[start:start + CHUNK]
+        columns = part[:, digits]
+        digit = numpy.maximum(columns, 48) - 48
+        blank = (columns == 32).all(1) & (part[:, 10] == 32)
+        fixed = ((digit <= 9) & ((columns >= 48) | (columns == 32) |
+                                 (columns == 45))).all(1) & \
+            (part[:, 10] == 46)
+
+        value = digit.astype(float) @ weights
+        value /= 1000
+        value[(columns == 45).any(1)] *= -1
+        value[blank] = numpy.nan
+        other = ~(fixed | blank)
+        if other.any():
+            value[other] = numpy.ascontiguousarray(part[other]).view(
+                'S14').ravel().astype(float)
+        values[start:start + len(part)] = value
+    return values
+
+# end of ashobsfile.py
@@ -35,7 +35,7 @@ class AshtechOpts:
 ###############################################################################
 # getargs -- get command line arguments and supply defaults
 ###############################################################################
-    def getargs(self):
+    def getargs(self, argv=None):
         args = argparse.ArgumentParser()
 
         def str2bool(v):
@@ -53,13 +53,61 @@ class AshtechOpts:
                           nargs='?', const=True, help='be verbose')
 
         args.add_argument('-s', '--serport', default='/dev/ttyS0', type=str,
-                          help='host computer serial port')
+                          help='host computer serial port '
+                          '(comma-separated list for ashfleet.py)')
         args.add_argument('-b', '--baud', default=115200, type=int,
                           help='baud rate')
         args.add_argument('-p', '--hwport', default='A', type=str,
                           help='receiver hardware port')
         args.add_argument('-f', '--rinex_file', default='', type=str,
                           help='file name -- blank to auto-generate; \"NONE\" to skip')
+        args.add_argument('--capture', default='', type=str,
+                          help='raw capture file -- ashcomm writes every byte '
+                          'received to it; ashreplay reads it back')
+        args.add_argument('--realtime', default='False', type=str2bool,
+                          nargs='?', const=True,
+                          help='ashreplay: replay at the captured pace')
+        args.add_argument('--nav', default='True', type=str2bool,
+                          nargs='?', const=True,
+                          help='also write a RINEX navigation file from the '
+                          'receiver\'s ephemerides')
+        args.add_argument('--rinex_version', default=2, type=int,
+                          choices=[2, 3],
+                          help='RINEX observation file version: 2 (2.11, '
+                          'the default) or 3 (3.04)')
+        args.add_argument('--blank_missing', default='False', type=str2bool,
+                          nargs='?', const=True,
+                          help='leave observations the receiver reports as '
+                          'zero blank in the RINEX file')
+        args.add_argument('--index', default='True', type=str2bool,
+                          nargs='?', const=True,
+                          help='keep an epoch index (FILE.idx) next to '
+                          'each obs file')
+        args.add_argument('--decimate', default='', type=str,
+                          help='also write obs files keeping only epochs at '
+                          'these intervals in seconds, e.g. "30" or "30,300", '
+                          'each in a directory named like "30s"')
+        args.add_argument('--hatanaka', default='False', type=str2bool,
+                          nargs='?', const=True,
+                          help='write obs files as Compact RINEX (.yyd) '
+                          'as the epochs come in, not RINEX (.yyo)')
+        args.add_argument('--compress', default='none', type=str,
+                          choices=['none', 'gz', 'xz'],
+                          help='gzip or xz each RINEX file once it\'s '
+                          'finished, in a background process (default none)')
+        args.add_argument('--rotate', default='none', type=str,
+                          choices=['none', '15min', 'hourly', 'daily'],
+                          help='start a new RINEX file every 15 minutes, '
+                          'hour or day (default none)')
+        args.add_argument('--state_dir', default='~/.ashcomm', type=str,
+                          help='where to remember each port\'s receiver '
+                          'between runs ("" to always probe)')
+        args.add_argument('--flush_secs', default=0, type=int,
+                          help='seconds between flushes of the obs file '
+                          '(default 0: flush every epoch)')
+        args.add_argument('--fsync_epochs', default=0, type=int,
+                          help='fsync the obs file every N epochs '
+                          '(default 0: only when closing)')
 
         # receiver configuration options
         args.add_argument('--elmask', default=10, type=int,
@@ -67,7 +115,8 @@ class AshtechOpts:
         args.add_argument('--dopmask', default=10, type=int,
                           help='dop mask')
         args.add_argument('--site_name', default='TEST', type=str,
-                          help='site name \(max 4 char\)')
+                          help='site name \(max 4 char\) '
+                          '(comma-separated list for ashfleet.py)')
         args.add_argument('--project_name', default='', type=str,
                           help='project name \(max 20 char\)')
         args.add_argument('--msg_rate', default=20, type=int,
@@ -101,6 +150,6 @@ class AshtechOpts:
         args.add_argument('--antenna_north', default=0, type=float,
                           help='antenna northing')
 
-        self.g.opts = vars(args.parse_args())
+        self.g.opts = vars(args.parse_args(argv))
 
         return
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+
+################################  N8UR ASHCOMM  ################################
+#
+#	Copyright 2019 by John Ackermann, N8UR jra@febo.com https://febo.com
+#	Version number can be found in the ashglobal.py file
+#
+#	This program is free software; you can redistribute it and/or modify
+#	it under the terms of the GNU General Public License as published by
+#	the Free Software Foundation; either version 2 of the License, or
+#	(at your option) any later version.
+#
+#	This program is distributed in the hope that it will be useful,
+#	but WITHOUT ANY WARRANTY; without even the implied warranty of
+#	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#	GNU General Public License for more details.
+#	Software to communicate with Ashtech GPS receivers via serial port.
+################################################################################
+
+#############################   ashreplay.py    ################################
+
+import sys
+import time
+import signal
+import datetime
+
+from ashcapture import *
+from ashcommand import *
+from ashmessage import *
+from ashrinex import *
+from ashrinex3 import *
+from ashglobal import *
+from ashopt import *
+from asherror import *
+
+###############################################################################
+# ashreplay.py regenerates RINEX from a raw capture made with
+# "ashcomm.py --capture=FILE".  It takes the same RINEX header options as
+# ashcomm.py; --capture names the file to read, and --realtime replays at
+# the original pace instead of flat out.  At the end it reports how fast
+# the parse -> RINEX path ran.
+###############################################################################
+
+###############################################################################
+# MAIN PROGRAM
+###############################################################################
+
+
+def main():
+    g = AshtechGlobals()
+    option = AshtechOpts(g)
+
+    option.getargs()
+    verbose = g.opts['verbose']
+    if not g.opts['capture']:
+        print("Need --capture=FILE to replay")
+        sys.exit(1)
+
+    # store the original SIGINT handler
+    original_sigint = signal.getsignal(signal.SIGINT)
+    error = AshtechError(original_sigint, g)
+    signal.signal(signal.SIGINT, error.exit_handler)
+    signal.signal(signal.SIGTERM, error.exit_handler)
+
+    Replay = AshtechReplay(g.opts['capture'], g.opts['realtime'], verbose)
+    Replay.Prescan(g)
+    if not g.rid or not g.gps_week:
+        print("Capture doesn't include the receiver ID and GPS week replies;",
+              "can't build a RINEX header")
+        sys.exit(1)
+
+    Commands = AshtechCommands(Replay, g, verbose)
+    RINEX = new_rinex(Commands, g, verbose)
+    Messages = AshtechMessages(Replay, Commands, g, RINEX, verbose)
+    # there's nobody to take the startup replies, and SID's bare lines
+    # look like messages of unknown type; count them, don't report each
+    Messages.Registry.report_unknown = False
+
+    g.start_time = datetime.datetime.utcnow()
+    RINEX.create_rinex_obs_file()
+    print()
+
+    start = time.perf_counter()
+    cpu = time.process_time()
+    Messages.MsgSwitch(verbose)
+    RINEX.Close()
+    elapsed = time.perf_counter() - start
+    cpu = time.process_time() - cpu
+
+    print()
+    print("Replayed {} bytes, {} frames, {} epochs in {:.2f} s "
+          "(CPU {:.2f} s): {:.0f} frames/s, {:.1f} epochs/s".format(
+              Replay.bytes, Replay.decoder.frames, g.obs_epoch_count,
+              elapsed, cpu, Replay.decoder.frames / max(elapsed, 1e-9),
+              g.obs_epoch_count / max(elapsed, 1e-9)))
+    if Messages.Registry.unknown:
+        print("Skipped {} lines of unknown type (a uZ's SID reply is "
+              "two)".format(Messages.Registry.unknown))
+
+
+if __name__ == '__main__':
+    main()
+
+# end of ashreplay.py
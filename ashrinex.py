@@ -23,21 +23,52 @@ import sys
 import os
 import serial
 import getpass
+import threading
 
 from ashserial import *
 from ashcommand import *
 from ashutil import *
 from ashmessage import *
 from ashposition import *
+from ashnav import *
+from ashwriter import *
+from ashformat import *
+from ashobsfile import *
+from ashcrx import *
+from ashcompress import *
+
+
+# --rotate choices: file length in seconds
+ROTATE_SECS = {'none': 0, '15min': 900, 'hourly': 3600, 'daily': 86400}
 
 
 class Rinex:
 
+    # observation lines for one satellite; see ashformat.py
+    OBS_LAYOUT = (
+        (("%14.3f%1d%1d", ('ca_range', 'ca_lli', 'ca_sbyte')),
+         ("%14.3f%1d%1d", ('l1_range', 'l1_lli', 'l1_sbyte')),
+         ("%14.3f%1d%1d", ('l2_range', 'l2_lli', 'l2_sbyte')),
+         ("%14.3f%1d%1d", ('l1_phase', 'l1_phase_lli', 'l1_sbyte')),
+         ("%14.3f%1d%1d", ('l2_phase', 'l2_phase_lli', 'l2_sbyte'))),
+        (("%14.3f%1d%1d", ('l1_dopp', 'l1_lli', 'l1_sbyte')),
+         ("%14.3f%1d%1d", ('l2_dopp', 'l2_lli', 'l2_sbyte')),
+         ("%14.3f", ('l1_snr',)),
+         ("%14.3f", ('l2_snr',))))
+
+    CRX = True			# --hatanaka can compress it; see ashcrx.py
+
     ###############################################################################
     def __init__(self, commands, globs, verbose):
         self.Commands = commands
         self.g = globs
         self.verbose = verbose
+        self.formatter = EpochFormatter(self.OBS_LAYOUT,
+                                        bool(globs.opts.get('blank_missing')))
+        self.rotate_ms = 0		# file length; see create_rinex_obs_file()
+        self.period = None		# which file length slice we're writing
+        self.ahead = None		# period of the file opened ahead
+        self.header_lines = None	# the obs header last written
 
 ###############################################################################
     # help us keep columns lined up
@@ -50,6 +81,17 @@ class Rinex:
 ###############################################################################
     def write_rinex_obs(self, verbose=False):
 
+        # the exit handler may already have closed the file
+        if self.g.obs_writer.closed:
+            return
+
+        # with --rotate, each file holds one period; the epoch that starts
+        # a new one goes (with a new header) into the next file
+        if self.rotate_ms:
+            period = self.g.epoch.time.total // self.rotate_ms
+            if period != self.period:
+                self.rotate(period)
+
         if not self.g.wrote_rinex_obs_file_header:
             print("First Observation: {} (GPS week: {})".format(
                 self.g.first_observation_string, self.g.gps_week))
@@ -66,15 +108,41 @@ class Rinex:
         print(".", end="")
         sys.stdout.flush()  # flush so the dots appear right away
 
-        self.obs_epoch_header(verbose)
-        self.obs_epoch(verbose)
+        # one Write() per epoch, so a flush never splits one.  The epoch
+        # is formatted and encoded once, for every file that takes it.
+        time = self.g.epoch.time
+        data = ''.join([self.obs_epoch_header(verbose)] +
+                       self.obs_epoch(verbose)).encode('ascii', 'replace')
+        self.g.obs_writer.WriteBytes(data, time)
+        self.g.obs_writer.EndEpoch()
         self.g.obs_epoch_count += 1
+        for output in self.g.obs_outputs:
+            if output.Takes(time):
+                output.Write(data, time, self.header_lines)
+
+###############################################################################
+# Close -- flush and close the output files; safe to call more than once
+###############################################################################
+    def Close(self):
+        close_rinex_files(self.g)
 
 ###############################################################################
-# create_rinex_obs_file -- use name if provided, otherwise build it up
+# create_rinex_obs_file -- use name if provided, otherwise build it up.
+# With --nav, the navigation file is created alongside it.  With --rotate,
+# this is the file for the period we're in now by the system clock, and
+# the name comes from rotated_name().
 ###############################################################################
     def create_rinex_obs_file(self):
         clean_name = ''
+        rotate_secs = ROTATE_SECS.get(self.g.opts['rotate'] or 'none', 0)
+        if rotate_secs and self.g.opts['rinex_file']:
+            print("Not rotating files: --rinex_file gives a single name")
+        elif rotate_secs:
+            self.rotate_ms = rotate_secs * 1000
+            now = GpsTime(0, int((current_gps_time() - GPS_EPOCH).
+                                 total_seconds() * 1000))
+            self.period = now.total // self.rotate_ms
+
         if self.g.opts['rinex_file']:
             filename = self.g.opts['rinex_file']
             for c in filename:
@@ -88,7 +156,7 @@ class Rinex:
             if filename != clean_name:
                 print("changed requested file name",
                       filename, "to:", clean_name)
-            filename = clean_name
+            obs_filename = clean_name
         else:
             if self.g.opts['site_name']:
                 sitename = self.g.opts['site_name']
@@ -98,31 +166,217 @@ class Rinex:
                 sitename = clean_name
             else:
                 sitename = "NONE"
-            yday = str(datetime.datetime.utcnow().timetuple().tm_yday)
-            hour = int(datetime.datetime.utcnow().timetuple().tm_hour)
-            hour_letter = chr(ord('a') + hour)
-            year = \
-                str(int(datetime.datetime.utcnow().timetuple().tm_year) - 2000)
-            obs_filename = sitename + yday + hour_letter + "." + year + "o"
-            self.g.obs_filename = obs_filename
-
-            print("Attempting to create RINEX observations file:", obs_filename)
-
-            if os.path.isfile(obs_filename):
-                print(obs_filename,
-                      "already exists!  Do you want to overwrite? (y/n):", end='')
-                if input().lower().startswith('y'):
-                    os.remove(obs_filename)
-                else:
-                    print("Exiting so you can try again...")
-                    sys.exit(1)
-            try:
-                # Here we just create the file; we'll write to it elsewhere
-                open(obs_filename, 'x').close()
-            except:
-                print("Couldn't create", obs_filename,
-                      "!  Exiting so you can try again...")
+            if self.rotate_ms:
+                obs_filename = self.rotated_name(self.period)
+            else:
+                yday = str(datetime.datetime.utcnow().timetuple().tm_yday)
+                hour = int(datetime.datetime.utcnow().timetuple().tm_hour)
+                hour_letter = chr(ord('a') + hour)
+                year = str(int(
+                    datetime.datetime.utcnow().timetuple().tm_year) - 2000)
+                obs_filename = sitename + yday + hour_letter + "." + year + \
+                    "o"
+        if self.g.opts.get('hatanaka'):
+            if self.CRX:
+                obs_filename = crx_name(obs_filename)
+            else:
+                print("Not writing Compact RINEX: it's only done for",
+                      "RINEX 2.11")
+                self.g.opts['hatanaka'] = False
+        if self.g.opts.get('compress', 'none') != 'none':
+            self.g.compressor = Compressor(self.g.opts['compress'])
+        self.g.obs_filename = obs_filename
+
+        print("Attempting to create RINEX observations file:", obs_filename)
+
+        if os.path.isfile(obs_filename):
+            print(obs_filename,
+                  "already exists!  Do you want to overwrite? (y/n):", end='')
+            if input().lower().startswith('y'):
+                os.remove(obs_filename)
+            else:
+                print("Exiting so you can try again...")
                 sys.exit(1)
+        try:
+            # the file stays open until Close()
+            self.g.obs_writer = obs_writer(obs_filename, 'x', self.g.opts)
+        except OSError:
+            print("Couldn't create", obs_filename,
+                  "!  Exiting so you can try again...")
+            sys.exit(1)
+
+        if self.g.opts['nav']:
+            self.create_rinex_nav_file(obs_filename)
+
+        self.open_outputs(obs_filename)
+
+        if self.rotate_ms:
+            self.open_ahead(self.period + 1)
+
+###############################################################################
+# open_outputs -- with --decimate, an ObsOutput for each interval, writing
+# alongside obs_filename
+###############################################################################
+    def open_outputs(self, obs_filename):
+        try:
+            intervals = [float(field) for field in
+                         (self.g.opts['decimate'] or '').split(',')
+                         if field.strip()]
+        except ValueError:
+            print("Can't make sense of --decimate", self.g.opts['decimate'],
+                  "; writing only", obs_filename)
+            return
+        rate_ms = int(round(float(self.g.opts['msg_rate'] or 1) * 1000))
+        for seconds in intervals:
+            interval_ms = int(round(seconds * 1000))
+            if interval_ms <= 0 or interval_ms % rate_ms:
+                print("Not decimating to", seconds, "s: not a multiple of",
+                      "the", rate_ms / 1000, "s message rate")
+                continue
+            output = ObsOutput(interval_ms, self.g.opts, self.g.compressor,
+                               self.g.retiring)
+            output.Open(obs_filename)
+            self.g.obs_outputs.append(output)
+
+###############################################################################
+# rotated_name -- RINEX name for a period: ssssddd0.yyo for daily files,
+# ssssdddh.yyo (h = a..x) for hourly and ssssdddhmm.yyo for 15 minute ones
+# (.yyd with --hatanaka)
+###############################################################################
+    def rotated_name(self, period):
+        site = ''.join(c for c in self.g.opts['site_name'] or 'NONE'
+                       if c.isalnum())[:4]
+        start = GpsTime(0, period * self.rotate_ms).datetime
+        name = site + "{:03d}".format(start.timetuple().tm_yday)
+        if self.rotate_ms >= 86400000:
+            name += "0"
+        else:
+            name += chr(ord('a') + start.hour)
+            if self.rotate_ms < 3600000:
+                name += "{:02d}".format(start.minute)
+        name += ".{:02d}o".format(start.year % 100)
+        return crx_name(name) if self.g.opts.get('hatanaka') else name
+
+###############################################################################
+# open_rotated -- create the obs file for a period.  There's nobody to ask
+# about overwriting, so if the name is taken we add a number to it.
+###############################################################################
+    def open_rotated(self, period):
+        filename = self.rotated_name(period)
+        suffix = 0
+        while True:
+            name = filename + (".{}".format(suffix) if suffix else "")
+            try:
+                return obs_writer(name, 'x', self.g.opts)
+            except FileExistsError:
+                suffix += 1
+
+###############################################################################
+# open_ahead -- start opening the file for period in the background, so
+# that rotate() doesn't wait on the file system
+###############################################################################
+    def open_ahead(self, period):
+        def run():
+            self.g.next_obs_writer = self.open_rotated(period)
+
+        self.g.next_obs_writer = None
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        self.g.next_obs_thread = thread
+        self.ahead = period
+
+###############################################################################
+# rotate -- switch to the file for period: retire the current obs and nav
+# files, take the one opened ahead (or open one now if we've skipped
+# periods), then start opening the one after.  The caller writes the
+# header and the epoch into the new file.
+###############################################################################
+    def rotate(self, period):
+        writer = take_ahead(self.g)
+        if self.ahead != period:
+            discard_empty(writer)
+            writer = None
+        if writer is None:
+            writer = self.open_rotated(period)
+
+        # everything written so far goes to the OS now; the fsync and
+        # close can take their time in the background
+        old = (self.g.obs_writer, self.g.nav_writer)
+        for file in old:
+            if file:
+                file.Flush()
+        in_background(self.g.retiring, retire, *old, self.g.compressor)
+        self.g.nav_writer = None
+
+        self.g.obs_writer = writer
+        self.g.obs_filename = writer.filename
+        self.g.wrote_rinex_obs_file_header = False
+        self.g.first_observation = self.g.epoch.time
+        self.g.first_observation_string = self.g.epoch.time.timestring()
+        self.period = period
+        print()
+        print("Rotating to", writer.filename)
+        if self.g.opts['nav']:
+            self.create_rinex_nav_file(writer.filename)
+        for output in self.g.obs_outputs:
+            output.Open(writer.filename)
+        self.open_ahead(period + 1)
+
+###############################################################################
+# create_rinex_nav_file -- navigation file named after the obs file
+# ("ssssdddh.yyn" for "ssssdddh.yyo" or ".yyd", else ".nav"), header
+# written now and records as new ephemerides arrive.  It goes with the obs
+# file, so if that was overwritten so is this.
+###############################################################################
+    def create_rinex_nav_file(self, obs_filename):
+        base, ext = os.path.splitext(obs_filename)
+        if ext[-1:] in ('o', 'O', 'd', 'D'):
+            nav_filename = base + ext[:-1] + 'n'
+        else:
+            nav_filename = base + '.nav'
+        print("Creating RINEX navigation file:", nav_filename)
+
+        try:
+            writer = RinexWriter(nav_filename, 'w')
+        except OSError:
+            print("Couldn't create", nav_filename,
+                  "!  Carrying on without a nav file")
+            return
+        writer.Write(line + "\n" for line in self.nav_file_header())
+        writer.Flush()
+        self.g.nav_writer = writer
+        self.g.nav_filename = nav_filename
+
+        # ephemerides we already have go in first
+        for eph in self.g.ephemeris.All():
+            self.write_rinex_nav(eph)
+
+###############################################################################
+# nav_file_header -- header lines for the nav file
+###############################################################################
+    def nav_file_header(self):
+        header = []
+        header.append("{:9.2f}{:11}{:<20}{:<20}{:<20}".format(
+            2.11, " ", "N: GPS NAV DATA", "", "RINEX VERSION / TYPE"))
+        date = datetime.date.today().strftime("%d %B %Y")
+        header.append("{:<20}{:<20}{:<20}{:<20}".format(
+            self.g.PROG_NAME, self.g.opts['operator'], date,
+            "PGM / RUN BY / DATE"))
+        header.append("{:6d}{:<54}{:<20}".format(
+            self.g.LEAPSECONDS, "", "LEAP SECONDS"))
+        header.append("{:<60}{:<20}".format("", "END OF HEADER"))
+        return header
+
+###############################################################################
+# write_rinex_nav -- append one ephemeris to the nav file
+###############################################################################
+    def write_rinex_nav(self, eph):
+        if not self.g.nav_writer or self.g.nav_writer.closed:
+            return
+        # records are few and far between, so flush each one
+        self.g.nav_writer.Write(line + "\n" for line in nav_record(eph))
+        self.g.nav_writer.Flush()
+        self.g.nav_record_count += 1
 
 ###############################################################################
 # obs_file_header -- assemble and return the file header at
@@ -135,15 +389,7 @@ class Rinex:
 
         # column count starts with 1.  header ID is columns 61-80
         # print(self.ruler)
-        header = []
-        string = "{:9.2f}{:11}{:<20}{:<20}{:<20}".format(2.11,
-                                                         " ", "OBSERVATION", "GPS ", "RINEX VERSION / TYPE")
-        header.append(string)
-        date = datetime.date.today().strftime("%d %B %Y")
-
-        string = "{:<20}{:<20}{:<20}{:<20}".format(self.g.PROG_NAME,
-                                                   self.g.opts['operator'], date, "PGM / RUN BY / DATE")
-        header.append(string)
+        header = self.version_lines()
 
         if self.g.opts['comment']:
             string = "{:<60}{:<20}".format("Comment", "COMMENT")
@@ -154,6 +400,7 @@ class Rinex:
         string = "{:<60}{:<20}".format(self.g.opts['marker_number'],
                                        "MARKER NUMBER")
         header.append(string)
+        header += self.marker_type_lines()
         # if not otherwise specified, get login name
         if self.g.opts['observer']:
             observer = self.g.opts['observer']
@@ -163,8 +410,10 @@ class Rinex:
                                              self.g.opts['agency'], "OBSERVER / AGENCY")
         header.append(string)
 
-        # Receiver Info
-        (rx_type, ch_opt, nav_ver, opts, ch_ver, ser_num) = self.Commands.QueryRID()
+        # Receiver Info; use what we learned at startup if we can
+        if not self.g.rid:
+            self.Commands.QueryRID()
+        (rx_type, ch_opt, nav_ver, opts, ch_ver, ser_num) = self.g.rid
 
         # for receiver number, use in this priority: (1) opts[rx_number],
         # (2) if uZ, receiver serial number; (3) "NONE"
@@ -211,83 +460,81 @@ class Rinex:
             "ANTENNA: DELTA H/E/N")
         header.append(string)
 
-        string = "{:6d}{:6d}{:6s}{:<42}{:<20}".format(
-            1, 1, "", "", "WAVELENGTH FACT L1/2")
-        header.append(string)
-
-        string = "{:6d}{:<54}{:<20}".format(
-            9, "    C1    P1    P2    L1    L2    D1    D2    S1    S2",
-            "# / TYPES OF OBSERV")
-        header.append(string)
+        header += self.obs_types_lines()
 
-        string = "{:10.3f}{:<50}{:<20}".format(
-            self.g.opts['msg_rate'], "", "INTERVAL")
-        header.append(string)
+        header.append(interval_line(self.g.opts['msg_rate']))
 
         # First observation time
 
         header.append(self.first_obs_time())
+        header += self.phase_shift_lines()
 
         string = "{:<60}{:<20}".format("", "END OF HEADER")
         header.append(string)
 
-        with open(self.g.obs_filename, 'a') as writer:
-            for i in header:
-                writer.write(i + "\n")
+        self.header_lines = header
+        self.g.obs_writer.Write(i + "\n" for i in header)
+        self.g.obs_writer.Flush()
 
         return
 
 ###############################################################################
-# first_obs_time -- create header line for first observation time
+# version_lines -- RINEX VERSION / TYPE and PGM / RUN BY / DATE
 ###############################################################################
-    def first_obs_time(self):
+    def version_lines(self):
+        date = datetime.date.today().strftime("%d %B %Y")
+        return ["{:9.2f}{:11}{:<20}{:<20}{:<20}".format(
+                    2.11, " ", "OBSERVATION", "GPS ", "RINEX VERSION / TYPE"),
+                "{:<20}{:<20}{:<20}{:<20}".format(
+                    self.g.PROG_NAME, self.g.opts['operator'], date,
+                    "PGM / RUN BY / DATE")]
+
+###############################################################################
+# marker_type_lines -- nothing for RINEX 2
+###############################################################################
+    def marker_type_lines(self):
+        return []
 
-        (sec, minute, hour, mday, mon, year,
-         weeknum, yday) = self.g.first_observation.time_list
+###############################################################################
+# obs_types_lines -- wavelength factors and the observation types
+###############################################################################
+    def obs_types_lines(self):
+        return ["{:6d}{:6d}{:6s}{:<42}{:<20}".format(
+                    1, 1, "", "", "WAVELENGTH FACT L1/2"),
+                "{:6d}{:<54}{:<20}".format(
+                    9, "    C1    P1    P2    L1    L2    D1    D2    S1    S2",
+                    "# / TYPES OF OBSERV")]
 
-        timestring = "{:2s}{:4d}".format(' ', int(year))
-        timestring += "{:4s}{:02d}".format(' ', int(mon))
-        timestring += "{:4s}{:02d}".format(' ', int(mday))
-        timestring += "{:4s}{:02d}".format(' ', int(hour))
-        timestring += "{:4s}{:02d}".format(' ', int(minute))
-        timestring += "{:13.7f}".format(float(sec))
-        timestring += "{:5s}".format(' ')
-        timestring += "{:3s}".format("GPS")
-        timestring += "{:9s}".format(' ')  # blanks to col 60; should be 2?
-        timestring += "TIME OF FIRST OBS"   # takes us to col 77
+###############################################################################
+# phase_shift_lines -- nothing for RINEX 2
+###############################################################################
+    def phase_shift_lines(self):
+        return []
 
-        return timestring
+###############################################################################
+# first_obs_time -- create header line for first observation time
+###############################################################################
+    def first_obs_time(self):
+        return obs_time_line(self.g.first_observation, "TIME OF FIRST OBS")
 
 ###############################################################################
-# obs_epoch_header -- assemble and return the observation header before
-# each stanza of mben records
+# obs_epoch_header -- assemble and return the observation header line
+# before each stanza of mben records
 ###############################################################################
     def obs_epoch_header(self, verbose=False):
 
         # get PRN list
-        prn_list = ''
-        count = 0
-        for i in self.g.mben_list:
-            if i:
-                count += 1
-                tmp = i['prn']
-                prn_list += 'G{:02d}'.format(i['prn'])
-        prn_list = '{:3d}'.format(count) + prn_list
-
-        # now get pben records for position and epoch
-        week = self.g.gps_week
-        tow = self.g.gps_tow
-        navx = self.g.current_pben['navx']
-        navy = self.g.current_pben['navy']
-        navz = self.g.current_pben['navz']
-
-        (sec, minute, hour, mday, mon, year,
-         weeknum, yday) = GPS_Time(week, tow).time_list
+        epoch = self.g.epoch
+        prn_list = '{:3d}'.format(epoch.count) + \
+            ''.join('G{:02d}'.format(prn) for prn in epoch.prns())
+
+        # epoch time, which may have a fraction of a second at high rates
+        t = epoch.time.datetime
         timestring = \
             "{:1s}{:02d}{:1s}{:02d}{:1s}{:02d}{:1s}{:02d}{:1s}{:02d}{:11.7f}". \
             format(
-                "", int(year) - 2000, "", int(mon), "", int(mday), "", int(hour),
-                "", int(minute), float(sec))
+                "", t.year - 2000, "", t.month, "", t.day, "", t.hour,
+                "", t.minute, t.second + t.microsecond / 1e6)
 
         flagstring = \
             "{:2s}{:1d}".format(
@@ -295,57 +542,238 @@ class Rinex:
 
         header = timestring + flagstring + prn_list
 
-        with open(self.g.obs_filename, 'a') as writer:
-            writer.write(header + "\n")
-
         if verbose:
             print(header)
 
-        return header
+        return header + "\n"
 
 ###############################################################################
-# obs_epoch -- create list of observables, one for each satellite
+# obs_epoch -- the observables, two lines per satellite:
 # 9 measurements: C1 P1 P2 L1 L2 D1 D2 S1 S2
 # I get confused so C and P are (pseudo)range, L is phase. C/A phase not used
+# The layout is in OBS_LAYOUT; see ashformat.py.
+###############################################################################
     def obs_epoch(self, verbose):
-        for i in self.g.mben_list:
-            if i:
-                counter = self.g.mben_list.index(i)
-                j = self.g.mben_flag_list[counter]
+        return [self.formatter.Format(self.g.epoch)]
 
-                # line 1
-                l1p1 = "{:14.3f}{:1d}{:1d}".format(
-                    i['ca_range'], j['ca_range_lli'], j['ca_range_sbyte'])
+###############################################################################
+###############################################################################
+# ObsOutput -- an extra obs file fed from the same epoch stream, keeping
+# only the epochs whose time of week is a multiple of its interval (every
+# "tow % 30 == 0" one for 30 s).  It takes the epoch already formatted and
+# encoded for the main file, and the main file's header with INTERVAL and
+# TIME OF FIRST OBS set to its own.  Its files have the main file's names,
+# in a directory named for the interval ("30s"), and like the nav file
+# they're replaced if they exist.
+###############################################################################
+###############################################################################
 
-                l1p2 = "{:14.3f}{:1d}{:1d}".format(
-                    i['l1_range'], j['l1_range_lli'], j['l1_range_sbyte'])
 
-                l1p3 = "{:14.3f}{:1d}{:1d}".format(
-                    i['l2_range'], j['l2_range_lli'], j['l2_range_sbyte'])
+class ObsOutput:
 
-                l1p4 = "{:14.3f}{:1d}{:1d}".format(
-                    i['l1_phase'], j['l1_phase_lli'], j['l1_phase_sbyte'])
+###############################################################################
+###############################################################################
+    def __init__(self, interval_ms, opts, compressor=None, retiring=None):
+        self.interval_ms = interval_ms
+        self.opts = opts
+        self.compressor = compressor
+        self.retiring = [] if retiring is None else retiring
+        self.directory = "{:g}s".format(interval_ms / 1000)
+        self.writer = None
+        self.wrote_header = False
+        self.epochs = 0
 
-                l1p5 = "{:14.3f}{:1d}{:1d}".format(
-                    i['l2_phase'], j['l2_phase_lli'], j['l2_phase_sbyte'])
+###############################################################################
+# Takes -- True if the epoch at time belongs in this file
+###############################################################################
+    def Takes(self, time):
+        return time.ms % self.interval_ms == 0
+
+###############################################################################
+# Open -- start the file that goes with obs_filename; the one before is
+# flushed now and closed in the background (removed if nothing went in it)
+###############################################################################
+    def Open(self, obs_filename):
+        if self.writer:
+            self.writer.Flush()
+            in_background(self.retiring, discard_empty, self.writer,
+                          self.compressor)
+            self.writer = None
+
+        filename = os.path.join(os.path.dirname(obs_filename),
+                                self.directory,
+                                os.path.basename(obs_filename))
+        try:
+            os.makedirs(os.path.dirname(filename), exist_ok=True)
+            self.writer = obs_writer(filename, 'w', self.opts)
+        except OSError:
+            print("Couldn't create", filename, "!  Carrying on without it")
+            return
+        self.wrote_header = False
+        print("Creating decimated RINEX observations file:", filename)
+
+###############################################################################
+# Write -- one epoch, as bytes; header_lines is the main file's header
+###############################################################################
+    def Write(self, data, time, header_lines):
+        if not self.writer or self.writer.closed:
+            return
+        if not self.wrote_header:
+            header = ObsHeader(list(header_lines))
+            header.Set('INTERVAL', [interval_line(self.interval_ms / 1000)])
+            header.Set('TIME OF FIRST OBS',
+                       [obs_time_line(time, "TIME OF FIRST OBS")])
+            self.writer.Write([header.Text()])
+            self.wrote_header = True
+        self.writer.WriteBytes(data, time)
+        self.writer.EndEpoch()
+        self.epochs += 1
+
+###############################################################################
+# Close -- close the current file, removing it if it never got an epoch
+###############################################################################
+    def Close(self):
+        discard_empty(self.writer, self.compressor)
 
-                # line 2
-                l2p1 = "{:14.3f}{:1d}{:1d}".format(
-                    i['l1_dopp'], j['l1_dopp_lli'], j['l1_dopp_sbyte'])
+###############################################################################
+# NOT IN Rinex class
+###############################################################################
+# close_rinex_files -- flush and close the obs and nav files; called at the
+# end of a run and from the Ctrl-C/SIGTERM handler.  With --compress, this
+# is where we wait for the compression to finish.
+###############################################################################
 
-                l2p2 = "{:14.3f}{:1d}{:1d}".format(
-                    i['l2_dopp'], j['l2_dopp_lli'], j['l2_dopp_sbyte'])
 
-                l2p3 = "{:14.3f}".format(i['l1_snr'])
-                l2p4 = "{:14.3f}".format(i['l2_snr'])
+def close_rinex_files(g):
+    # files rotated out may still be being closed, and handed to the
+    # compressor, in the background
+    for thread in g.retiring:
+        thread.join()
+    del g.retiring[:]
+    for writer in (g.obs_writer, g.nav_writer):
+        if writer and not writer.closed:
+            writer.Close()
+            if g.compressor:
+                g.compressor.Submit(writer.filename)
+    for output in g.obs_outputs:
+        output.Close()
+    # a file opened ahead for the next period hasn't been used
+    discard_empty(take_ahead(g))
+    if g.compressor:
+        # the seconds of data, for the CPU cost per day
+        g.compressor.Finish(
+            g.obs_epoch_count * float(g.opts['msg_rate'] or 1))
 
-                line1 = l1p1 + l1p2 + l1p3 + l1p4 + l1p5
-                line2 = l2p1 + l2p2 + l2p3 + l2p4
+###############################################################################
+# in_background -- run target(*args) in a thread kept on threads (as
+# g.retiring), so that close_rinex_files() can wait for it
+###############################################################################
 
-                with open(self.g.obs_filename, 'a') as writer:
-                    writer.write(line1 + "\n")
-                    writer.write(line2 + "\n")
 
-        return
+def in_background(threads, target, *args):
+    threads[:] = [thread for thread in threads if thread.is_alive()]
+    thread = threading.Thread(target=target, args=args)
+    thread.start()
+    threads.append(thread)
+
+###############################################################################
+# take_ahead -- wait for the file being opened ahead, if any, and return
+# its writer, leaving nothing pending
+###############################################################################
+
+
+def take_ahead(g):
+    if g.next_obs_thread:
+        g.next_obs_thread.join()
+        g.next_obs_thread = None
+    writer, g.next_obs_writer = g.next_obs_writer, None
+    return writer
+
+###############################################################################
+# obs_writer -- a writer for an obs file: a CrxWriter with --hatanaka, else
+# a RinexWriter
+###############################################################################
+
+
+def obs_writer(filename, mode, opts):
+    if opts.get('hatanaka'):
+        from ashglobal import AshtechGlobals
+        return CrxWriter(filename, mode, program=AshtechGlobals.PROG_NAME,
+                         flush_secs=opts['flush_secs'],
+                         fsync_epochs=opts['fsync_epochs'])
+    return RinexWriter(filename, mode, flush_secs=opts['flush_secs'],
+                       fsync_epochs=opts['fsync_epochs'],
+                       index=opts['index'])
+
+###############################################################################
+# interval_line -- INTERVAL header line
+###############################################################################
+
+
+def interval_line(seconds):
+    return "{:10.3f}{:<50}{:<20}".format(seconds, "", "INTERVAL")
+
+###############################################################################
+# obs_time_line -- TIME OF FIRST OBS or TIME OF LAST OBS header line for a
+# GpsTime
+###############################################################################
+
+
+def obs_time_line(time, label):
+
+    (sec, minute, hour, mday, mon, year,
+     weeknum, yday) = time.time_list
+
+    timestring = "{:2s}{:4d}".format(' ', int(year))
+    timestring += "{:4s}{:02d}".format(' ', int(mon))
+    timestring += "{:4s}{:02d}".format(' ', int(mday))
+    timestring += "{:4s}{:02d}".format(' ', int(hour))
+    timestring += "{:4s}{:02d}".format(' ', int(minute))
+    timestring += "{:13.7f}".format(float(sec))
+    timestring += "{:5s}".format(' ')
+    timestring += "{:3s}".format("GPS")
+    timestring += "{:9s}".format(' ')  # blanks to col 60; should be 2?
+    timestring += label		# takes us to col 77 or 76
+
+    return timestring
+
+###############################################################################
+# retire -- close a rotated-out obs file and its nav file, and hand them
+# to compressor if there is one.  If the obs file never got an epoch (the
+# one opened at startup may not), remove both.
+###############################################################################
+
+
+def retire(obs_writer, nav_writer, compressor=None):
+    if nav_writer:
+        nav_writer.Close()
+    if discard_empty(obs_writer, compressor) and nav_writer:
+        try:
+            os.remove(nav_writer.filename)
+        except OSError:
+            pass
+    elif nav_writer and compressor:
+        compressor.Submit(nav_writer.filename)
+
+###############################################################################
+# discard_empty -- close writer and remove its file if nothing went in it;
+# True if it was removed.  Otherwise the file goes to compressor, if
+# there is one.  A writer that's already closed has been seen to.
+###############################################################################
+
+
+def discard_empty(writer, compressor=None):
+    if not writer or writer.closed:
+        return False
+    writer.Close()
+    try:
+        if os.path.getsize(writer.filename) == 0:
+            os.remove(writer.filename)
+            return True
+    except OSError:
+        return False
+    if compressor:
+        compressor.Submit(writer.filename)
+    return False
 
 # end of rinex.py
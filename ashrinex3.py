@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+
+################################  N8UR ASHCOMM  ################################
+#
+#	Copyright 2019 by John Ackermann, N8UR jra@febo.com https://febo.com
+#	Version number can be found in the ashglobal.py file
+#
+#	This program is free software; you can redistribute it and/or modify
+#	it under the terms of the GNU General Public License as published by
+#	the Free Software Foundation; either version 2 of the License, or
+#	(at your option) any later version.
+#
+#	This program is distributed in the hope that it will be useful,
+#	but WITHOUT ANY WARRANTY; without even the implied warranty of
+#	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#	GNU General Public License for more details.
+#	Software to communicate with Ashtech GPS receivers via serial port.
+################################################################################
+
+#############################   ashrinex3.py    ################################
+
+import datetime
+
+from ashrinex import *
+
+###############################################################################
+# Rinex3 -- RINEX 3.04 observation output.  Everything but the version
+# specific header lines, the epoch record and the observation layout comes
+# from Rinex, including the formatter, and it reads the same Epoch.
+#
+# MBN blocks map to RINEX 3 observation codes as:
+#
+#	C1C L1C D1C S1C		C/A block
+#	C1W			L1 (P) block
+#	C2W L2W D2W S2W		L2 (P) block
+#
+# The navigation file stays RINEX 2.11.
+###############################################################################
+
+OBS_TYPES_3 = ('C1C', 'C1W', 'C2W', 'L1C', 'L2W', 'D1C', 'D2W', 'S1C', 'S2W')
+
+
+class Rinex3(Rinex):
+
+    # one line per satellite, in OBS_TYPES_3 order
+    OBS_LAYOUT = (
+        (("G%02d", ('prn',)),
+         ("%14.3f%1d%1d", ('ca_range', 'ca_lli', 'ca_sbyte')),
+         ("%14.3f%1d%1d", ('l1_range', 'l1_lli', 'l1_sbyte')),
+         ("%14.3f%1d%1d", ('l2_range', 'l2_lli', 'l2_sbyte')),
+         ("%14.3f%1d%1d", ('ca_phase', 'ca_phase_lli', 'ca_sbyte')),
+         ("%14.3f%1d%1d", ('l2_phase', 'l2_phase_lli', 'l2_sbyte')),
+         ("%14.3f%1d%1d", ('ca_dopp', 'ca_lli', 'ca_sbyte')),
+         ("%14.3f%1d%1d", ('l2_dopp', 'l2_lli', 'l2_sbyte')),
+         ("%14.3f  ", ('ca_snr',)),
+         ("%14.3f", ('l2_snr',))),)
+
+    CRX = False			# ashcrx.py only does RINEX 2.11
+
+###############################################################################
+# version_lines -- RINEX VERSION / TYPE and PGM / RUN BY / DATE
+###############################################################################
+    def version_lines(self):
+        date = datetime.datetime.utcnow().strftime("%Y%m%d %H%M%S UTC")
+        return ["{:9.2f}{:11}{:<20}{:<20}{:<20}".format(
+                    3.04, " ", "OBSERVATION DATA", "G: GPS",
+                    "RINEX VERSION / TYPE"),
+                "{:<20}{:<20}{:<20}{:<20}".format(
+                    self.g.PROG_NAME, self.g.opts['operator'], date,
+                    "PGM / RUN BY / DATE")]
+
+###############################################################################
+# marker_type_lines -- required from RINEX 3 on
+###############################################################################
+    def marker_type_lines(self):
+        return ["{:<60}{:<20}".format("GEODETIC", "MARKER TYPE")]
+
+###############################################################################
+# obs_types_lines -- SYS / # / OBS TYPES
+###############################################################################
+    def obs_types_lines(self):
+        types = "".join(" " + obs for obs in OBS_TYPES_3)
+        return ["{:1s}{:2s}{:3d}{:<54}{:<20}".format(
+            "G", "", len(OBS_TYPES_3), types, "SYS / # / OBS TYPES")]
+
+###############################################################################
+# phase_shift_lines -- SYS / PHASE SHIFT for each phase; we don't apply
+# any corrections
+###############################################################################
+    def phase_shift_lines(self):
+        return ["{:1s}{:1s}{:3s}{:1s}{:8.5f}{:<46}{:<20}".format(
+            "G", "", obs, "", 0.0, "", "SYS / PHASE SHIFT")
+            for obs in OBS_TYPES_3 if obs[0] == 'L']
+
+###############################################################################
+# obs_epoch_header -- "> " epoch record
+###############################################################################
+    def obs_epoch_header(self, verbose=False):
+        epoch = self.g.epoch
+        t = epoch.time.datetime
+        header = \
+            "> {:4d} {:02d} {:02d} {:02d} {:02d}{:11.7f}  {:1d}{:3d}".format(
+                t.year, t.month, t.day, t.hour, t.minute,
+                t.second + t.microsecond / 1e6, 0, epoch.count)
+
+        if verbose:
+            print(header)
+
+        return header + "\n"
+
+###############################################################################
+# NOT IN Rinex3 class
+###############################################################################
+# new_rinex -- the RINEX writer for --rinex_version
+###############################################################################
+
+
+def new_rinex(commands, g, verbose):
+    if g.opts['rinex_version'] == 3:
+        return Rinex3(commands, g, verbose)
+    return Rinex(commands, g, verbose)
+
+# end of ashrinex3.py
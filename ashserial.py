@@ -21,8 +21,14 @@
 
 import sys
 import time
+import queue
+import atexit
+import asyncio
+import threading
 import serial
 
+from ashframe import *
+from ashcapture import *
 from ashcommand import *
 from ashutil import *
 from ashmessage import *
@@ -31,6 +37,7 @@ from ashposition import *
 
 class AshtechSerial:
     TIMEOUT = 3				# default timeout
+    PROBE_PASSES = 3			# trips through the rate table
 
     # Ashtech speed param = BAUDRATES[index]: 0 = 300 .. 9 = 115200
     BAUDRATES = [
@@ -55,6 +62,20 @@ class AshtechSerial:
         self.verbose = verbose
         self.timeout = timeout
 
+        # reader thread state; see StartReader()
+        self.reader = None
+        self.reader_running = False
+        self.async_running = False
+        self.decoder = FrameDecoder()
+        self.frames = queue.Queue()
+
+        # callers waiting for query replies; see expect()
+        self.waiters = []
+        self.waiter_lock = threading.Lock()
+
+        # raw capture file; see StartCapture()
+        self.capture = None
+
 ##############################################################################
 # SpeedToIndex -- convert numeric baud rate to index number for Z12
 ##############################################################################
@@ -66,15 +87,18 @@ class AshtechSerial:
             print("Invalid Baud Rate: ", speed)
 
 ###############################################################################
-# Open -- open Z12 serial port
+# Open -- open Z12 serial port.  Given the rate the receiver used last time
+# (see ashstate.py) we just set the port to it and leave the caller to
+# check; otherwise we probe.
 ###############################################################################
-    def Open(self):
+    def Open(self, rate=None):
         index = self.SpeedToIndex(self.ser_baud)
 
         try:
             print("Attempting to open", self.ser_port, "at",
                   self.ser_baud, "baud...")
-            self.serial = serial.Serial(self.ser_port, self.ser_baud)
+            self.serial = serial.Serial(self.ser_port, self.ser_baud,
+                                        timeout=self.timeout)
             self.serial.rtscts = False
             self.serial.dsrdtr = False
             self.serial.xonxoff = False
@@ -82,79 +106,72 @@ class AshtechSerial:
             print("Oops... error", sys.exc_info()[0], "occured.")
             sys.exit(1)
 
-        time.sleep(0.5)
+        if rate:
+            self.SetPortSpeed(rate)
+        else:
+            self.Probe()
+
+        return serial
+
+###############################################################################
+# Probe -- find the receiver's port speed and change it to the one we want
+###############################################################################
+    def Probe(self):
         print("Trying to find hardware speed...", end=' ')
         rate = self.FindHardwareSpeed()
+        if not rate:
+            print("no response from receiver!")
+            sys.exit(1)
         print("detected baudrate: %s" % rate)
 
         if int(rate) != int(self.ser_baud):
             print("Attempting to change speed to", self.ser_baud, "baud...")
             self.SetHardwareSpeed(self.ser_baud)
-            time.sleep(0.5)
             self.SetPortSpeed(self.ser_baud)
-            time.sleep(0.5)
-            rate = self.FindHardwareSpeed()
-            time.sleep(0.5)
+            rate = self.FindHardwareSpeed() or rate
             if int(rate) == int(self.ser_baud):
                 print("Set and confirmed requested speed: %s" % rate)
             else:
                 print("Couldn't set new speed; staying at", rate)
 
-        time.sleep(0.1)
         self.reset_input()
         self.reset_output()
 
-        return serial
-
 ###############################################################################
 # Close -- close Z12 serial port
 ###############################################################################
     def Close(self):
+        self.StopCapture()
         self.serial.close()
 
 ###############################################################################
-# FindHardwareSpeed -- probe the Z12 for its current serial port speed
+# FindHardwareSpeed -- probe the Z12 for its current serial port speed.  Try
+# the requested speed first, then step down through the rate table; each
+# try waits only as long as a PRT reply could take at that speed.  Returns
+# None if the receiver doesn't answer at any speed.
 ###############################################################################
-    def FindHardwareSpeed(self):
-        starting_index = len(self.BAUDRATES) - 1
-        index = starting_index
-        TEST_TIMEOUT = 0.5
+    def FindHardwareSpeed(self, passes=PROBE_PASSES):
+        rates = [str(self.ser_baud)]
+        rates += [r for r in reversed(self.BAUDRATES) if r != rates[0]]
 
-        # Ashtech responses start with "$PASHR,"
-        look_for = b"$PASH"
+        for attempt in range(passes):
+            for rate in rates:
+                # set host comm port speed; this clears out the sluices
+                self.SetPortSpeed(rate)
 
-        # first see if we're already there
-        self.SetPortSpeed(self.ser_baud)
-        self.write("$PASHQ,PRT\r\n")
-        time.sleep(0.5)
-        response = self.read_anything('', 16, TEST_TIMEOUT)
-        if look_for in response:
-            return self.ser_baud
+                # send port query
+                self.write("$PASHQ,PRT\r\n")
+                if self.wait_for('PRT', self.reply_time(rate)):
+                    return rate
 
-        # we weren't lucky, so step through rate table
-        while (index > 0):
-            rate = self.BAUDRATES[index]
+        return None
 
-            # set host comm port speed
-            self.SetPortSpeed(rate)
-
-            # clear out the sluices
-            self.reset_output()
-            self.reset_input()
-
-            # send port query
-            self.write("$PASHQ,PRT\r\n")
-            time.sleep(1)
-            response = self.serial.readline()
-            if look_for in response:
-                break
-            index -= 1
-            # loop until it works
-            if (index == 0):
-                index = starting_index
-
-        self.serial.timeout = self.TIMEOUT
-        return rate
+###############################################################################
+# reply_time -- how long a short query reply can take at rate (default: the
+# current port speed)
+###############################################################################
+    def reply_time(self, rate=None):
+        return 0.2 + 400.0 / int(rate or self.serial.baudrate)
 
 ###############################################################################
 # SetPortSpeed -- set computer port to desired speed
@@ -173,6 +190,8 @@ class AshtechSerial:
         index = self.SpeedToIndex(speed)
         command = "$PASHS,SPD," + self.hw_port + "," + str(index) + "\r\n"
         result = self.write(command)
+        # the receiver acks at the old speed, then switches
+        return self.wait_for(('ACK', 'NAK'))
 
 ###############################################################################
 
@@ -185,6 +204,7 @@ class AshtechSerial:
 ###############################################################################
     def reset_input(self):
         self.serial.reset_input_buffer()
+        self.decoder.ring.clear()
 
 ###############################################################################
 # reset_output -- reset output buffer
@@ -200,33 +220,63 @@ class AshtechSerial:
 ###############################################################################
 
 ###############################################################################
-# read_line -- grab a line terminated with a crlf and return results as
-# byte object with crlf and "$PASHR," header stripped off
+# read_frame -- return the next message from the port as (msg_type, payload)
+# (see FrameDecoder), or None if nothing complete arrives before the
+# deadline.  payload is only good until the next read.
 ###############################################################################
-    def read_line(self, timeout=TIMEOUT):
+    def read_frame(self, timeout=TIMEOUT):
         orig_timeout = self.serial.timeout
-        self.serial.timeout = timeout
-        while True:
-            time.sleep(0.1)
-            if self.serial.in_waiting:
-                message = self.serial.readline()
+        deadline = time.monotonic() + timeout
+        frame = self.decoder.decode()
+        while frame is None:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
                 break
+            # pyserial blocks in select() until data or timeout
+            self.serial.timeout = remaining
+            data = self.tee(self.serial.read(self.serial.in_waiting or 1))
+            self.decoder.feed(data)
+            frame = self.decoder.decode()
+        self.serial.timeout = orig_timeout
+        return frame
 
-        # remove $PASHR and trailing crlf
-        message = message[7:].rstrip()
+###############################################################################
+# wait_for -- read messages until one of the given type(s) arrives and
+# return it, or None at the deadline.  Anything else is thrown away.
+###############################################################################
+    def wait_for(self, msg_types, timeout=TIMEOUT):
+        if isinstance(msg_types, str):
+            msg_types = (msg_types,)
+        deadline = time.monotonic() + timeout
+        while True:
+            frame = self.read_frame(deadline - time.monotonic())
+            if frame is None or frame[0] in msg_types:
+                return frame
 
-        self.serial.timeout = orig_timeout
-        return message
+###############################################################################
+# read_line -- grab a line terminated with a crlf and return results as
+# byte object with crlf and "$PASHR," header stripped off.  Binary messages
+# are skipped.  Gives up and returns b'' if no line arrives before the
+# deadline.  (While a reader is running, a reply may have arrived before we
+# got here; use expect() before sending the query instead.)
+###############################################################################
+    def read_line(self, timeout=TIMEOUT):
+        frame = self.collect(self.expect(None), timeout)
+        if frame is None:
+            return b''
+        return bytes(frame[1]).rstrip()
 
 ###############################################################################
 # read_multiline -- read lines from serial port until nothing arrives
 # for timeout seconds, then return a list of lines read, on line per element
 ###############################################################################
     def read_multiline(self,timeout=3):
-        timer = time.time() + timeout
+        deadline = time.monotonic() + timeout
         results = []
-        while (timer > time.time()):
-            results.append(self.read_line())
+        while (deadline > time.monotonic()):
+            line = self.read_line(deadline - time.monotonic())
+            if line:
+                results.append(line)
            
         return results
 
@@ -235,28 +285,294 @@ class AshtechSerial:
 # read_anything -- a more general read function.  It waits for anything on
 # input and depending on the params reads length bytes or reads until the
 # delimiter.  Delimiter must be a byte object.  Returns raw byte object
-# without stripping anything
+# without stripping anything; this may be short (or empty) if the deadline
+# passes first.
 ###############################################################################
     def read_anything(self, delimiter=b'', length=0, timeout=TIMEOUT):
         orig_timeout = self.serial.timeout
         self.serial.timeout = timeout
-        self.serial.inter_byte_timeout = 5  # tenths of second?
+        message = b''
+        if delimiter:
+            message = self.serial.read_until(delimiter)
+        if length:
+            message = self.serial.read(length)
+        self.tee(message)
+        self.serial.timeout = orig_timeout
+        return message
+
+###############################################################################
+# StartCapture -- tee every byte read from now on to a capture file
+###############################################################################
+    def StartCapture(self, filename):
+        print("Capturing raw receiver data to", filename)
+        self.capture = CaptureWriter(filename)
+        # closed however we exit, so the tail isn't lost
+        atexit.register(self.StopCapture)
+
+###############################################################################
+# StopCapture -- flush and close the capture file
+###############################################################################
+    def StopCapture(self):
+        capture, self.capture = self.capture, None
+        if capture:
+            capture.close()
+
+###############################################################################
+# NoteCapture -- record facts about the session in the capture file, if
+# any; see CaptureWriter.note()
+###############################################################################
+    def NoteCapture(self, **info):
+        if self.capture:
+            self.capture.note(**info)
+
+###############################################################################
+# tee -- copy data to the capture file, if any, and return it
+###############################################################################
+    def tee(self, data):
+        if self.capture and data:
+            self.capture.write(data)
+        return data
+
+###############################################################################
+###############################################################################
+# Query/response multiplexer.  While a reader (thread or asyncio) owns the
+# port, a caller that wants the reply to a query registers what it's
+# waiting for with expect() *before* sending the query, then picks the
+# reply up with collect().  The reader hands each message to the oldest
+# waiter that wants that type; everything else, including all the
+# observation data, carries on to MsgSwitch as usual.  When no reader is
+# running, collect() just reads the port itself.
+###############################################################################
+###############################################################################
+
+###############################################################################
+# expect -- register interest in the next message of type(s) msg_types
+# (None means any ASCII line).  Returns a waiter to pass to collect().
+###############################################################################
+    def expect(self, msg_types, sink=None):
+        if isinstance(msg_types, str):
+            msg_types = (msg_types,)
+        waiter = (msg_types, sink or queue.Queue(1))
+        with self.waiter_lock:
+            self.waiters.append(waiter)
+        return waiter
+
+###############################################################################
+# forget -- drop a waiter that has given up
+###############################################################################
+    def forget(self, waiter):
+        with self.waiter_lock:
+            if waiter in self.waiters:
+                self.waiters.remove(waiter)
+
+###############################################################################
+# route -- called by the reader for each message; give it to a waiter if one
+# wants it and return True, else return False
+###############################################################################
+    def route(self, msg_type, payload):
+        if not self.waiters:			# the usual case
+            return False
+        binary = msg_type in BINARY_LENGTHS
+        with self.waiter_lock:
+            for waiter in self.waiters:
+                msg_types, sink = waiter
+                if (msg_types is None and not binary) or \
+                        (msg_types is not None and msg_type in msg_types):
+                    self.waiters.remove(waiter)
+                    break
+            else:
+                return False
+        frame = (msg_type, bytes(payload))
+        if isinstance(sink, queue.Queue):
+            sink.put(frame)
+        elif not sink.done():			# asyncio future
+            sink.set_result(frame)
+        return True
+
+###############################################################################
+# collect -- wait for the message a waiter asked for; None at the deadline
+###############################################################################
+    def collect(self, waiter, timeout=TIMEOUT):
+        msg_types, sink = waiter
+        if self.reader_running or self.async_running:
+            try:
+                return sink.get(timeout=timeout)
+            except queue.Empty:
+                self.forget(waiter)
+                return None
+
+        # nobody else is reading, so read the port ourselves
+        self.forget(waiter)
+        deadline = time.monotonic() + timeout
         while True:
-            time.sleep(0.1)
-            if self.serial.in_waiting:
-                if delimiter:
-                    message = self.serial.read_until(delimiter)
-                if length:
-                    message = self.serial.read(length)
+            frame = self.read_frame(deadline - time.monotonic())
+            if frame is None:
+                return None
+            if msg_types is None:
+                if frame[0] not in BINARY_LENGTHS:
+                    return frame
+            elif frame[0] in msg_types:
+                return frame
+
+###############################################################################
+# Request -- send a message and return the reply of type(s) msg_types
+###############################################################################
+    def Request(self, message, msg_types, timeout=TIMEOUT):
+        waiter = self.expect(msg_types)
+        self.write(message)
+        return self.collect(waiter, timeout)
+
+###############################################################################
+# RequestAsync -- the same, for use on the event loop with StartAsyncReader()
+###############################################################################
+    async def RequestAsync(self, message, msg_types, timeout=TIMEOUT):
+        future = self.loop.create_future()
+        waiter = self.expect(msg_types, future)
+        self.write(message)
+        try:
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            self.forget(waiter)
+            return None
+
+###############################################################################
+###############################################################################
+# Reader thread.  While it runs, the thread owns the input side of the port:
+# it blocks in pyserial's read (which sits in select() on the port), drains
+# everything that has arrived into the frame decoder's ring buffer, and
+# queues each complete message for get_frame().  Nothing wakes up while
+# the line is idle.
+###############################################################################
+###############################################################################
+
+###############################################################################
+# StartReader -- start the reader thread
+###############################################################################
+    def StartReader(self):
+        if self.reader_running:
+            return
+        self.frames = queue.Queue()
+        self.serial.timeout = None		# block until data arrives
+        self.reader_running = True
+        self.reader = threading.Thread(target=self.reader_loop,
+                                       name="ashtech-reader", daemon=True)
+        self.reader.start()
+
+###############################################################################
+# StopReader -- stop the reader thread and restore the port timeout
+###############################################################################
+    def StopReader(self):
+        if not self.reader_running:
+            return
+        self.reader_running = False
+        try:
+            self.serial.cancel_read()
+        except AttributeError:			# platform can't cancel
+            pass
+        self.reader.join(self.timeout)
+        self.reader = None
+        self.serial.timeout = self.timeout
+
+###############################################################################
+# reader_loop -- body of the reader thread
+###############################################################################
+    def reader_loop(self):
+        # anything left over from startup goes first
+        for msg_type, payload in self.decoder:
+            if not self.route(msg_type, payload):
+                self.frames.put((msg_type, bytes(payload)))
+        while self.reader_running:
+            try:
+                data = self.serial.read(self.serial.in_waiting or 1)
+            except serial.SerialException:
+                print("Read error on", self.ser_port, "!")
                 break
-        self.serial.inter_byte_timeout = None  # default
-        return message
+            if not data:			# cancelled
+                continue
+            self.tee(data)
+            self.decoder.feed(data)
+            # the decoder hands back views into its buffer; copy them
+            # before they cross to the other thread
+            for msg_type, payload in self.decoder:
+                if not self.route(msg_type, payload):
+                    self.frames.put((msg_type, bytes(payload)))
+        self.reader_running = False
+        # wake anyone waiting in get_frame(); there's nothing more coming
+        self.frames.put(None)
+
+###############################################################################
+# get_frame -- return the next complete message from the reader thread as
+# (msg_type, payload), or None if nothing arrives before the timeout
+# (None = wait forever) or the reader has stopped, as it does if the port
+# dies.  See FrameDecoder for what payload holds.
+###############################################################################
+    def get_frame(self, timeout=None):
+        try:
+            if not self.reader_running:
+                # messages it queued before stopping, then None
+                return self.frames.get_nowait()
+            return self.frames.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+###############################################################################
+###############################################################################
+# asyncio transport.  Instead of a thread, the port's file descriptor is
+# registered with an event loop; when it becomes readable we drain it into
+# the frame decoder and call back with each message, on the loop's thread.
+# Because the callback runs before the next read, it gets the decoder's
+# memoryview directly with no copy.  One loop can carry many receivers.
+###############################################################################
+###############################################################################
+
+###############################################################################
+# StartAsyncReader -- call callback(msg_type, payload) for each message
+###############################################################################
+    def StartAsyncReader(self, loop, callback):
+        self.serial.timeout = 0			# never block the loop
+        self.async_running = True
+        self.loop = loop
+        self.frame_callback = callback
+        self.last_read_time = time.monotonic()
+        loop.add_reader(self.serial.fileno(), self.async_readable)
+        # anything left over from startup goes first
+        loop.call_soon(self.async_dispatch)
+
+###############################################################################
+# StopAsyncReader -- unregister from the event loop
+###############################################################################
+    def StopAsyncReader(self):
+        self.async_running = False
+        self.loop.remove_reader(self.serial.fileno())
+        self.serial.timeout = self.timeout
+
+###############################################################################
+# async_readable -- event loop callback when the port has data
+###############################################################################
+    def async_readable(self):
+        try:
+            data = self.serial.read(self.serial.in_waiting or 1)
+        except serial.SerialException:
+            print("Read error on", self.ser_port, "!")
+            self.StopAsyncReader()
+            return
+        if not data:
+            return
+        self.tee(data)
+        self.last_read_time = time.monotonic()
+        self.decoder.feed(data)
+        self.async_dispatch()
+
+    def async_dispatch(self):
+        for msg_type, payload in self.decoder:
+            if not self.route(msg_type, payload):
+                self.frame_callback(msg_type, payload)
 
 ###############################################################################
 # getc -- used by xmodem() for input
 ###############################################################################
     def getc(self, size, timeout=1):
-        data = self.serial.read(size)
+        data = self.tee(self.serial.read(size))
         return data or None
 
 ###############################################################################
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+
+################################  N8UR ASHCOMM  ################################
+#
+#	Copyright 2019 by John Ackermann, N8UR jra@febo.com https://febo.com
+#	Version number can be found in the ashglobal.py file
+#
+#	This program is free software; you can redistribute it and/or modify
+#	it under the terms of the GNU General Public License as published by
+#	the Free Software Foundation; either version 2 of the License, or
+#	(at your option) any later version.
+#
+#	This program is distributed in the hope that it will be useful,
+#	but WITHOUT ANY WARRANTY; without even the implied warranty of
+#	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#	GNU General Public License for more details.
+#	Software to communicate with Ashtech GPS receivers via serial port.
+################################################################################
+
+#############################   ashsession.py    ###############################
+
+import time
+import asyncio
+import datetime
+
+from ashserial import *
+from ashcommand import *
+from ashmessage import *
+from ashrinex import *
+from ashrinex3 import *
+from ashglobal import *
+from ashstate import *
+
+###############################################################################
+# AshtechSession -- everything needed to run one receiver: its own
+# AshtechGlobals (the per-receiver state), serial port, command, message and
+# RINEX objects.  ashcomm.py runs a single session in the foreground;
+# ashfleet.py runs several on one asyncio event loop.
+###############################################################################
+
+
+class AshtechSession:
+
+    def __init__(self, g, verbose=False):
+        self.g = g
+        self.verbose = verbose
+        self.Serial = AshtechSerial(g.opts['serport'],
+                                    g.opts['baud'], g.opts['hwport'], verbose)
+        self.Commands = AshtechCommands(self.Serial, g, verbose)
+        self.RINEX = new_rinex(self.Commands, g, verbose)
+        self.Messages = AshtechMessages(self.Serial, self.Commands,
+                                        g, self.RINEX, verbose)
+
+###############################################################################
+# Start -- open the port, identify the receiver, create the RINEX file and
+# start the binary message stream.  Blocks until the stream is running.
+# If we've seen this receiver on this port before (see ashstate.py), one
+# RID query confirms it and we skip the baud probe, the SID query and, if
+# the system clock agrees with the week we saved, the wait for a DAL.
+###############################################################################
+    def Start(self):
+        g = self.g
+        verbose = self.verbose
+        Commands = self.Commands
+
+        if g.opts['capture']:
+            self.Serial.StartCapture(g.opts['capture'])
+
+        state = PortState(g.opts['state_dir'], g.opts['serport'])
+        saved = state.Load()
+        if saved and saved['baud'] != int(g.opts['baud']):
+            saved = None		# we want a different speed; probe
+        self.Serial.Open(saved['baud'] if saved else None)
+
+        known = saved and Commands.CheckRID(saved['rid'], verbose=True)
+        if saved and not known:
+            print("Receiver doesn't match", state.filename + "; probing")
+            self.Serial.Probe()
+
+        Commands.SetCommands(["OUT,A"])		# turn off output
+        self.Serial.reset_input()                   # clean the sluices
+
+        if not known:
+            Commands.QueryRID(verbose=True)
+        self.Serial.NoteCapture(rid=g.rid[:5], ser_num=g.rx_ser_num)
+        print()
+
+        g.start_time = datetime.datetime.utcnow()
+        self.RINEX.create_rinex_obs_file()
+        print()
+
+        if known and saved['gps_week'] == clock_gps_week():
+            g.gps_week = saved['gps_week']
+            print("GPS week", g.gps_week, "from", state.filename)
+        else:
+            self.Messages.GetGPSWeek(verbose)
+        state.Save(self.Serial.serial.baudrate, g)
+        # the capture may not have the week in it, so we say what it is
+        self.Serial.NoteCapture(gps_week=g.gps_week)
+
+        # set message rate and start the stream; no need to wait for
+        # one before sending the other
+        msg_rate = str(g.opts['msg_rate'])
+        print("Setting message rate to", msg_rate, "seconds")
+        print("Waiting for data; it may take a while...")
+        print()
+        messages = "PBN,MBN,SNV" if g.opts['nav'] else "PBN,MBN"
+        Commands.SetCommands(["RCI," + msg_rate, "OUT,A," + messages + ",BIN"],
+                             verbose=verbose)
+        Commands.QueryAlmanac(verbose)
+
+###############################################################################
+# timeout -- give up if the receiver goes quiet for several message intervals
+###############################################################################
+    def timeout(self):
+        return max(60, 5 * self.g.opts['msg_rate'])
+
+###############################################################################
+# Run -- asyncio version of Start() plus MsgSwitch(): do the (blocking)
+# startup in a worker thread, then let the event loop feed us messages
+# until the receiver stops talking.
+###############################################################################
+    async def Run(self):
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self.Start)
+
+        def on_frame(msg_type, payload):
+            self.Messages.HandleFrame(msg_type, payload, self.verbose)
+
+        timeout = self.timeout()
+        self.Serial.StartAsyncReader(loop, on_frame)
+        try:
+            while True:
+                idle = time.monotonic() - self.Serial.last_read_time
+                if idle >= timeout:
+                    print(self.g.opts['serport'] + ": no data from receiver "
+                          "for", timeout, "seconds; giving up")
+                    break
+                await asyncio.sleep(timeout - idle)
+        finally:
+            self.Serial.StopAsyncReader()
+            self.Messages.Finish(self.verbose)
+            self.RINEX.Close()
+            self.Serial.Close()
+
+# end of ashsession.py
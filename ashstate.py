@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+
+################################  N8UR ASHCOMM  ################################
+#
+#	Copyright 2019 by John Ackermann, N8UR jra@febo.com https://febo.com
+#	Version number can be found in the ashglobal.py file
+#
+#	This program is free software; you can redistribute it and/or modify
+#	it under the terms of the GNU General Public License as published by
+#	the Free Software Foundation; either version 2 of the License, or
+#	(at your option) any later version.
+#
+#	This program is distributed in the hope that it will be useful,
+#	but WITHOUT ANY WARRANTY; without even the implied warranty of
+#	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#	GNU General Public License for more details.
+#	Software to communicate with Ashtech GPS receivers via serial port.
+################################################################################
+
+#############################   ashstate.py    #################################
+
+import os
+import json
+import time
+
+###############################################################################
+# PortState -- what we learned about the receiver on a serial port last
+# time: the baud rate it answered at, its RID fields and serial number, and
+# the GPS week.  Kept as a small JSON file per port, so the next start can
+# check it with a single RID query instead of probing baud rates, asking for
+# the serial number and waiting for a DAL sentence.
+###############################################################################
+
+
+class PortState:
+    KEYS = ('baud', 'rid', 'rx_ser_num', 'gps_week')
+
+###############################################################################
+###############################################################################
+    def __init__(self, state_dir, serport):
+        self.filename = None
+        if state_dir:
+            name = serport.strip('/').replace('/', '_') or 'port'
+            self.filename = os.path.join(os.path.expanduser(state_dir),
+                                         name + '.json')
+
+###############################################################################
+# Load -- the saved state as a dict, or None if there's none we can use
+###############################################################################
+    def Load(self):
+        if not self.filename:
+            return None
+        try:
+            with open(self.filename) as reader:
+                state = json.load(reader)
+        except (OSError, ValueError):
+            return None
+        if not isinstance(state, dict) or \
+                any(state.get(key) is None for key in self.KEYS):
+            return None
+        return state
+
+###############################################################################
+# Save -- write the state for the receiver in g, replacing the file in one
+# step so a crash can't leave half of it behind
+###############################################################################
+    def Save(self, baud, g):
+        if not self.filename:
+            return
+        state = {'baud': int(baud), 'rid': g.rid, 'rx_ser_num': g.rx_ser_num,
+                 'gps_week': g.gps_week, 'saved': time.time()}
+        temp = self.filename + '.tmp'
+        try:
+            os.makedirs(os.path.dirname(self.filename), exist_ok=True)
+            with open(temp, 'w') as writer:
+                json.dump(state, writer)
+            os.replace(temp, self.filename)
+        except OSError as err:
+            print("Couldn't save port state to", self.filename + ":", err)
+
+# end of ashstate.py
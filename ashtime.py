@@ -21,6 +21,11 @@
 
 import datetime
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 
 class GPS_Time:
 
@@ -122,6 +127,173 @@ class GPS_Time:
 
         return seq_seconds
 
+###############################################################################
+###############################################################################
+# GpsTime -- GPS time as integer week and milliseconds of week.  Cheap to
+# make, compare and hash, so it can be used as a key for every message;
+# the calendar fields are only worked out (once) when something asks for
+# them, usually a writer.  Like GPS_Time it is GPS time: no leapseconds.
+###############################################################################
+###############################################################################
+
+GPS_EPOCH = datetime.datetime(1980, 1, 6)
+WEEK_MS = 604800000
+
+
+class GpsTime:
+    __slots__ = ('week', 'ms', 'total', 'calendar')
+
+###############################################################################
+###############################################################################
+    def __init__(self, week, ms):
+        # keep ms within the week
+        if not 0 <= ms < WEEK_MS:
+            extra, ms = divmod(ms, WEEK_MS)
+            week += extra
+        self.week = week
+        self.ms = ms
+        self.total = week * WEEK_MS + ms	# ms since the GPS epoch
+        self.calendar = None		# (datetime, time_list), when needed
+
+###############################################################################
+# FromSeconds -- GpsTime from week and tow in (possibly fractional) seconds
+###############################################################################
+    @classmethod
+    def FromSeconds(cls, week, tow):
+        return cls(week, int(round(tow * 1000)))
+
+###############################################################################
+# FromCalendar -- GpsTime from a (GPS time) calendar date and time of day
+###############################################################################
+    @classmethod
+    def FromCalendar(cls, year, month, day, hour=0, minute=0, second=0):
+        days = datetime.date(year, month, day).toordinal() - \
+            GPS_EPOCH.toordinal()
+        return cls(0, days * 86400000 + (hour * 60 + minute) * 60000 +
+                   int(round(second * 1000)))
+
+###############################################################################
+# comparison and hashing go by total alone
+###############################################################################
+    def __eq__(self, other):
+        if not isinstance(other, GpsTime):
+            return NotImplemented
+        return self.total == other.total
+
+    def __ne__(self, other):
+        if not isinstance(other, GpsTime):
+            return NotImplemented
+        return self.total != other.total
+
+    def __lt__(self, other):
+        return self.total < other.total
+
+    def __le__(self, other):
+        return self.total <= other.total
+
+    def __gt__(self, other):
+        return self.total > other.total
+
+    def __ge__(self, other):
+        return self.total >= other.total
+
+    def __hash__(self):
+        return hash(self.total)
+
+    def __repr__(self):
+        return "GpsTime({}, {})".format(self.week, self.ms)
+
+###############################################################################
+# tow -- seconds of week; an int unless there's a fraction
+###############################################################################
+    @property
+    def tow(self):
+        if self.ms % 1000:
+            return self.ms / 1000
+        return self.ms // 1000
+
+###############################################################################
+# Shift -- GpsTime ms milliseconds later (or earlier)
+###############################################################################
+    def Shift(self, ms):
+        return GpsTime(self.week, self.ms + ms)
+
+###############################################################################
+# datetime -- as a datetime, worked out the first time it's asked for
+###############################################################################
+    @property
+    def datetime(self):
+        return self.fields()[0]
+
+###############################################################################
+# time_list -- (sec,minute,hour,mday,mon,year,weeknum,yday) as strings,
+# the same as GPS_Time.time_list except that sec may have a fraction
+###############################################################################
+    @property
+    def time_list(self):
+        return self.fields()[1]
+
+###############################################################################
+# timestring -- return string in pretty date/time format
+###############################################################################
+    def timestring(self):
+        return self.datetime.strftime("%Y-%m-%d %H:%M:%S")
+
+###############################################################################
+# RINEX_fmt_obs -- return string in RINEX 2 format for the epoch line
+###############################################################################
+    def RINEX_fmt_obs(self):
+        t = self.datetime
+        return " {:2d} {:2d} {:2d} {:2d} {:2d}{:11.7f}".format(
+            t.year % 100, t.month, t.day, t.hour, t.minute,
+            t.second + t.microsecond / 1e6)
+
+###############################################################################
+# fields -- build the calendar fields and keep them
+###############################################################################
+    def fields(self):
+        if self.calendar is None:
+            t = GPS_EPOCH + datetime.timedelta(milliseconds=self.total)
+            sec = "{:02d}".format(t.second)
+            if t.microsecond:
+                sec += ".{:03d}".format(t.microsecond // 1000)
+            self.calendar = (t, [sec, "{:02d}".format(t.minute),
+                                 "{:02d}".format(t.hour),
+                                 "{:02d}".format(t.day),
+                                 "{:02d}".format(t.month), str(t.year),
+                                 str(t.isoweekday() % 7),
+                                 "{:03d}".format(t.timetuple().tm_yday)])
+        return self.calendar
+
+###############################################################################
+# gps_calendar -- calendar fields for arrays of week and ms of week, all at
+# once: returns arrays (year, mon, mday, hour, minute, sec), sec as a
+# float.  Uses NumPy datetime64 if we have it, otherwise GpsTime one by one
+# and returns lists.
+###############################################################################
+
+
+def gps_calendar(weeks, ms):
+    if numpy is not None:
+        total = numpy.asarray(weeks, numpy.int64) * WEEK_MS + \
+            numpy.asarray(ms, numpy.int64)
+        t = numpy.datetime64('1980-01-06', 'ms') + \
+            total.astype('timedelta64[ms]')
+        months = t.astype('datetime64[M]')
+        days = t.astype('datetime64[D]')
+        day_ms = (t - days).astype(numpy.int64)
+        return ((t.astype('datetime64[Y]').astype(numpy.int64) + 1970),
+                months.astype(numpy.int64) % 12 + 1,
+                (days - months).astype(numpy.int64) + 1,
+                day_ms // 3600000, day_ms // 60000 % 60,
+                day_ms % 60000 / 1000)
+
+    times = [GpsTime(week, m).datetime for week, m in zip(weeks, ms)]
+    return ([t.year for t in times], [t.month for t in times],
+            [t.day for t in times], [t.hour for t in times],
+            [t.minute for t in times],
+            [t.second + t.microsecond / 1e6 for t in times])
+
 ###############################################################################
 # NOT IN GPS_Time class
 ###############################################################################
@@ -137,4 +309,30 @@ def current_gps_time():
         datetime.timedelta(seconds=leapseconds)
     return gps_time
 
+###############################################################################
+# clock_gps_week -- GPS week according to the system clock
+###############################################################################
+
+
+def clock_gps_week():
+    return (current_gps_time() - GPS_EPOCH).days // 7
+
+###############################################################################
+# gps_week_near -- the GPS week in which tow (seconds into a week) falls
+# within half a week of utc (a datetime)
+###############################################################################
+
+
+def gps_week_near(tow, utc):
+    from ashglobal import AshtechGlobals
+    since = utc + datetime.timedelta(seconds=AshtechGlobals.LEAPSECONDS) - \
+        GPS_EPOCH
+    week = since.days // 7
+    offset = tow - (since.total_seconds() - week * 604800)
+    if offset > 302400:
+        week -= 1
+    elif offset < -302400:
+        week += 1
+    return week
+
 # end of ashtime.py
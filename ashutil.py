@@ -23,8 +23,67 @@
 #import time
 #import serial
 #import io
+import sys
 import struct
 import math
+from array import array
+
+# NumPy is optional; only verify_chksums() uses it
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+###############################################################################
+# Checksums.  MBN uses a one byte XOR of the payload; the other binary
+# messages use the sum of the payload as big-endian unsigned shorts.  These
+# run on every frame, so they stay out of Python-level loops over bytes:
+# the XOR folds the payload as one big integer, and the sum goes through an
+# array of shorts.  verify_chksums() checks a whole run of same-sized
+# frames at once, with NumPy if it's there.
+###############################################################################
+
+BIG_ENDIAN_HOST = sys.byteorder == 'big'
+
+# (shift, mask) steps to fold an n byte integer down to one byte, by n
+xor_folds = {}
+
+###############################################################################
+# xor_checksum -- XOR of all the bytes in payload
+###############################################################################
+
+
+def xor_checksum(payload):
+    steps = xor_folds.get(len(payload))
+    if steps is None:
+        steps = []
+        size = len(payload)
+        while size > 1:
+            half = (size + 1) // 2
+            steps.append((8 * half, (1 << (8 * half)) - 1))
+            size = half
+        xor_folds[len(payload)] = steps
+    value = int.from_bytes(payload, 'big')
+    for shift, mask in steps:
+        value = (value >> shift) ^ (value & mask)
+    return value
+
+###############################################################################
+# word_checksum -- sum of payload as big-endian unsigned shorts, modulo
+# 65536; an odd byte at the end is added on its own
+###############################################################################
+
+
+def word_checksum(payload):
+    odd = 0
+    if len(payload) % 2:
+        odd = payload[-1]
+        payload = payload[:-1]
+    words = array('H')
+    words.frombytes(payload)
+    if not BIG_ENDIAN_HOST:
+        words.byteswap()
+    return (sum(words) + odd) & 0xffff
 
 ###############################################################################
 # verify_chksum -- generate checksum from payload and compare to one or two
@@ -36,49 +95,47 @@ import math
 def verify_chksum(payload, chksum_rcvd):
     # single byte checksum is simple XOR
     if len(chksum_rcvd) == 1:
-        chksum_rcvd = chksum_rcvd[0]
-        chksum = 0
-        for c in payload:
-            chksum = chksum ^ c
+        return xor_checksum(payload) == chksum_rcvd[0]
 
     # two-byte checksum is sum of payload unpacked as unsigned shorts
-    # remember to change from big-endian
-    else:
-        try:
-            chksum_rcvd, = struct.unpack('> H', chksum_rcvd)
-        except:
-            print("Couldn't read checksum!")
-            return False
-        size = len(payload)
-        words = int(size / 2)
-        odd = None
-        if size % 2 == 0:                       # length is even
-            fmt = '> ' + str(words) + 'H'
-            try:
-                shorts = struct.unpack(fmt, payload)
-            except:
-                print("Couldn't read checksum!")
-                return False
-        else:                                   # length is odd
-            fmt = '>' + str(words) + 'H B'      # get odd byte too
-            try:
-                (shorts, odd) = struct.unpack(fmt, payload)
-            except:
-                print("Couldn't read checksum!")
-                return False
-        chksum = 0
-        for i in range(0, words):
-            chksum = chksum + shorts[i]
-        if odd:
-            chksum = chksum + odd
-
-        while chksum > 65535:
-            chksum = chksum - 65536
-
-    if chksum == chksum_rcvd:
-        return True
-    else:
+    if len(chksum_rcvd) != 2:
+        print("Couldn't read checksum!")
         return False
+    return word_checksum(payload) == (chksum_rcvd[0] << 8 | chksum_rcvd[1])
+
+###############################################################################
+# verify_chksums -- check many frames at once.  data is the frames' payloads
+# (checksum included, as FrameDecoder returns them) end to end, each size
+# bytes long, with a checksum of chksum_len (1 or 2) bytes.  Returns a
+# sequence of True/False, one per frame: a NumPy array if we have NumPy.
+###############################################################################
+
+
+def verify_chksums(data, size, chksum_len):
+    count = len(data) // size
+    if numpy is None:
+        view = memoryview(data)
+        return [verify_chksum(view[i:i + size - chksum_len],
+                              view[i + size - chksum_len:i + size])
+                for i in range(0, count * size, size)]
+
+    frames = numpy.frombuffer(data, numpy.uint8, count * size)
+    frames = frames.reshape(count, size)
+    if chksum_len == 1:
+        # XOR over payload and checksum is zero for a good frame
+        return numpy.bitwise_xor.reduce(frames, axis=1) == 0
+
+    payload = frames[:, :size - chksum_len]
+    odd = None
+    if payload.shape[1] % 2:
+        odd = payload[:, -1]
+        payload = payload[:, :-1]
+    words = numpy.ascontiguousarray(payload).view('>u2')
+    sums = words.sum(axis=1, dtype=numpy.uint64)
+    if odd is not None:
+        sums += odd
+    received = frames[:, -2].astype(numpy.uint64) << 8 | frames[:, -1]
+    return (sums & 0xffff) == received
 
 ###############################################################################
 # fix_gps_week_rollover -- correct Wn by adding appropriate number of weeks
@@ -204,7 +261,7 @@ def fixphase(phase_in, lli):
     while phase >= 1.0E10:
         phase -= 1.0E10
         count += 1
-        lli | (1 << 0)		# set loss-of-lock bit
+        lli |= (1 << 0)		# set loss-of-lock bit
         if count >= 10:
             phase = 0.0
             break
@@ -213,7 +270,7 @@ def fixphase(phase_in, lli):
     while phase <= -1.0E10:
         phase += 1.0E10
         count += 1
-        lli | (1 << 0)		# set loss-of-lock bit
+        lli |= (1 << 0)		# set loss-of-lock bit
         if count >= 10:
             phase = 0.0
             break
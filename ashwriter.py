@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+
+################################  N8UR ASHCOMM  ################################
+#
+#	Copyright 2019 by John Ackermann, N8UR jra@febo.com https://febo.com
+#	Version number can be found in the ashglobal.py file
+#
+#	This program is free software; you can redistribute it and/or modify
+#	it under the terms of the GNU General Public License as published by
+#	the Free Software Foundation; either version 2 of the License, or
+#	(at your option) any later version.
+#
+#	This program is distributed in the hope that it will be useful,
+#	but WITHOUT ANY WARRANTY; without even the implied warranty of
+#	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#	GNU General Public License for more details.
+#	Software to communicate with Ashtech GPS receivers via serial port.
+################################################################################
+
+#############################   ashwriter.py    ################################
+
+import io
+import os
+import time
+
+from ashindex import *
+
+###############################################################################
+# A RinexWriter keeps one output file open for the whole session, behind a
+# buffer, instead of opening and closing it for every line.  What reaches
+# the disk when is set by the flush policy:
+#
+#	flush_secs = 0		flush to the OS after every epoch
+#	flush_secs = N		flush at most every N seconds
+#	fsync_epochs = N	also fsync every N epochs (0: never)
+#
+# Each epoch is handed over as one Write(), so a flush -- including the one
+# Close() does from the Ctrl-C handler -- never leaves half an epoch in the
+# file.  The writer counts the system calls it makes, for ashbench.py.
+#
+# With index set, Write() given an epoch's time also notes where the epoch
+# starts, and each flush appends those to the sidecar (see ashindex.py)
+# right after the data.
+###############################################################################
+
+
+class CountingFile(io.FileIO):
+    # raw file that counts its writes
+
+    def __init__(self, name, mode):
+        super().__init__(name, mode)
+        self.writes = 0
+
+    def write(self, data):
+        self.writes += 1
+        return super().write(data)
+
+
+class RinexWriter:
+    BUFFER = 65536		# bytes; a few minutes of 1 Hz epochs
+
+###############################################################################
+###############################################################################
+    def __init__(self, filename, mode='a', buffer_size=BUFFER, flush_secs=0,
+                 fsync_epochs=0, index=False):
+        self.filename = filename
+        self.raw = CountingFile(filename, mode)
+        self.file = io.BufferedWriter(self.raw, buffer_size)
+        self.position = self.raw.seek(0, os.SEEK_END)	# where Write() goes
+        self.index = IndexWriter(filename, 'a' in mode) if index else None
+        self.flush_secs = flush_secs
+        self.fsync_epochs = fsync_epochs
+        self.last_flush = time.monotonic()
+        self.epochs = 0
+        self.opens = 1
+        self.fsyncs = 0
+        self.closes = 0
+
+###############################################################################
+# Write -- add lines (each ending in a newline) to the buffer; time is the
+# GpsTime of the epoch they start with, for the index
+###############################################################################
+    def Write(self, lines, time=None):
+        self.WriteBytes(''.join(lines).encode('ascii', 'replace'), time)
+
+###############################################################################
+# WriteBytes -- Write() for text that's already bytes, like an epoch
+# record copied from another file
+###############################################################################
+    def WriteBytes(self, data, time=None):
+        if time is not None and self.index:
+            self.index.Add(time, self.position)
+        self.file.write(data)
+        self.position += len(data)
+
+###############################################################################
+# EndEpoch -- note that an epoch has been written and apply the flush policy
+###############################################################################
+    def EndEpoch(self):
+        self.epochs += 1
+        if self.fsync_epochs and self.epochs % self.fsync_epochs == 0:
+            self.Flush(fsync=True)
+        elif not self.flush_secs or \
+                time.monotonic() - self.last_flush >= self.flush_secs:
+            self.Flush()
+
+###############################################################################
+# Flush -- push the buffer to the OS and, with fsync, on to the disk
+###############################################################################
+    def Flush(self, fsync=False):
+        if self.file.closed:
+            return
+        self.file.flush()
+        if fsync:
+            os.fsync(self.raw.fileno())
+            self.fsyncs += 1
+        if self.index:
+            self.index.Flush(self.position, fsync)
+        self.last_flush = time.monotonic()
+
+###############################################################################
+# Close -- flush, fsync and close; harmless if already closed
+###############################################################################
+    def Close(self):
+        if self.file.closed:
+            return
+        self.Flush(fsync=True)
+        self.file.close()
+        self.closes += 1
+        if self.index:
+            self.index.Close(self.position)
+
+###############################################################################
+# closed -- True once Close() has been called
+###############################################################################
+    @property
+    def closed(self):
+        return self.file.closed
+
+###############################################################################
+# Syscalls -- open, write, fsync and close calls made so far
+###############################################################################
+    def Syscalls(self):
+        calls = self.opens + self.raw.writes + self.fsyncs + self.closes
+        if self.index:
+            calls += self.index.writes
+        return calls
+
+# end of ashwriter.py
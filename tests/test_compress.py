@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+
+################################  N8UR ASHCOMM  ################################
+#
+#	Copyright 2019 by John Ackermann, N8UR jra@febo.com https://febo.com
+#	Version number can be found in the ashglobal.py file
+#
+#	This program is free software; you can redistribute it and/or modify
+#	it under the terms of the GNU General Public License as published by
+#	the Free Software Foundation; either version 2 of the License, or
+#	(at your option) any later version.
+#
+#	This program is distributed in the hope that it will be useful,
+#	but WITHOUT ANY WARRANTY; without even the implied warranty of
+#	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#	GNU General Public License for more details.
+#	Software to communicate with Ashtech GPS receivers via serial port.
+################################################################################
+
+#############################   test_compress.py    ############################
+
+import os
+import sys
+import io
+import gzip
+import shutil
+import tempfile
+import unittest
+import contextlib
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ashtime import *
+from ashwriter import *
+from ashcompress import *
+
+###############################################################################
+# --compress leaves only the compressed obs file: the index sidecar, whose
+# offsets are into the uncompressed file, goes with the original
+###############################################################################
+
+
+class CompressTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.obs = os.path.join(self.dir, "TEST291a.26o")
+        writer = RinexWriter(self.obs, 'x', index=True)
+        writer.Write(["{:<60}{:<20}\n".format("", "END OF HEADER")])
+        for i in range(5):
+            time = GpsTime(2441, i * 1000)
+            writer.Write([time.RINEX_fmt_obs() + "  0  0\n"], time)
+            writer.EndEpoch()
+        writer.Close()
+        with open(self.obs, 'rb') as file:
+            self.text = file.read()
+        self.assertTrue(os.path.exists(index_name(self.obs)))
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def check(self):
+        self.assertEqual(os.listdir(self.dir), ["TEST291a.26o.gz"])
+        with gzip.open(self.obs + ".gz") as file:
+            self.assertEqual(file.read(), self.text)
+
+    def test_compress_file(self):
+        compress_file(self.obs, 'gz')
+        self.check()
+
+    def test_compressor(self):
+        compressor = Compressor('gz')
+        compressor.Submit(self.obs)
+        compressor.Finish()
+        self.assertEqual(compressor.files, 1)
+        self.check()
+
+    def test_late_submit(self):
+        compressor = Compressor('gz')
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            compressor.Finish(86400 / 2)
+            compressor.Submit(self.obs)
+            compressor.Submit(self.obs)		# gone now
+        self.check()
+        self.assertIn("Compressed {} after Finish()".format(self.obs),
+                      out.getvalue())
+        self.assertIn("per day of data", out.getvalue())
+        self.assertIn("Couldn't compress " + self.obs, out.getvalue())
+
+    def test_no_index(self):
+        os.remove(index_name(self.obs))
+        compress_file(self.obs, 'gz')
+        self.check()
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+# end of test_compress.py
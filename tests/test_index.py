@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+
+################################  N8UR ASHCOMM  ################################
+#
+#	Copyright 2019 by John Ackermann, N8UR jra@febo.com https://febo.com
+#	Version number can be found in the ashglobal.py file
+#
+#	This program is free software; you can redistribute it and/or modify
+#	it under the terms of the GNU General Public License as published by
+#	the Free Software Foundation; either version 2 of the License, or
+#	(at your option) any later version.
+#
+#	This program is distributed in the hope that it will be useful,
+#	but WITHOUT ANY WARRANTY; without even the implied warranty of
+#	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#	GNU General Public License for more details.
+#	Software to communicate with Ashtech GPS receivers via serial port.
+################################################################################
+
+#############################   test_index.py    ###############################
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ashtime import *
+from ashwriter import *
+from ashindex import *
+from ashbench import write_obs_file
+
+###############################################################################
+# A sidecar left by an older obs file of the same name -- one that was
+# compressed away, say -- mustn't be trusted for the new one
+###############################################################################
+
+
+class StaleIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.obs = os.path.join(self.dir, "TEST291a.26o")
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def stale(self):
+        # the index of a longer file, then a new, shorter file by its name
+        write_obs_file(self.obs, 100, 10)
+        build_index(self.obs)
+        write_obs_file(self.obs, 20, 8)
+
+    def test_size_recorded(self):
+        writer = RinexWriter(self.obs, 'x', index=True)
+        for i in range(5):
+            time = GpsTime(2441, i * 1000)
+            writer.Write([time.RINEX_fmt_obs() + "  0  0\n"], time)
+            writer.EndEpoch()
+        writer.Close()
+        with open(index_name(self.obs), 'rb') as file:
+            data = file.read()
+        self.assertTrue(sidecar_matches(data, os.path.getsize(self.obs)))
+        self.assertEqual(SIZE.unpack_from(data, len(MAGIC))[0],
+                         os.path.getsize(self.obs))
+        self.assertEqual(len(read_index(self.obs)[0]), 5)
+
+    def test_stale_ignored(self):
+        self.stale()
+        self.assertEqual(len(read_index(self.obs)[0]), 0)
+        obs = ObsFile(self.obs)
+        try:
+            self.assertIsNone(find_offset(obs, GpsTime(2441, 10000)))
+        finally:
+            obs.Close()
+
+    def test_stale_rebuilt(self):
+        self.stale()
+        obs = ObsFile(self.obs)
+        try:
+            index = ObsIndex(obs)
+            scanned = [epoch.offset for epoch in obs if epoch.sats]
+            self.assertEqual((index.loaded, index.scanned), (0, 20))
+            self.assertEqual(list(index.offsets), scanned)
+            self.assertEqual(list(read_index(self.obs)[1]), scanned)
+            self.assertEqual(find_offset(obs, GpsTime(2441, 10000)),
+                             scanned[10])
+        finally:
+            obs.Close()
+
+    def test_writer_removes_stale(self):
+        self.stale()
+        os.remove(self.obs)
+        writer = RinexWriter(self.obs, 'x', index=True)
+        self.assertFalse(os.path.exists(index_name(self.obs)))
+        writer.Close()
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+# end of test_index.py
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+
+################################  N8UR ASHCOMM  ################################
+#
+#	Copyright 2019 by John Ackermann, N8UR jra@febo.com https://febo.com
+#	Version number can be found in the ashglobal.py file
+#
+#	This program is free software; you can redistribute it and/or modify
+#	it under the terms of the GNU General Public License as published by
+#	the Free Software Foundation; either version 2 of the License, or
+#	(at your option) any later version.
+#
+#	This program is distributed in the hope that it will be useful,
+#	but WITHOUT ANY WARRANTY; without even the implied warranty of
+#	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#	GNU General Public License for more details.
+#	Software to communicate with Ashtech GPS receivers via serial port.
+################################################################################
+
+#############################   test_replay.py    ##############################
+
+import os
+import sys
+import glob
+import shutil
+import calendar
+import tempfile
+import subprocess
+import unittest
+
+TOP = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA = os.path.join(TOP, "tests", "data")
+
+###############################################################################
+# Replaying captures.  warm.cap was recorded from ashemu.py by a run that
+# found the receiver in its state file, so it never asked for the serial
+# number or the GPS week; the week has to come from the PBN time and the
+# capture's date.  warm_noted.cap is the same, from a session that notes
+# what it knows in the capture.
+###############################################################################
+
+
+class ReplayTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def replay(self, name, captured):
+        capture = os.path.join(self.dir, name)
+        shutil.copy(os.path.join(DATA, name), capture)
+        when = calendar.timegm(captured)
+        os.utime(capture, (when, when))
+        result = subprocess.run(
+            [sys.executable, os.path.join(TOP, "ashreplay.py"),
+             "--capture", capture, "--site_name", "TEST", "--msg_rate", "1",
+             "--state_dir", ""],
+            cwd=self.dir, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+            universal_newlines=True)
+        self.assertEqual(result.returncode, 0, result.stdout)
+        # the startup replies are in the capture, but aren't news
+        self.assertNotIn("is unknown", result.stdout)
+        obs, = glob.glob(os.path.join(self.dir, "*.26o"))
+        with open(obs) as file:
+            return result.stdout, file.read()
+
+    def test_warm_start(self):
+        output, rinex = self.replay("warm.cap", (2026, 10, 18, 20, 4, 12))
+        self.assertIn("using week 2441", output)
+        self.assertIn("ZR520021234         UZ 12/-AEXMPRTUY-M- UC00/1C59",
+                      rinex)
+        self.assertIn("  2026    10    18    20    04   19.0000000     GPS",
+                      rinex)
+        self.assertEqual(rinex.count("\n 26 10 18 20 "), 12)
+
+    def test_warm_start_noted(self):
+        # recorded since the session notes the week; the date doesn't matter
+        output, rinex = self.replay("warm_noted.cap", (2030, 1, 1, 0, 0, 0))
+        self.assertNotIn("using week", output)
+        self.assertIn("  2026    10    18    20    06    5.0000000     GPS",
+                      rinex)
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+# end of test_replay.py
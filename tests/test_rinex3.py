@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+
+################################  N8UR ASHCOMM  ################################
+#
+#	Copyright 2019 by John Ackermann, N8UR jra@febo.com https://febo.com
+#	Version number can be found in the ashglobal.py file
+#
+#	This program is free software; you can redistribute it and/or modify
+#	it under the terms of the GNU General Public License as published by
+#	the Free Software Foundation; either version 2 of the License, or
+#	(at your option) any later version.
+#
+#	This program is distributed in the hope that it will be useful,
+#	but WITHOUT ANY WARRANTY; without even the implied warranty of
+#	MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#	GNU General Public License for more details.
+#	Software to communicate with Ashtech GPS receivers via serial port.
+################################################################################
+
+#############################   test_rinex3.py    ##############################
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ashglobal import *
+from ashepoch import *
+from ashrinex3 import *
+
+DATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+
+# prn: (range, phase, doppler, snr, lli, phase lli, sbyte) for each band
+SATS = {
+    1: {'ca': (20167026.334, 105978438.683, 756.479, 125.0, 0, 1, 3),
+        'l1': (20167026.334, 0.0, 0.0, 0.0, 0, 0, 3),
+        'l2': (20167026.334, 82580601.571, 589.465, 105.0, 0, 0, 2)},
+    4: {'ca': (25665330.704, 134872223.160, -1055.310, 140.0, 0, 0, 4),
+        'l1': (25665330.704, 0.0, 0.0, 0.0, 0, 0, 4),
+        'l2': (25665330.704, 105095238.826, -822.320, 120.0, 0, 0, 3)},
+    14: {'ca': (20014502.886, 105176922.553, -225.807, 190.0, 0, 0, 8),
+         'l1': (20014502.886, 0.0, 0.0, 0.0, 0, 0, 8),
+         'l2': (20014502.886, 0.0, -175.953, 170.0, 0, 0, 6)},
+}
+
+###############################################################################
+# One epoch of Rinex3 output against a hand-written RINEX 3.04 record
+# (tests/data/epoch304*.rnx): the "> " epoch line and one line per
+# satellite, in OBS_TYPES_3 order
+###############################################################################
+
+
+class Rinex3EpochTest(unittest.TestCase):
+
+    def rinex(self, blank_missing):
+        g = AshtechGlobals()
+        g.opts['blank_missing'] = blank_missing
+        epoch = Epoch()
+        epoch.time = GpsTime(2441, 66238500)	# 2026-10-18 18:23:58.5
+        for prn, bands in SATS.items():
+            epoch.Mark(prn)
+            for band, values in bands.items():
+                (getattr(epoch, band + '_range')[prn],
+                 getattr(epoch, band + '_phase')[prn],
+                 getattr(epoch, band + '_dopp')[prn],
+                 getattr(epoch, band + '_snr')[prn],
+                 getattr(epoch, band + '_lli')[prn],
+                 getattr(epoch, band + '_phase_lli')[prn],
+                 getattr(epoch, band + '_sbyte')[prn]) = values
+        g.epoch = epoch
+        rinex = Rinex3(None, g, False)
+        return rinex.obs_epoch_header() + "".join(rinex.obs_epoch(False))
+
+    def expected(self, name):
+        with open(os.path.join(DATA, name)) as file:
+            return file.read()
+
+    def test_epoch(self):
+        self.assertEqual(self.rinex(False), self.expected("epoch304.rnx"))
+
+    def test_epoch_blank_missing(self):
+        self.assertEqual(self.rinex(True),
+                         self.expected("epoch304_blank.rnx"))
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+# end of test_rinex3.py